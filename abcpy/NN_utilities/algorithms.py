@@ -3,12 +3,12 @@ try:
     import torch.nn as nn
     import torch.optim as optim
     from torch.optim import lr_scheduler
-    from torch.utils.data import Dataset
+    from torch.utils.data import BatchSampler, Dataset, RandomSampler
     from abcpy.NN_utilities.datasets import Similarities, SiameseSimilarities, TripletSimilarities, \
         ParameterSimulationPairs
     from abcpy.NN_utilities.losses import ContrastiveLoss, TripletLoss
     from abcpy.NN_utilities.networks import SiameseNet, TripletNet
-    from abcpy.NN_utilities.trainer import fit
+    from abcpy.NN_utilities.trainer import fit, InMemoryLoader
 except ImportError:
     has_torch = False
 else:
@@ -18,7 +18,7 @@ else:
 def contrastive_training(samples, similarity_set, embedding_net, cuda, batch_size=16, n_epochs=200,
                          positive_weight=None, load_all_data_GPU=False, margin=1., lr=None, optimizer=None,
                          scheduler=None, start_epoch=0, verbose=False, optimizer_kwargs={}, scheduler_kwargs={},
-                         loader_kwargs={}):
+                         loader_kwargs={}, n_threads=None):
     """ Implements the algorithm for the contrastive distance learning training of a neural network; need to be
      provided with a set of samples and the corresponding similarity matrix"""
 
@@ -33,6 +33,9 @@ def contrastive_training(samples, similarity_set, embedding_net, cuda, batch_siz
     similarities_dataset = Similarities(samples, similarity_set, "cuda" if cuda and load_all_data_GPU else "cpu")
     pairs_dataset = SiameseSimilarities(similarities_dataset, positive_weight=positive_weight)
 
+    # unless the samples are loaded by worker processes, mini-batches are sliced directly from the samples in memory
+    in_memory = not loader_kwargs and (not cuda or load_all_data_GPU)
+
     if cuda:
         if load_all_data_GPU:
             loader_kwargs_2 = {'num_workers': 0, 'pin_memory': False}
@@ -41,10 +44,15 @@ def contrastive_training(samples, similarity_set, embedding_net, cuda, batch_siz
     else:
         loader_kwargs_2 = {}
 
-    loader_kwargs.update(loader_kwargs_2)
+    loader_kwargs = dict(loader_kwargs, **loader_kwargs_2)
 
-    pairs_train_loader = torch.utils.data.DataLoader(pairs_dataset, batch_size=batch_size, shuffle=True,
-                                                     **loader_kwargs)
+    if in_memory:
+        pairs_train_loader = InMemoryLoader(pairs_dataset, batch_size)
+    else:
+        # the dataset draws whole mini-batches of pairs, so automatic batching by the loader is disabled
+        batch_sampler = BatchSampler(RandomSampler(pairs_dataset), batch_size, drop_last=False)
+        pairs_train_loader = torch.utils.data.DataLoader(pairs_dataset, batch_size=None, sampler=batch_sampler,
+                                                         **loader_kwargs)
 
     model_contrastive = SiameseNet(embedding_net)
 
@@ -66,14 +74,15 @@ def contrastive_training(samples, similarity_set, embedding_net, cuda, batch_siz
         scheduler = scheduler(optimizer, **scheduler_kwargs)
 
     # now train:
-    fit(pairs_train_loader, model_contrastive, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=start_epoch)
+    fit(pairs_train_loader, model_contrastive, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=start_epoch,
+        n_threads=n_threads)
 
     return embedding_net
 
 
 def triplet_training(samples, similarity_set, embedding_net, cuda, batch_size=16, n_epochs=400,
                      load_all_data_GPU=False, margin=1., lr=None, optimizer=None, scheduler=None, start_epoch=0,
-                     verbose=False, optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={}):
+                     verbose=False, optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={}, n_threads=None):
     """ Implements the algorithm for the triplet distance learning training of a neural network; need to be
      provided with a set of samples and the corresponding similarity matrix"""
 
@@ -87,6 +96,9 @@ def triplet_training(samples, similarity_set, embedding_net, cuda, batch_size=16
     similarities_dataset = Similarities(samples, similarity_set, "cuda" if cuda and load_all_data_GPU else "cpu")
     triplets_dataset = TripletSimilarities(similarities_dataset)
 
+    # unless the samples are loaded by worker processes, mini-batches are sliced directly from the samples in memory
+    in_memory = not loader_kwargs and (not cuda or load_all_data_GPU)
+
     if cuda:
         if load_all_data_GPU:
             loader_kwargs_2 = {'num_workers': 0, 'pin_memory': False}
@@ -95,10 +107,15 @@ def triplet_training(samples, similarity_set, embedding_net, cuda, batch_size=16
     else:
         loader_kwargs_2 = {}
 
-    loader_kwargs.update(loader_kwargs_2)
+    loader_kwargs = dict(loader_kwargs, **loader_kwargs_2)
 
-    triplets_train_loader = torch.utils.data.DataLoader(triplets_dataset, batch_size=batch_size, shuffle=True,
-                                                        **loader_kwargs)
+    if in_memory:
+        triplets_train_loader = InMemoryLoader(triplets_dataset, batch_size)
+    else:
+        # the dataset draws whole mini-batches of triplets, so automatic batching by the loader is disabled
+        batch_sampler = BatchSampler(RandomSampler(triplets_dataset), batch_size, drop_last=False)
+        triplets_train_loader = torch.utils.data.DataLoader(triplets_dataset, batch_size=None, sampler=batch_sampler,
+                                                            **loader_kwargs)
 
     model_triplet = TripletNet(embedding_net)
 
@@ -120,14 +137,15 @@ def triplet_training(samples, similarity_set, embedding_net, cuda, batch_size=16
         scheduler = scheduler(optimizer, **scheduler_kwargs)
 
     # now train:
-    fit(triplets_train_loader, model_triplet, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=start_epoch)
+    fit(triplets_train_loader, model_triplet, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=start_epoch,
+        n_threads=n_threads)
 
     return embedding_net
 
 
 def FP_nn_training(samples, target, embedding_net, cuda, batch_size=1, n_epochs=50, load_all_data_GPU=False,
                    lr=1e-3, optimizer=None, scheduler=None, start_epoch=0, verbose=False, optimizer_kwargs={},
-                   scheduler_kwargs={}, loader_kwargs={}):
+                   scheduler_kwargs={}, loader_kwargs={}, n_threads=None):
     """ Implements the algorithm for the training of a neural network based on regressing the values of the parameters
     on the corresponding simulation outcomes; it is effectively a training with a mean squared error loss. Needs to be
     provided with a set of samples and the corresponding parameters that generated the samples. Note that in this case
@@ -142,6 +160,9 @@ def FP_nn_training(samples, target, embedding_net, cuda, batch_size=1, n_epochs=
 
     dataset_FP_nn = ParameterSimulationPairs(samples, target, "cuda" if cuda and load_all_data_GPU else "cpu")
 
+    # unless the samples are loaded by worker processes, mini-batches are sliced directly from the samples in memory
+    in_memory = not loader_kwargs and (not cuda or load_all_data_GPU)
+
     if cuda:
         if load_all_data_GPU:
             loader_kwargs_2 = {'num_workers': 0, 'pin_memory': False}
@@ -150,9 +171,13 @@ def FP_nn_training(samples, target, embedding_net, cuda, batch_size=1, n_epochs=
     else:
         loader_kwargs_2 = {}
 
-    loader_kwargs.update(loader_kwargs_2)
+    loader_kwargs = dict(loader_kwargs, **loader_kwargs_2)
 
-    data_loader_FP_nn = torch.utils.data.DataLoader(dataset_FP_nn, batch_size=batch_size, shuffle=True, **loader_kwargs)
+    if in_memory:
+        data_loader_FP_nn = InMemoryLoader(dataset_FP_nn, batch_size)
+    else:
+        data_loader_FP_nn = torch.utils.data.DataLoader(dataset_FP_nn, batch_size=batch_size, shuffle=True,
+                                                        **loader_kwargs)
 
     if cuda:
         embedding_net.cuda()
@@ -169,6 +194,7 @@ def FP_nn_training(samples, target, embedding_net, cuda, batch_size=1, n_epochs=
         scheduler = scheduler(optimizer, **scheduler_kwargs)
 
     # now train:
-    fit(data_loader_FP_nn, embedding_net, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=start_epoch)
+    fit(data_loader_FP_nn, embedding_net, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=start_epoch,
+        n_threads=n_threads)
 
     return embedding_net
@@ -2,6 +2,7 @@ import warnings
 
 import numpy as np
 import torch
+from scipy.sparse import csr_matrix, issparse
 from torch.utils.data import Dataset
 
 
@@ -9,26 +10,84 @@ from torch.utils.data import Dataset
 
 class Similarities(Dataset):
     """A dataset class that considers a set of samples and pairwise similarities defined between them.
-    Note that, for our application of computing distances, we are not interested in train/test split. """
+    Note that, for our application of computing distances, we are not interested in train/test split.
+
+    The similar samples of every sample are stored once as neighbour lists in CSR format, from which the datasets of
+    pairs and triplets draw whole mini-batches of samples."""
 
     def __init__(self, samples, similarity_matrix, device):
         """
         Parameters:
 
         samples: n_samples x n_features
-        similarity_matrix: n_samples x n_samples
+        similarity_matrix: n_samples x n_samples, numpy.ndarray, torch.Tensor or scipy.sparse matrix
         """
         if isinstance(samples, np.ndarray):
             self.samples = torch.from_numpy(samples.astype("float32")).to(device)
         else:
             self.samples = samples.to(device)
-        if isinstance(similarity_matrix, np.ndarray):
+        if issparse(similarity_matrix):
+            self.similarity_matrix = csr_matrix(similarity_matrix, dtype=bool)
+        elif isinstance(similarity_matrix, np.ndarray):
             self.similarity_matrix = torch.from_numpy(similarity_matrix.astype("int")).to(device)
         else:
             self.similarity_matrix = similarity_matrix.to(device)
+        self._build_neighbours()
+
+    def _build_neighbours(self):
+        """Stores the indices of the samples similar to sample i, itself excluded, in increasing order in
+        self.indices[self.indptr[i]:self.indptr[i + 1]]."""
+        if issparse(self.similarity_matrix):
+            similarity_matrix = self.similarity_matrix
+        else:
+            similarity_matrix = csr_matrix(self.similarity_matrix.cpu().numpy().astype(bool))
+        similarity_matrix.sort_indices()
+        rows, columns = similarity_matrix.nonzero()
+        different = rows != columns
+        rows, columns = rows[different], columns[different]
+
+        n_samples = self.__len__()
+        self.n_similar = np.bincount(rows, minlength=n_samples)
+        self.n_dissimilar = n_samples - 1 - self.n_similar
+        self.indptr = np.concatenate(([0], np.cumsum(self.n_similar)))
+        self.indices = columns.astype(np.int64)
+        # the pairs of similar samples as sorted keys, to look pairs up by binary search
+        self._keys = rows.astype(np.int64) * n_samples + self.indices
+
+    def is_similar(self, index, other_index):
+        """Returns whether the samples of the arrays index and other_index are similar, element-wise."""
+        keys = np.asarray(index, dtype=np.int64) * self.__len__() + other_index
+        positions = np.minimum(np.searchsorted(self._keys, keys), max(len(self._keys) - 1, 0))
+        return (self._keys[positions] == keys) if len(self._keys) > 0 else np.zeros(keys.shape, dtype=bool)
+
+    def sample_other(self, index):
+        """Draws for every sample of the array index another sample uniformly."""
+        return (index + np.random.randint(1, self.__len__(), size=len(index))) % self.__len__()
+
+    def sample_similar(self, index):
+        """Draws for every sample of the array index a similar sample uniformly; all the samples need to have similar
+        samples."""
+        offsets = np.floor(np.random.uniform(size=len(index)) * self.n_similar[index]).astype(np.int64)
+        return self.indices[self.indptr[index] + offsets]
+
+    def sample_dissimilar(self, index):
+        """Draws for every sample of the array index a dissimilar sample uniformly, by rejecting the similar ones; all
+        the samples need to have dissimilar samples."""
+        if np.any(self.n_dissimilar[index] == 0):
+            raise RuntimeError("Samples {} in the dataset have no dissimilar samples.".format(
+                np.asarray(index)[self.n_dissimilar[index] == 0].tolist()))
+        other_index = self.sample_other(index)
+        rejected = np.flatnonzero(self.is_similar(index, other_index))
+        while len(rejected) > 0:
+            other_index[rejected] = self.sample_other(index[rejected])
+            rejected = rejected[self.is_similar(index[rejected], other_index[rejected])]
+        return other_index
 
     def __getitem__(self, index):
         """Return the required sample along with the similarities of the sample with all the others."""
+        if issparse(self.similarity_matrix):
+            similarities = self.similarity_matrix[index].toarray().astype("int")
+            return self.samples[index], torch.from_numpy(similarities[0] if np.ndim(index) == 0 else similarities)
         return self.samples[index], self.similarity_matrix[index]
 
     def __len__(self):
@@ -38,7 +97,10 @@ class Similarities(Dataset):
 class SiameseSimilarities(Dataset):
     """
     This class defines a dataset returning pairs of similar and dissimilar examples. It has to be instantiated with a
-    dataset of the class Similarities
+    dataset of the class Similarities.
+
+    Indexing it with a list of indices returns a whole mini-batch of pairs; use it with a
+    torch.utils.data.BatchSampler and a DataLoader with batch_size=None.
     """
 
     def __init__(self, similarities_dataset, positive_weight=None):
@@ -52,35 +114,32 @@ class SiameseSimilarities(Dataset):
         self.similarity_matrix = similarities_dataset.similarity_matrix
 
     def __getitem__(self, index):
-        """If self.positive_weight is None, or if the sample denoted by index has no similar elements, choose another
+        """If self.positive_weight is None, or if the sample denoted by index has no similar or no dissimilar elements,
+        choose another
         random sample to build the pair. If instead self.positive_weight is a number, choose a similar element with
         that probability.
         """
-        if self.positive_weight is None or (torch.sum(self.similarity_matrix[index]) < 2):
-            # sample a new index different from the present one
-            siamese_index = index
-            while siamese_index == index:
-                siamese_index = np.random.choice(range(self.samples.shape[0]))
-
-            target = self.similarity_matrix[index, siamese_index]
-
-        else:
+        indices = np.atleast_1d(np.asarray(index, dtype=np.int64))
+        # samples without similar or without dissimilar elements are paired with a random sample
+        random_pair = np.ones(len(indices), dtype=bool) if self.positive_weight is None \
+            else (self.dataset.n_similar[indices] == 0) | (self.dataset.n_dissimilar[indices] == 0)
+        siamese_indices = np.empty_like(indices)
+        target = np.empty(len(indices), dtype=bool)
+
+        siamese_indices[random_pair] = self.dataset.sample_other(indices[random_pair])
+        target[random_pair] = self.dataset.is_similar(indices[random_pair], siamese_indices[random_pair])
+        if self.positive_weight is not None:
             # pick positive target with probability self.positive_weight
-            target = int(np.random.uniform() < self.positive_weight)
-            if target:
-                # sample a new index different from the present one
-                siamese_index = index
-                while siamese_index == index:
-                    siamese_index = np.random.choice(np.where(self.similarity_matrix[index].cpu())[0])
-            else:
-                # sample a new index different from the present one. This would not be necessary in theory,
-                # as a sample is always similar to itself.
-                # Leave this check anyway, to avoid problems in case the dataset is not perfectly defined.
-                siamese_index = index
-                while siamese_index == index:
-                    siamese_index = np.random.choice(np.where(self.similarity_matrix[index].cpu() == False)[0])
-
-        return (self.samples[index], self.samples[siamese_index]), target
+            target[~random_pair] = np.random.uniform(size=np.sum(~random_pair)) < self.positive_weight
+        positive = ~random_pair & target
+        negative = ~random_pair & ~target
+        siamese_indices[positive] = self.dataset.sample_similar(indices[positive])
+        siamese_indices[negative] = self.dataset.sample_dissimilar(indices[negative])
+
+        if np.ndim(index) == 0:
+            return (self.samples[index], self.samples[int(siamese_indices[0])]), int(target[0])
+        return (self.samples[torch.from_numpy(indices)], self.samples[torch.from_numpy(siamese_indices)]), \
+            torch.from_numpy(target.astype(np.int64))
 
     def __len__(self):
         return self.samples.shape[0]
@@ -90,6 +149,9 @@ class TripletSimilarities(Dataset):
     """
     This class defines a dataset returning triplets of anchor, positive and negative examples. 
     It has to be instantiated with a dataset of the class Similarities.
+
+    Indexing it with a list of indices returns a whole mini-batch of triplets; use it with a
+    torch.utils.data.BatchSampler and a DataLoader with batch_size=None.
     """
 
     def __init__(self, similarities_dataset, ):
@@ -98,33 +160,33 @@ class TripletSimilarities(Dataset):
         self.similarity_matrix = similarities_dataset.similarity_matrix
 
     def __getitem__(self, index):
-        # sample a new index different from the present one
-        if torch.sum(self.similarity_matrix[index]) < 2:
-            # then we pick a new sample that has at least one similar example
-            warnings.warn("Sample {} in the dataset has no similar samples. \nIncrease the quantile defining the"
-                          " similarity matrix to avoid such problems.\nExecution will continue taking another sample "
-                          "instead of that as anchor.".format(index), RuntimeWarning)
-            new_anchor = index
-            while new_anchor == index:
-                new_anchor = np.random.randint(0, self.dataset.__len__())
-                # if this other sample does not have a similar one as well -> sample another one.
-                if torch.sum(self.similarity_matrix[new_anchor]) < 2:
-                    new_anchor = index
-            index = new_anchor
-
-        positive_index = index
-        while positive_index == index:
-            # this loops indefinitely if some sample has no other similar samples!
-            positive_index = np.random.choice(np.where(self.similarity_matrix[index].cpu())[0])
-
-            # sample a new index different from the present one. This would not be necessary in theory,
-            # as a sample is always similar to itself.
-        # Leave this check anyway, to avoid problems in case the dataset is not perfectly defined.
-        negative_index = index
-        while negative_index == index:
-            negative_index = np.random.choice(np.where(self.similarity_matrix[index].cpu() == False)[0])
-
-        return (self.samples[index], self.samples[positive_index], self.samples[negative_index]), []
+        indices = np.atleast_1d(np.asarray(index, dtype=np.int64))
+        valid_anchor = (self.dataset.n_similar > 0) & (self.dataset.n_dissimilar > 0)
+        no_similar = self.dataset.n_similar[indices] == 0
+        if np.any(no_similar):
+            # then we pick new samples that have at least one similar example
+            warnings.warn("Samples {} in the dataset have no similar samples. \nIncrease the quantile defining the"
+                          " similarity matrix to avoid such problems.\nExecution will continue taking other samples "
+                          "instead of those as anchors.".format(indices[no_similar].tolist()), RuntimeWarning)
+        no_dissimilar = ~no_similar & (self.dataset.n_dissimilar[indices] == 0)
+        if np.any(no_dissimilar):
+            warnings.warn("Samples {} in the dataset have no dissimilar samples. \nDecrease the quantile defining the"
+                          " similarity matrix to avoid such problems.\nExecution will continue taking other samples "
+                          "instead of those as anchors.".format(indices[no_dissimilar].tolist()), RuntimeWarning)
+        invalid = ~valid_anchor[indices]
+        if np.any(invalid):
+            if not np.any(valid_anchor):
+                raise RuntimeError("No sample in the dataset has both similar and dissimilar samples.")
+            indices[invalid] = np.random.choice(np.flatnonzero(valid_anchor), np.sum(invalid))
+
+        positive_indices = self.dataset.sample_similar(indices)
+        negative_indices = self.dataset.sample_dissimilar(indices)
+
+        if np.ndim(index) == 0:
+            return (self.samples[int(indices[0])], self.samples[int(positive_indices[0])],
+                    self.samples[int(negative_indices[0])]), []
+        return (self.samples[torch.from_numpy(indices)], self.samples[torch.from_numpy(positive_indices)],
+                self.samples[torch.from_numpy(negative_indices)]), []
 
     def __len__(self):
         return self.samples.shape[0]
@@ -1,8 +1,31 @@
 from tqdm import tqdm
 import logging
 
+import torch
 
-def fit(train_loader, model, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=0):
+
+class InMemoryLoader(object):
+    """Iterates over the mini-batches of a dataset whose samples are all stored in memory. At every epoch, the indices
+    of the samples are shuffled and every mini-batch is obtained by indexing the dataset once with a slice of them,
+    instead of getting and collating the samples one by one as torch.utils.data.DataLoader does. The dataset therefore
+    needs to accept a tensor of indices in __getitem__."""
+
+    def __init__(self, dataset, batch_size, shuffle=True):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+
+    def __iter__(self):
+        n_samples = len(self.dataset)
+        indices = torch.randperm(n_samples) if self.shuffle else torch.arange(n_samples)
+        for start in range(0, n_samples, self.batch_size):
+            yield self.dataset[indices[start:start + self.batch_size]]
+
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+
+def fit(train_loader, model, loss_fn, optimizer, scheduler, n_epochs, cuda, start_epoch=0, n_threads=None):
     """
     Basic function to train a neural network given a train_loader, a loss function and an optimizer.
 
@@ -13,21 +36,30 @@ def fit(train_loader, model, loss_fn, optimizer, scheduler, n_epochs, cuda, star
     Examples: Classification: batch loader, classification model, NLL loss, accuracy metric
     Siamese network: Siamese loader, siamese model, contrastive loss
 
+    If n_threads is given, torch uses that number of threads on CPU during the training.
+
     Adapted from https://github.com/adambielski/siamese-triplet
     """
 
     logger = logging.getLogger("NN Trainer")
 
-    for epoch in range(0, start_epoch):
-        scheduler.step()
+    previous_n_threads = torch.get_num_threads()
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+
+    try:
+        for epoch in range(0, start_epoch):
+            scheduler.step()
 
-    for epoch in tqdm(range(start_epoch, n_epochs)):
-        scheduler.step()
+        for epoch in tqdm(range(start_epoch, n_epochs)):
+            scheduler.step()
 
-        # Train stage
-        train_loss = train_epoch(train_loader, model, loss_fn, optimizer, cuda)
+            # Train stage
+            train_loss = train_epoch(train_loader, model, loss_fn, optimizer, cuda)
 
-        logger.debug('Epoch: {}/{}. Train set: Average loss: {:.4f}'.format(epoch + 1, n_epochs, train_loss))
+            logger.debug('Epoch: {}/{}. Train set: Average loss: {:.4f}'.format(epoch + 1, n_epochs, train_loss))
+    finally:
+        torch.set_num_threads(previous_n_threads)
 
 
 def train_epoch(train_loader, model, loss_fn, optimizer, cuda):
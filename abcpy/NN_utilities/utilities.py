@@ -14,29 +14,72 @@ def dist2(x, y):
     return np.dot(x - y, x - y)
 
 
-def compute_similarity_matrix(target, quantile=0.1, return_pairwise_distances=False):
+def compute_similarity_matrix(target, quantile=0.1, return_pairwise_distances=False, block_size=1024, n_pairs=None,
+                              sparse=False, rng=np.random.RandomState()):
     """Compute the similarity matrix between some values given a given quantile of the Euclidean distances.
 
-    If return_pairwise_distances is True, it also returns a matrix with the pairwise distances with every distance."""
+    If return_pairwise_distances is True, it also returns a matrix with the pairwise distances with every distance.
+
+    The squared distances are computed for `block_size` rows at a time from the Gram matrix of the values. If `n_pairs`
+    is given, the quantile is estimated from the distances of `n_pairs` random pairs of different values, and the
+    matrix of pairwise distances is never stored unless return_pairwise_distances is True; otherwise, the quantile of
+    all the pairwise distances is used. If `sparse` is True, the similarity matrix is returned as a boolean
+    scipy.sparse.csr_matrix, which only stores the similar pairs."""
 
     logger = logging.getLogger("Compute_similarity_matrix")
 
     n_samples = target.shape[0]
-
-    pairwise_distances = np.zeros([n_samples] * 2)
-
-    for i in range(n_samples):
-        for j in range(n_samples):
-            pairwise_distances[i, j] = dist2(target[i], target[j])
-
-    q = np.quantile(pairwise_distances[~np.eye(n_samples, dtype=bool)].reshape(-1), quantile)
-
-    similarity_set = pairwise_distances < q
+    target = target.reshape(n_samples, -1).astype(float)
+    square_norms = np.einsum("ij,ij->i", target, target)
+
+    def pairwise_distances_block(start):
+        stop = min(start + block_size, n_samples)
+        block = square_norms[start:stop, None] + square_norms[None, :] - 2 * np.dot(target[start:stop], target.T)
+        np.maximum(block, 0, out=block)
+        block[np.arange(stop - start), np.arange(start, stop)] = 0
+        return block
+
+    pairwise_distances = None
+    if return_pairwise_distances or n_pairs is None:
+        pairwise_distances = np.empty([n_samples] * 2)
+        for start in range(0, n_samples, block_size):
+            pairwise_distances[start:start + block_size] = pairwise_distances_block(start)
+
+    if n_pairs is None:
+        q = np.quantile(pairwise_distances[~np.eye(n_samples, dtype=bool)].reshape(-1), quantile)
+    else:
+        # sample pairs of different values
+        first = rng.randint(0, n_samples, size=n_pairs)
+        second = (first + rng.randint(1, n_samples, size=n_pairs)) % n_samples
+        differences = target[first] - target[second]
+        q = np.quantile(np.einsum("ij,ij->i", differences, differences), quantile)
+
+    if sparse:
+        from scipy.sparse import csr_matrix
+        indices, indptr = [], [np.zeros(1, dtype=np.int64)]
+        for start in range(0, n_samples, block_size):
+            block = pairwise_distances[start:start + block_size] if pairwise_distances is not None \
+                else pairwise_distances_block(start)
+            rows, columns = np.nonzero(block < q)
+            indices.append(columns)
+            indptr.append(indptr[-1][-1] + np.cumsum(np.bincount(rows, minlength=block.shape[0])))
+        indices = np.concatenate(indices)
+        similarity_set = csr_matrix((np.ones(len(indices), dtype=bool), indices, np.concatenate(indptr)),
+                                    shape=(n_samples, n_samples))
+        n_similar = similarity_set.nnz
+    else:
+        if pairwise_distances is not None:
+            similarity_set = pairwise_distances < q
+        else:
+            similarity_set = np.empty([n_samples] * 2, dtype=bool)
+            for start in range(0, n_samples, block_size):
+                similarity_set[start:start + block_size] = pairwise_distances_block(start) < q
+        n_similar = np.sum(similarity_set)
 
     logger.info("Fraction of similar pairs (epurated by self-similarity): {}".format(
-        (np.sum(similarity_set) - n_samples) / n_samples ** 2))
+        (n_similar - n_samples) / n_samples ** 2))
 
-    if (np.sum(similarity_set) - n_samples) / n_samples ** 2 == 0:
+    if (n_similar - n_samples) / n_samples ** 2 == 0:
         raise RuntimeError("The chosen quantile is too small, as there are no similar samples according to the "
                            "corresponding threshold.\nPlease increase the quantile.")
 
@@ -1,5 +1,8 @@
+import pickle
 from abc import ABCMeta, abstractmethod
 
+from abcpy.utils import run_accounted
+
 class Backend(metaclass = ABCMeta):
     """
     This is the base class for every parallelization backend. It essentially
@@ -227,6 +230,81 @@ class BDSDummy(BDS):
         return self.object
 
 
+class BackendProfiled(Backend):
+    """
+    A backend recording the time spent in the calls of another backend, the number of tasks parallelized and the
+    number of bytes broadcasted in an abcpy.utils.Profiler. It is set up by InferenceMethod.set_profiler; all other
+    attributes are the ones of the wrapped backend.
+
+    If the profiler accounts for the time of the workers, the mapped functions return the accounting of every task
+    (see abcpy.utils.run_accounted) together with its result, which collect adds to the profiler before returning the
+    results alone.
+
+    Parameters
+    ----------
+    backend: abcpy.backends.Backend
+        The backend performing the operations.
+    profiler: abcpy.utils.Profiler
+        The profiler recording the times and counters.
+    """
+
+    def __init__(self, backend, profiler):
+        self.backend = backend
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        if name in ('backend', 'profiler'):
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def parallelize(self, python_list):
+        self.profiler.count("tasks", len(python_list))
+        with self.profiler.phase("backend.parallelize"):
+            return self.backend.parallelize(python_list)
+
+    def broadcast(self, object):
+        try:
+            self.profiler.count("bytes_broadcast", len(pickle.dumps(object, -1)))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            pass
+        with self.profiler.phase("backend.broadcast"):
+            return self.backend.broadcast(object)
+
+    def map(self, func, pds):
+        with self.profiler.phase("backend.map"):
+            if not self.profiler.workers:
+                return self.backend.map(func, pds)
+            return PDSAccounted(self.backend.map(_AccountedTask(func), pds))
+
+    def collect(self, pds):
+        with self.profiler.phase("backend.collect"):
+            if not isinstance(pds, PDSAccounted):
+                return self.backend.collect(pds)
+            results_and_accountings = self.backend.collect(pds.pds)
+        self.profiler.add_worker_accounting([accounting for _, accounting in results_and_accountings])
+        return [result for result, _ in results_and_accountings]
+
+
+class PDSAccounted(PDS):
+    """
+    The data set returned by BackendProfiled.map when the workers account for their time: every element of the wrapped
+    data set is the result of a task together with its accounting.
+    """
+
+    def __init__(self, pds):
+        self.pds = pds
+
+
+class _AccountedTask(object):
+    """Function run on the workers by BackendProfiled.map, returning the accounting of the task with its result."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, element):
+        return run_accounted(self.func, element)
+
+
 class NestedParallelizationController():
     @abstractmethod
     def nested_execution(self):
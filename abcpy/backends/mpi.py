@@ -8,6 +8,7 @@ import logging
 from mpi4py import MPI
 
 from abcpy.backends import BDS, PDS, Backend, NestedParallelizationController
+from abcpy.utils import configure_process
 
 
 import abcpy.backends.mpimanager
@@ -428,6 +429,10 @@ class BackendMPIWorker(Backend):
 
     OP_PARALLELIZE, OP_MAP, OP_COLLECT, OP_BROADCAST, OP_DELETEPDS, OP_DELETEBDS, OP_FINISH = [1, 2, 3, 4, 5, 6, 7]
 
+    # the function of the current map, unpacked once for all its data items
+    _function_packed = None
+    _function = None
+
     def __init__(self):
         """ No parameter, just call worker_run """
         self.logger = logging.getLogger(__name__)
@@ -438,7 +443,11 @@ class BackendMPIWorker(Backend):
         Receives a serialized function unpack it and run it
         Passes the model communicator if ther is more than one process per model
         """
-        func = cloudpickle.loads(function_packed)
+        # the function, and the inference object it is bound to, is unpacked once for all the items of a map
+        if function_packed != self._function_packed:
+            self._function = cloudpickle.loads(function_packed)
+            self._function_packed = function_packed
+        func = self._function
         res = None
         try:
             if(self.mpimanager.get_model_size() > 1):
@@ -701,7 +710,7 @@ class BackendMPI(BackendMPIScheduler if abcpy.backends.mpimanager.get_mpi_manage
     and the teams.
     """
 
-    def __init__(self, scheduler_node_ranks=[0], process_per_model=1):
+    def __init__(self, scheduler_node_ranks=[0], process_per_model=1, n_threads=None, torch_device=None):
         """
         Parameters
         ----------
@@ -710,6 +719,14 @@ class BackendMPI(BackendMPIScheduler if abcpy.backends.mpimanager.get_mpi_manage
         
         process_per_model: Integer
             number of MPI processes to allocate to each model
+
+        n_threads: Integer, optional
+            number of threads used by Pytorch and by the BLAS libraries of numpy in every MPI process, e.g. 1 if every
+            core hosts a process; see abcpy.utils.configure_process. By default the numbers of threads are unchanged.
+
+        torch_device: string, optional
+            device the neural networks sent to the processes are loaded on, e.g. "cpu"; see
+            abcpy.utils.configure_process. By default the networks are loaded on the device they were on.
         """
         # get mpimanager instance from the mpimanager module (which has to be setup before calling the constructor)
         self.logger = logging.getLogger(__name__)
@@ -721,6 +738,9 @@ class BackendMPI(BackendMPIScheduler if abcpy.backends.mpimanager.get_mpi_manage
         #Set the global backend
         globals()['backend'] = self
 
+        #Configure the resources of the process before the teams start waiting for instructions
+        configure_process(n_threads, torch_device, worker=not self.mpimanager.is_scheduler())
+
         #Call the appropriate constructors and pass the required data
         super().__init__()
 
@@ -1,5 +1,6 @@
 
 from abcpy.backends import Backend, PDS, BDS
+from abcpy.utils import configure_process
 
 class BackendSpark(Backend):
     """
@@ -7,7 +8,7 @@ class BackendSpark(Backend):
     the required Spark functionality.
     """
     
-    def __init__(self, sparkContext, parallelism=4):
+    def __init__(self, sparkContext, parallelism=4, n_threads=None, torch_device=None):
         """
         Initialize the backend with an existing and configured SparkContext.
 
@@ -17,9 +18,18 @@ class BackendSpark(Backend):
             an existing and fully configured PySpark context
         parallelism: int
             defines on how many workers a distributed dataset can be distributed
+        n_threads: int, optional
+            number of threads used by Pytorch and by the BLAS libraries of numpy in every Python worker, e.g. 1 if
+            every core hosts a worker; see abcpy.utils.configure_process. By default the numbers of threads are
+            unchanged.
+        torch_device: string, optional
+            device the neural networks sent to the workers are loaded on, e.g. "cpu"; see
+            abcpy.utils.configure_process. By default the networks are loaded on the device they were on.
         """
         self.sc = sparkContext
         self.parallelism = parallelism
+        self.n_threads = n_threads
+        self.torch_device = torch_device
 
 
     def parallelize(self, python_list):
@@ -77,7 +87,7 @@ class BackendSpark(Backend):
             a new parallel data set that contains the result of the map
         """
         
-        rdd = pds.rdd.map(func)
+        rdd = pds.rdd.map(_ConfiguredTask(func, self.n_threads, self.torch_device))
         new_pds = PDSSpark(rdd)
         return new_pds
 
@@ -101,6 +111,20 @@ class BackendSpark(Backend):
 
     
     
+class _ConfiguredTask(object):
+    """Function run on the Spark workers, configuring the resources of the worker process before running func (see
+    abcpy.utils.configure_process); the thread limits are only applied by the first task of every process."""
+
+    def __init__(self, func, n_threads, torch_device):
+        self.func = func
+        self.n_threads = n_threads
+        self.torch_device = torch_device
+
+    def __call__(self, element):
+        configure_process(self.n_threads, self.torch_device, worker=True)
+        return self.func(element)
+
+
 class PDSSpark(PDS):
     """
     This is a wrapper for Apache Spark RDDs.
@@ -5,6 +5,8 @@ from glmnet import LogitNet
 from sklearn import linear_model
 from scipy import stats
 
+from abcpy.utils import accounted, worker_phase
+
 
 class Distance(metaclass = ABCMeta):
     """This abstract base class defines how the distance between the observed and
@@ -98,10 +100,23 @@ class Distance(metaclass = ABCMeta):
             The summary statistics extracted from d1 and d2.
 
         """
-        s1 = self.statistics_calc.statistics(d1)
-        s2 = self.statistics_calc.statistics(d2)
+        with worker_phase("statistics"):
+            s1 = self.statistics_calc.statistics(d1)
+            s2 = self.statistics_calc.statistics(d2)
         return (s1,s2)
 
+    def set_statistics(self, statistics_calc):
+        """Replaces the statistics calculator, e.g. with statistics learned again during the inference. The
+        statistics of the observed data set cached by the distance are computed again with the new calculator.
+
+        Parameters
+        ----------
+        statistics_calc : abcpy.stasistics.Statistics
+            Statistics extractor object that conforms to the Statistics class.
+        """
+        self.statistics_calc = statistics_calc
+        self.s1 = None
+
 
 class Euclidean(Distance):
     """
@@ -119,6 +134,7 @@ class Euclidean(Distance):
         self.data_set = None
         self.dataSame = False
         
+    @accounted("distance")
     def distance(self, d1, d2):
         """Calculates the distance between two datasets.
 
@@ -142,10 +158,12 @@ class Euclidean(Distance):
 
         # Extract summary statistics from the dataset
         if(self.s1 is None or self.dataSame is False):
-            self.s1 = self.statistics_calc.statistics(d1)
+            with worker_phase("statistics"):
+                self.s1 = self.statistics_calc.statistics(d1)
             self.data_set = d1
 
-        s2 = self.statistics_calc.statistics(d2)
+        with worker_phase("statistics"):
+            s2 = self.statistics_calc.statistics(d2)
 
         # compute distance between the statistics
         dist = np.zeros(shape=(self.s1.shape[0],s2.shape[0]))
@@ -189,6 +207,7 @@ class PenLogReg(Distance):
         self.data_set = None
         self.dataSame = False
         
+    @accounted("distance")
     def distance(self, d1, d2):
         """Calculates the distance between two datasets.
 
@@ -211,9 +230,11 @@ class PenLogReg(Distance):
 
         # Extract summary statistics from the dataset
         if(self.s1 is None or self.dataSame is False):
-            self.s1 = self.statistics_calc.statistics(d1)
+            with worker_phase("statistics"):
+                self.s1 = self.statistics_calc.statistics(d1)
             self.data_set = d1
-        s2 = self.statistics_calc.statistics(d2)
+        with worker_phase("statistics"):
+            s2 = self.statistics_calc.statistics(d2)
 
         # compute distnace between the statistics 
         training_set_features = np.concatenate((self.s1, s2), axis=0)
@@ -248,6 +269,7 @@ class LogReg(Distance):
         self.data_set = None
         self.dataSame = False
         
+    @accounted("distance")
     def distance(self, d1, d2):
         """Calculates the distance between two datasets.
 
@@ -272,9 +294,11 @@ class LogReg(Distance):
 
         # Extract summary statistics from the dataset
         if(self.s1 is None or self.dataSame is False):
-            self.s1 = self.statistics_calc.statistics(d1)
+            with worker_phase("statistics"):
+                self.s1 = self.statistics_calc.statistics(d1)
             self.data_set = d1
-        s2 = self.statistics_calc.statistics(d2)
+        with worker_phase("statistics"):
+            s2 = self.statistics_calc.statistics(d2)
         
         # compute distance between the statistics
         training_set_features = np.concatenate((self.s1, s2), axis=0)
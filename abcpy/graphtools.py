@@ -1,10 +1,15 @@
 import numpy as np
 from abcpy.probabilisticmodels import Hyperparameter, ModelResultingFromOperation
+from abcpy.utils import accounted, worker_phase
 
 
 class GraphTools():
     """This class implements all methods that will be called recursively on the graph structure."""
 
+    # Optional abcpy.utils.SimulationCache used by simulate
+    simulation_cache = None
+
+    @accounted("graph")
     def sample_from_prior(self, model=None, rng=np.random.RandomState()):
         """
         Samples values for all random variables of the model.
@@ -85,6 +90,7 @@ class GraphTools():
             model.visited = False
             model.calculated_pdf = None
 
+    @accounted("prior_pdf")
     def pdf_of_prior(self, models, parameters, mapping=None, is_root=True):
         """
         Calculates the joint probability density function of the prior of the specified models at the given parameter values.
@@ -238,15 +244,22 @@ class GraphTools():
         """
         mapping = self._get_mapping()[0]
 
+        # the columns of every model in the accepted parameters are looked up with a single depth-first search, instead
+        # of one search per model as in get_accepted_parameters_bds_values
+        accepted_mapping = self.accepted_parameters_manager.get_mapping(self.accepted_parameters_manager.model)[0]
+        accepted_parameters = self.accepted_parameters_manager.accepted_parameters_bds.value()
+
         return_value = []
 
         for model, index in mapping:
-
-            return_value.append((model.name, self.accepted_parameters_manager.get_accepted_parameters_bds_values([model])))
+            columns = [accepted_index for accepted_model, accepted_index in accepted_mapping if accepted_model == model]
+            return_value.append((model.name, [[parameters[column] for column in columns]
+                                              for parameters in accepted_parameters]))
 
         return return_value
 
 
+    @accounted("graph")
     def get_parameters(self, models=None, is_root=True):
         """
         Returns the current values of all free parameters in the model. Commonly used before perturbing the parameters
@@ -291,6 +304,7 @@ class GraphTools():
         return parameters
 
 
+    @accounted("graph")
     def set_parameters(self, parameters, models=None, index=0, is_root=True):
         """
         Sets new values for the currently used values of each random variable.
@@ -344,6 +358,7 @@ class GraphTools():
 
         return [True, index]
 
+    @accounted("graph")
     def get_correct_ordering(self, parameters_and_models, models=None, is_root = True):
         """
         Orders the parameters returned by a kernel in the order required by the graph.
@@ -392,7 +407,9 @@ class GraphTools():
         return ordered_parameters
 
     def simulate(self, n_samples_per_param, rng=np.random.RandomState(), npc=None):
-        """Simulates data of each model using the currently sampled or perturbed parameters.
+        """Simulates data of each model using the currently sampled or perturbed parameters. If a simulation_cache is
+        set, simulations already performed with the same input values (and random number generator state, for
+        stochastic models) are reused.
 
         Parameters
         ----------
@@ -404,15 +421,27 @@ class GraphTools():
         list
             Each entry corresponds to the simulated data of one model.
         """
+        cache_key = None
+        if self.simulation_cache is not None:
+            cache_key = self.simulation_cache.key(self.model, n_samples_per_param, rng)
+            if cache_key is not None:
+                result = self.simulation_cache.get(cache_key, rng)
+                if result is not None:
+                    return result
+
         result = []
         for model in self.model:
             parameters_compatible = model._check_input(model.get_input_values())
             if parameters_compatible:
-                if npc is not None and npc.communicator().Get_size() > 1:
-                    simulation_result = npc.run_nested(model.forward_simulate, model.get_input_values(), n_samples_per_param, rng=rng)
-                else:
-                    simulation_result = model.forward_simulate(model.get_input_values(),n_samples_per_param, rng=rng)
+                with worker_phase("simulate"):
+                    if npc is not None and npc.communicator().Get_size() > 1:
+                        simulation_result = npc.run_nested(model.forward_simulate, model.get_input_values(), n_samples_per_param, rng=rng)
+                    else:
+                        simulation_result = model.forward_simulate(model.get_input_values(),n_samples_per_param, rng=rng)
                 result.append(simulation_result)
             else:
                 return None
+
+        if cache_key is not None:
+            self.simulation_cache.put(cache_key, result, rng)
         return result
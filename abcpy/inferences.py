@@ -1,6 +1,7 @@
-import copy
 import logging
 import numpy as np
+import os
+import pickle
 import time
 import sys
 
@@ -11,10 +12,15 @@ from abcpy.acceptedparametersmanager import *
 from abcpy.graphtools import GraphTools
 from abcpy.jointapprox_lhd import ProductCombination
 from abcpy.jointdistances import LinearCombination
-from abcpy.output import Journal
+from abcpy.output import Journal, _replace_file
 from abcpy.perturbationkernel import DefaultKernel
 from abcpy.probabilisticmodels import *
-from abcpy.utils import cached
+from abcpy.referencetable import reference_table_fingerprint
+from abcpy.backends import BackendProfiled
+from abcpy.utils import cached, _NO_PHASE
+
+
+_CHECKPOINT = "checkpoint.npz"
 
 
 class InferenceMethod(GraphTools, metaclass = ABCMeta):
@@ -23,14 +29,480 @@ class InferenceMethod(GraphTools, metaclass = ABCMeta):
 
     """
 
+    # Simulation and wall-clock budget shared by all inference schemes, see set_budget()
+    max_simulations = None
+    max_time = None
+    max_simulations_per_particle = None
+
+    _particle_simulation_cap = None
+    _simulation_deadline = None
+    _budget_start_time = None
+    _budget_start_simulations = 0
+    _budget_stop_reason = None
+
+    # Directory the output journal is streamed to, see stream_journal()
+    journal_path = None
+    journal_fsync = True
+
+    # Directory the state of the algorithm is saved to after every generation, see set_checkpoint()
+    checkpoint_path = None
+    checkpoint_fsync = True
+    _checkpoint = None
+
+    # Online diagnostics of every generation, see set_diagnostics()
+    diagnostics = True
+    diagnostics_quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+    # Timers and counters of the phases of every generation, see set_profiler()
+    profiler = None
+    _profile_simulations = 0
+
+    # Statistics refitted on the simulations of every generation, see set_statistics_learning()
+    statistics_learning = None
+    statistics_learning_kwargs = {}
+    _refits_statistics = False
+    _return_simulations = False
+
     def __getstate__(self):
         """Cloudpickle is used with the MPIBackend. This function ensures that the backend itself
         is not pickled
         """
         state = self.__dict__.copy()
         del state['backend']
+        # the workers do not profile the phases of the scheduler, nor refit the statistics
+        state.pop('profiler', None)
+        state.pop('statistics_learning', None)
         return state
 
+    def stream_journal(self, path, fsync=True):
+        """
+        Makes the subsequent calls of sample() write their output journal to disk in the columnar format, appending
+        every generation as soon as it is complete instead of keeping the full history in memory. If the run is
+        interrupted, the journal of the generations completed so far is read with Journal.fromFile(path), and can be
+        passed as journal_file to continue the run.
+
+        Parameters
+        ----------
+        path: string
+            Directory the journal is written to. Passing None stops streaming.
+        fsync: boolean, optional
+            Whether the files are synced to the disk after every generation. The default value is True.
+        """
+        self.journal_path = path
+        self.journal_fsync = fsync
+
+    def set_checkpoint(self, path, fsync=True):
+        """
+        Makes the subsequent calls of sample() save the complete state of the algorithm to disk at the end of every
+        generation but the last: the random number generator, the accepted population and all the quantities carried over to the
+        next generation (e.g. the thresholds), the number of simulations and the journal. Arrays are stored in their
+        binary format, in a single file which is atomically replaced at every generation.
+
+        If a run is interrupted, calling sample() again with the same arguments on an inference object set to the same
+        checkpoint directory continues from the last saved generation, and returns the same journal as an
+        uninterrupted run. The checkpoint is removed once sample() completes.
+
+        Unless a directory is given with stream_journal(), the journal is streamed to the subdirectory `journal` of
+        the checkpoint directory.
+
+        Parameters
+        ----------
+        path: string
+            Directory the checkpoint is written to; it is created if it does not exist. Passing None stops
+            checkpointing.
+        fsync: boolean, optional
+            Whether the checkpoint and the journal are synced to the disk after every generation. The default value is
+            True.
+        """
+        self.checkpoint_path = path
+        self.checkpoint_fsync = fsync
+
+    def _create_journal(self, full_output, journal_file=None):
+        """
+        Creates the output journal, or reads it from journal_file to continue a previous run, and streams it to disk
+        if requested with stream_journal(). If a checkpoint is found (see set_checkpoint()), the journal is instead
+        the one saved with the checkpoint.
+        """
+        journal_path = self.journal_path
+        journal_fsync = self.journal_fsync
+        if journal_path is None and self.checkpoint_path is not None:
+            journal_path = os.path.join(self.checkpoint_path, "journal")
+            journal_fsync = self.checkpoint_fsync
+
+        self._checkpoint = self._read_checkpoint()
+        if self._checkpoint is not None:
+            # generations added after the checkpoint was saved are discarded, as they are computed again
+            journal = Journal.fromFile(journal_path)
+            journal._truncate(self._checkpoint["journal"])
+        elif journal_file is None:
+            journal = Journal(full_output)
+        else:
+            journal = Journal.fromFile(journal_file)
+
+        if journal_path is not None:
+            journal.stream_to(journal_path, fsync=journal_fsync)
+        return journal
+
+    def _read_checkpoint(self):
+        """Reads the checkpoint saved by an interrupted run, if any."""
+        if self.checkpoint_path is None:
+            return None
+        filename = os.path.join(self.checkpoint_path, _CHECKPOINT)
+        if not os.path.exists(filename):
+            return None
+
+        with np.load(filename) as arrays:
+            checkpoint = pickle.loads(arrays["_objects"].tobytes())
+            for name in arrays.files:
+                if name != "_objects":
+                    checkpoint["state"][name] = arrays[name]
+        if checkpoint["method"] != type(self).__name__:
+            raise ValueError("The checkpoint in {} was saved by {}.".format(self.checkpoint_path, checkpoint["method"]))
+        return checkpoint
+
+    def _restore_checkpoint(self):
+        """
+        Restores the random number generator, the number of simulations and the broadcasted population saved in the
+        checkpoint read by _create_journal().
+
+        Returns
+        -------
+        tuple
+            The generation to continue from and the dictionary of the quantities saved by the inference scheme, or
+            (0, None) if there is no checkpoint.
+        """
+        checkpoint, self._checkpoint = self._checkpoint, None
+        if checkpoint is None:
+            return 0, None
+
+        state = checkpoint["state"]
+        rng_state = checkpoint["rng_state"]
+        self.rng.set_state(rng_state[:1] + (state.pop("rng_keys"),) + rng_state[1:])
+        self.simulation_counter = checkpoint["simulation_counter"]
+        self._budget_start_simulations = checkpoint["budget_start_simulations"]
+        self._profile_simulations = self.simulation_counter
+
+        # the values broadcasted at the end of the saved generation are broadcasted again
+        broadcasts = checkpoint["broadcasts"]
+        self.accepted_parameters_manager.update_broadcast(
+            self.backend, accepted_parameters=broadcasts.get("accepted_parameters"),
+            accepted_weights=broadcasts.get("accepted_weights"), accepted_cov_mats=broadcasts.get("accepted_cov_mats"))
+        if "kernel_parameters" in broadcasts:
+            self.accepted_parameters_manager.update_kernel_values(self.backend, broadcasts["kernel_parameters"])
+        self.logger.info("Continuing from the checkpoint of step {}".format(checkpoint["step"]))
+        return checkpoint["step"] + 1, state
+
+    def _save_checkpoint(self, step, journal, **state):
+        """
+        Saves the state of the algorithm at the end of a generation, if requested with set_checkpoint(). Numerical
+        arrays are stored as such, all other quantities are pickled.
+
+        Parameters
+        ----------
+        step: integer
+            The generation that was completed.
+        journal: abcpy.output.Journal
+            The output journal, which is streamed to disk.
+        state:
+            The quantities carried over to the next generation.
+        """
+        if self.checkpoint_path is None:
+            return
+        journal.flush()
+
+        rng_state = self.rng.get_state()
+        objects = {"method": type(self).__name__, "step": step, "rng_state": rng_state[:1] + rng_state[2:],
+                   "simulation_counter": self.simulation_counter,
+                   "budget_start_simulations": self._budget_start_simulations,
+                   "journal": journal._generation_counts(), "state": {}, "broadcasts": {}}
+        for name in ("accepted_parameters", "accepted_weights", "accepted_cov_mats", "kernel_parameters"):
+            bds = getattr(self.accepted_parameters_manager, name + "_bds")
+            if bds is not None:
+                objects["broadcasts"][name] = bds.value()
+        arrays = {"rng_keys": rng_state[1]}
+        for name, value in state.items():
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                arrays[name] = value
+            else:
+                objects["state"][name] = value
+        arrays["_objects"] = np.frombuffer(pickle.dumps(objects, -1), dtype=np.uint8)
+
+        os.makedirs(self.checkpoint_path, exist_ok=True)
+        _replace_file(os.path.join(self.checkpoint_path, _CHECKPOINT), lambda f: np.savez(f, **arrays),
+                      self.checkpoint_fsync)
+
+    def _remove_checkpoint(self):
+        """Removes the checkpoint once sample() completes, such that the next call starts a new run."""
+        if self.checkpoint_path is not None and os.path.exists(os.path.join(self.checkpoint_path, _CHECKPOINT)):
+            os.remove(os.path.join(self.checkpoint_path, _CHECKPOINT))
+
+    def set_diagnostics(self, enabled=True, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        Configures the diagnostics computed on every new population by PMCABC, SABC, SMCABC, APMCABC and RSMCABC:
+        the effective sample size, and the weighted mean, variance and quantiles of every parameter. They are logged,
+        and recorded in the journal where they can be accessed with Journal.get_diagnostics(). Their cost is linear
+        in the number of particles and parameters.
+
+        Parameters
+        ----------
+        enabled: boolean, optional
+            Whether the diagnostics are computed. The default value is True.
+        quantiles: list, optional
+            Levels of the weighted quantiles, between 0 and 1. The default value is (0.05, 0.25, 0.5, 0.75, 0.95).
+        """
+        self.diagnostics = enabled
+        self.diagnostics_quantiles = tuple(quantiles)
+
+    def _add_diagnostics_to_journal(self, journal, aStep, accepted_parameters, accepted_weights):
+        """
+        Computes the diagnostics of a new population (see set_diagnostics), logs them and adds them to the journal.
+
+        Parameters
+        ----------
+        journal: abcpy.output.Journal
+            The output journal.
+        aStep: integer
+            The generation of the population.
+        accepted_parameters: list
+            The parameters of the particles, in the order of the accepted parameters manager.
+        accepted_weights: numpy.ndarray
+            The weights of the particles, or None if they are all equal.
+        """
+        if not self.diagnostics:
+            return
+
+        with self._phase("diagnostics"):
+            mapping, _ = self.accepted_parameters_manager.get_mapping(self.accepted_parameters_manager.model)
+            names = [model.name for model, index in sorted(mapping, key=lambda model_and_index: model_and_index[1])]
+            try:
+                parameters = np.array([np.concatenate([np.ravel(value) for value in particle])
+                                       for particle in accepted_parameters], dtype=float)
+            except (TypeError, ValueError):
+                self.logger.debug("Diagnostics are only computed for numerical parameters")
+                return
+            widths = [np.size(value) for value in accepted_parameters[0]]
+
+            if accepted_weights is None:
+                weights = np.ones(len(parameters))
+            else:
+                weights = np.asarray(accepted_weights, dtype=float).reshape(-1)
+            weights = weights / np.sum(weights)
+
+            mean = weights.dot(parameters)
+            var = weights.dot((parameters - mean) ** 2)
+
+            # weighted quantiles of all columns at once, by inverting the weighted empirical distribution functions
+            order = np.argsort(parameters, axis=0)
+            cumulative_weights = np.cumsum(weights[order], axis=0)
+            levels = np.asarray(self.diagnostics_quantiles, dtype=float)
+            rows = np.minimum((cumulative_weights[:, :, None] < levels * cumulative_weights[-1][:, None]).sum(axis=0),
+                              len(parameters) - 1)
+            quantiles = np.take_along_axis(parameters, np.take_along_axis(order, rows.T, axis=0), axis=0)
+
+            diagnostics = {"step": aStep, "ess": 1.0 / np.sum(weights ** 2), "quantile_levels": levels,
+                           "mean": {}, "var": {}, "quantiles": {}}
+            stops = np.cumsum(widths)
+            for name, start, stop in zip(names, stops - widths, stops):
+                diagnostics["mean"][name] = mean[start:stop]
+                diagnostics["var"][name] = var[start:stop]
+                diagnostics["quantiles"][name] = quantiles[:, start:stop]
+
+            self.logger.info("step {}: effective sample size {:.1f}, mean {}".format(
+                aStep, diagnostics["ess"], ", ".join("{}={}".format(name, np.round(value, 4))
+                                                     for name, value in diagnostics["mean"].items())))
+            journal.add_diagnostics(diagnostics)
+
+    def set_profiler(self, profiler):
+        """
+        Makes the subsequent calls of sample() time the phases of every generation (e.g. broadcasting, simulating,
+        computing the weights and the covariance matrices) and the calls to the backend, and count the simulations,
+        the tasks sent to the workers and the bytes broadcasted. The profile of every generation is stored in the
+        journal, see Journal.get_profile, and passed to the callback of the profiler.
+
+        Parameters
+        ----------
+        profiler: abcpy.utils.Profiler
+            The profiler collecting the times and counters. Passing None stops profiling.
+        """
+        if isinstance(self.backend, BackendProfiled):
+            self.backend = self.backend.backend
+        self.profiler = profiler
+        if profiler is not None:
+            self.backend = BackendProfiled(self.backend, profiler)
+
+    def _phase(self, name):
+        """Returns a context manager timing a phase of the current generation, if a profiler is set."""
+        if self.profiler is None:
+            return _NO_PHASE
+        return self.profiler.phase(name)
+
+    def _add_profile_to_journal(self, journal, aStep):
+        """Ends the profile of a generation, if a profiler is set, and adds it to the journal."""
+        if self.profiler is None:
+            return
+        self.profiler.count("simulations", self.simulation_counter - self._profile_simulations)
+        self._profile_simulations = self.simulation_counter
+        journal.add_profile(self.profiler.end_generation(aStep))
+
+    def set_statistics_learning(self, statistics_learning, **refit_kwargs):
+        """
+        Makes the subsequent calls of sample() refit the statistics learned by statistics_learning on the particles
+        and the data simulated with them at the end of every generation but the last, and use the refitted statistics
+        in the distance from the next generation on. As the population concentrates where the posterior mass lies,
+        the statistics learned from the prior predictive distribution are improved where they matter, which
+        increases the acceptance rate of the later generations. Neural networks are trained again starting from
+        their current weights. The distance uses the statistics of statistics_learning from the first generation on.
+
+        The distances computed with different statistics are not comparable: the threshold of the generation
+        following a refit is computed from the distances of the population under the refitted statistics, and the
+        thresholds given to sample() for the later generations are not used. The refitted statistics are not saved
+        with the checkpoint (see set_checkpoint()). This is supported by PMCABC and SMCABC with a single root model.
+
+        Parameters
+        ----------
+        statistics_learning: abcpy.statisticslearning.StatisticsLearning
+            The statistics learning technique, whose statistics calculator is applied to the simulated data before the
+            learned transformation. Passing None stops refitting the statistics.
+        refit_kwargs:
+            additional keyword arguments passed to statistics_learning.refit(), e.g. n_epochs for the techniques
+            based on neural networks.
+        """
+        if statistics_learning is not None:
+            if not self._refits_statistics:
+                raise NotImplementedError("{} does not support refitting the statistics.".format(type(self).__name__))
+            if len(self.model) != 1:
+                raise ValueError("Refitting the statistics is supported with a single root model only.")
+            self._set_statistics(statistics_learning.get_statistics())
+        self.statistics_learning = statistics_learning
+        self.statistics_learning_kwargs = refit_kwargs
+
+    def _set_statistics(self, statistics_calc):
+        """Replaces the statistics calculator of the distances of all the root models."""
+        for distance in self.distance.distances:
+            distance.set_statistics(statistics_calc)
+
+    def _refit_statistics(self, parameters, simulations):
+        """
+        Refits the statistics on the parameters of a population and the data simulated with them (see
+        set_statistics_learning()), and uses the refitted statistics in the distance.
+
+        Parameters
+        ----------
+        parameters: list
+            The parameters of the particles.
+        simulations: list
+            The data simulated with every parameter, as returned by simulate().
+        """
+        self.logger.info("Refitting the statistics on {} simulations".format(len(simulations)))
+        self.statistics_learning.refit(parameters, [y_sim[0] for y_sim in simulations],
+                                       **self.statistics_learning_kwargs)
+        self._set_statistics(self.statistics_learning.get_statistics())
+
+    def set_budget(self, max_simulations=None, max_time=None, max_simulations_per_particle=None):
+        """
+        Limits the computational effort of the subsequent calls of sample(). The budget is checked by the workers
+        inside their rejection loops and by the scheduler after every generation. When it is exhausted the sampler
+        stops and returns the last complete population, with the number of simulations actually performed recorded
+        in the journal.
+
+        Parameters
+        ----------
+        max_simulations: integer, optional
+            Maximum number of simulations performed by one call of sample(). The part of the budget still available
+            at the start of a generation is split evenly between the particles of that generation. The default value
+            is None, meaning no limit.
+        max_time: float, optional
+            Maximum wall-clock time in seconds spent in one call of sample(). The default value is None, meaning no
+            limit.
+        max_simulations_per_particle: integer, optional
+            Maximum number of simulations a single particle may use in a rejection loop. If the threshold is not
+            reached within this number of simulations, the closest draw is returned instead. The default value is
+            None, meaning no limit.
+        """
+        self.max_simulations = max_simulations
+        self.max_time = max_time
+        self.max_simulations_per_particle = max_simulations_per_particle
+
+    def _start_budget(self):
+        """Resets the budget and profiling bookkeeping at the beginning of sample()."""
+        self._budget_start_time = time.time()
+        self._budget_start_simulations = self.simulation_counter
+        self._profile_simulations = self.simulation_counter
+        if self.profiler is not None:
+            self.profiler.reset()
+        self._budget_stop_reason = None
+        self._particle_simulation_cap = self.max_simulations_per_particle
+        if self.max_time is None:
+            self._simulation_deadline = None
+        else:
+            self._simulation_deadline = self._budget_start_time + self.max_time
+
+    def _update_particle_budget(self, n_tasks):
+        """
+        Computes the maximum number of simulations each of the n_tasks particles of the next map step may use. As the
+        inference object is shipped to the workers with the mapped function, the cap travels with it.
+
+        Parameters
+        ----------
+        n_tasks: integer
+            Number of particles sampled in the next map step.
+        """
+        cap = self.max_simulations_per_particle
+        if self.max_simulations is not None:
+            remaining = self.max_simulations - (self.simulation_counter - self._budget_start_simulations)
+            share = max(1, int(np.ceil(remaining / n_tasks)))
+            cap = share if cap is None else min(cap, share)
+        self._particle_simulation_cap = cap
+
+    def _particle_budget_reached(self, counter):
+        """
+        Checked by the workers inside the rejection loops. At least one simulation is always performed.
+
+        Parameters
+        ----------
+        counter: integer
+            Number of simulations already performed for the current particle.
+
+        Returns
+        -------
+        boolean
+            Whether the particle should stop simulating.
+        """
+        if counter == 0:
+            return False
+        if self._particle_simulation_cap is not None and counter >= self._particle_simulation_cap:
+            return True
+        if self._simulation_deadline is not None and time.time() >= self._simulation_deadline:
+            return True
+        return False
+
+    def _budget_exhausted(self):
+        """
+        Checked by the scheduler after every generation.
+
+        Returns
+        -------
+        boolean
+            Whether the global simulation or time budget is used up.
+        """
+        if self.max_simulations is not None and \
+                self.simulation_counter - self._budget_start_simulations >= self.max_simulations:
+            self._budget_stop_reason = "max_simulations"
+        elif self.max_time is not None and time.time() - self._budget_start_time >= self.max_time:
+            self._budget_stop_reason = "max_time"
+
+        if self._budget_stop_reason is not None:
+            self.logger.info("Stopping as the {} budget is exhausted".format(self._budget_stop_reason))
+            return True
+        return False
+
+    def _add_budget_to_journal(self, journal):
+        """Stores the budget and the reason for stopping early, if any, in the journal configuration."""
+        journal.configuration["max_simulations"] = self.max_simulations
+        journal.configuration["max_time"] = self.max_time
+        journal.configuration["max_simulations_per_particle"] = self.max_simulations_per_particle
+        journal.configuration["stop_reason"] = self._budget_stop_reason
+
     @abstractmethod
     def sample(self):
         """To be overwritten by any sub-class:
@@ -170,6 +642,10 @@ class RejectionABC(InferenceMethod):
 
     backend = None
 
+    reference_table = None
+    # number of rows of the reference table scored by one task
+    reference_table_chunk_size = 1000
+
     def __init__(self, root_models, distances, backend, seed=None):
         self.model = root_models
         # We define the joint Linear combination distance using all the distances for each individual models
@@ -184,11 +660,15 @@ class RejectionABC(InferenceMethod):
         # counts the number of simulate calls
         self.simulation_counter = 0
 
-    def sample(self, observations, n_samples, n_samples_per_param, epsilon, full_output=0):
+    def sample(self, observations, n_samples, n_samples_per_param, epsilon, full_output=0, reference_table=None):
         """
         Samples from the posterior distribution of the model parameter given the observed
         data observations.
 
+        If a reference table is provided, the simulations it contains are reused: the parameters whose stored data
+        set is within epsilon of the observations are accepted, and the table is extended with new simulations from
+        the prior until n_samples parameters are accepted.
+
         Parameters
         ----------
         observations: list
@@ -202,6 +682,9 @@ class RejectionABC(InferenceMethod):
         full_output: integer, optional
             If full_output==1, intermediate results are included in output journal.
             The default value is 0, meaning the intermediate results are not saved.
+        reference_table: abcpy.referencetable.ReferenceTable, optional
+            Table of simulations from the prior, storing the parameters and the simulated data sets, which is read
+            and extended by the sampler. The default value is None, meaning no simulations are reused.
 
         Returns
         -------
@@ -210,40 +693,52 @@ class RejectionABC(InferenceMethod):
         """
 
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
 
         self.n_samples = n_samples
         self.n_samples_per_param = n_samples_per_param
         self.epsilon = epsilon
+        self.reference_table = reference_table
 
-        journal = Journal(full_output)
+        journal = self._create_journal(full_output)
         journal.configuration["n_samples"] = self.n_samples
         journal.configuration["n_samples_per_param"] = self.n_samples_per_param
         journal.configuration["epsilon"] = self.epsilon
 
         accepted_parameters = None
 
-        # main Rejection ABC algorithm
-        seed_arr = self.rng.randint(1, n_samples * n_samples, size=n_samples, dtype=np.int32)
-        rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
-        rng_pds = self.backend.parallelize(rng_arr)
+        if reference_table is not None:
+            journal.configuration["reference_table"] = reference_table.path
+            accepted_parameters, distances = self._sample_from_reference_table()
+        else:
+            # main Rejection ABC algorithm
+            seed_arr = self.rng.randint(1, n_samples * n_samples, size=n_samples, dtype=np.int32)
+            rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
+            rng_pds = self.backend.parallelize(rng_arr)
 
-        accepted_parameters_distances_counter_pds = self.backend.map(self._sample_parameter, rng_pds)
-        accepted_parameters_distances_counter = self.backend.collect(accepted_parameters_distances_counter_pds)
-        accepted_parameters, distances, counter = [list(t) for t in zip(*accepted_parameters_distances_counter)]
+            self._update_particle_budget(n_samples)
+            accepted_parameters_distances_counter_pds = self.backend.map(self._sample_parameter, rng_pds)
+            accepted_parameters_distances_counter = self.backend.collect(accepted_parameters_distances_counter_pds)
+            accepted_parameters, distances, counter = [list(t) for t in zip(*accepted_parameters_distances_counter)]
 
-        for count in counter:
-            self.simulation_counter+=count
+            for count in counter:
+                self.simulation_counter+=count
 
         distances = np.array(distances)
 
         self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters)
-        journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-        journal.add_weights(copy.deepcopy(np.ones((n_samples, 1))))
-        journal.add_distances(copy.deepcopy(distances))
+        journal.add_accepted_parameters(accepted_parameters)
+        journal.add_weights(np.ones((n_samples, 1)))
+        journal.add_distances(distances)
         self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters)
         names_and_parameters = self._get_names_and_parameters()
         journal.add_user_parameters(names_and_parameters)
         journal.number_of_simulations.append(self.simulation_counter)
+        journal.flush()
+
+        self._budget_exhausted()
+        self._add_budget_to_journal(journal)
+        journal.flush()
 
         return journal
 
@@ -251,7 +746,8 @@ class RejectionABC(InferenceMethod):
         """
         Samples a single model parameter and simulates from it until
         distance between simulated outcome and the observation is
-        smaller than epsilon.
+        smaller than epsilon, or the simulation budget of the particle
+        is used up, in which case the closest draw is returned.
 
         Parameters
         ----------
@@ -269,8 +765,9 @@ class RejectionABC(InferenceMethod):
                              .format(float(self.epsilon), distance))
 
         counter = 0
+        best_theta, best_distance = None, None
 
-        while distance > self.epsilon:
+        while distance > self.epsilon and not self._particle_budget_reached(counter):
             # Accept new parameter value if the distance is less than epsilon
             self.sample_from_prior(rng=rng)
             theta = self.get_parameters(self.model)
@@ -282,11 +779,112 @@ class RejectionABC(InferenceMethod):
                     counter, distance))
             else:
                 distance = self.distance.dist_max()
+            if best_distance is None or distance < best_distance:
+                best_theta, best_distance = theta, distance
         self.logger.debug(
                 "Needed {:4d} simulations to reach distance {:e} < epsilon = {:e}".
-                format(counter, distance, float(self.epsilon))
+                format(counter, best_distance, float(self.epsilon))
                 )
-        return (theta, distance, counter)
+        return (best_theta, best_distance, counter)
+
+    def _sample_from_reference_table(self):
+        """
+        Accepts the rows of the reference table whose data set is within epsilon of the observations, appending new
+        simulations from the prior to the table until n_samples rows are accepted or the budget is exhausted. In the
+        latter case the closest rows make up for the missing ones.
+
+        Returns
+        -------
+        list
+            The accepted parameters and their distances.
+        """
+        table = self.reference_table
+        table.check_fingerprint(reference_table_fingerprint(self.model, n_samples_per_param=self.n_samples_per_param))
+
+        # score the rows already in the table
+        n_rows = len(table)
+        chunks = [(start, min(start + self.reference_table_chunk_size, n_rows))
+                  for start in range(0, n_rows, self.reference_table_chunk_size)]
+        distances = [np.zeros(0)]
+        if len(chunks) > 0:
+            distances_pds = self.backend.map(self._reference_table_distances, self.backend.parallelize(chunks))
+            distances += self.backend.collect(distances_pds)
+        distances = np.concatenate(distances)
+        self.logger.info("Reusing {} simulations of the reference table".format(n_rows))
+
+        n_accepted = np.sum(distances <= self.epsilon)
+        while n_accepted < self.n_samples and not self._budget_exhausted():
+            # simulate enough rows to reach n_samples at the acceptance rate observed so far, or double the table
+            # if no row was accepted yet
+            if n_accepted == 0:
+                n_new = max(len(distances), self.n_samples)
+            else:
+                n_new = int(np.ceil((self.n_samples - n_accepted) * len(distances) / n_accepted))
+            if self.max_simulations is not None:
+                n_new = min(n_new, self._budget_start_simulations + self.max_simulations - self.simulation_counter)
+
+            # the rows are reused across runs, so the seeds are drawn from the full range to avoid duplicated rows
+            seed_arr = self.rng.randint(1, np.iinfo(np.int32).max, size=n_new, dtype=np.int32)
+            rng_pds = self.backend.parallelize(np.array([np.random.RandomState(seed) for seed in seed_arr]))
+            rows = self.backend.collect(self.backend.map(self._simulate_reference_table_row, rng_pds))
+            parameters, data, new_distances = [list(t) for t in zip(*rows)]
+            self.simulation_counter += n_new
+
+            table.append(parameters=parameters, data=data)
+            distances = np.concatenate((distances, new_distances))
+            n_accepted = np.sum(distances <= self.epsilon)
+
+        accepted = np.flatnonzero(distances <= self.epsilon)[:self.n_samples]
+        if len(accepted) < self.n_samples:
+            rejected = np.flatnonzero(distances > self.epsilon)
+            closest = rejected[np.argsort(distances[rejected], kind='stable')]
+            accepted = np.concatenate((accepted, closest[:self.n_samples - len(accepted)]))
+
+        mapping, _ = self.accepted_parameters_manager.get_mapping(self.model)
+        split_points = np.cumsum([model.get_output_dimension() for model, _ in mapping])[:-1]
+        accepted_parameters = [np.split(np.array(table.parameters[index]), split_points) for index in accepted]
+        return accepted_parameters, list(distances[accepted])
+
+    def _reference_table_distances(self, rows):
+        """
+        Computes the distances between the observations and the data sets stored in a range of rows of the reference
+        table.
+
+        Parameters
+        ----------
+        rows: tuple
+            First and last (excluded) index of the rows.
+
+        Returns
+        -------
+        np.array
+            The distances of the rows.
+        """
+        data = self.reference_table.read('data', rows[1])[rows[0]:]
+        observations = self.accepted_parameters_manager.observations_bds.value()
+        return np.array([self.distance.distance(observations, [list(model_data) for model_data in row])
+                         for row in data])
+
+    def _simulate_reference_table_row(self, rng, npc=None):
+        """
+        Samples a parameter from the prior and simulates a data set from it, to be appended to the reference table.
+
+        Parameters
+        ----------
+        rng: random number generator
+            The random number generator to be used.
+
+        Returns
+        -------
+        tuple
+            The flattened parameter, the simulated data sets as an array and their distance from the observations.
+        """
+        self.sample_from_prior(rng=rng)
+        theta = self.get_parameters(self.model)
+        y_sim = self.simulate(self.n_samples_per_param, rng=rng, npc=npc)
+        distance = self.distance.distance(self.accepted_parameters_manager.observations_bds.value(), y_sim)
+        parameters = np.concatenate([np.ravel(value) for value in theta])
+        return parameters, np.array(y_sim, dtype=float), distance
 
 
 class PMCABC(BaseDiscrepancy, InferenceMethod):
@@ -326,6 +924,8 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
 
     backend = None
 
+    _refits_statistics = True
+
 
     def __init__(self, root_models, distances, backend, kernel=None, seed=None):
         self.model = root_models
@@ -384,11 +984,14 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
             A journal containing simulation results, metadata and optionally intermediate results.
         """
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
         self.n_samples = n_samples
         self.n_samples_per_param=n_samples_per_param
+        # the simulations of the particles are only sent back to refit the statistics
+        self._return_simulations = self.statistics_learning is not None
 
         if(journal_file is None):
-            journal = Journal(full_output)
+            journal = self._create_journal(full_output)
             journal.configuration["type_model"] = [type(model).__name__ for model in self.model]
             journal.configuration["type_dist_func"] = type(self.distance).__name__
             journal.configuration["n_samples"] = self.n_samples
@@ -396,7 +999,7 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
             journal.configuration["steps"] = steps
             journal.configuration["epsilon_percentile"] = epsilon_percentile
         else:
-            journal = Journal.fromFile(journal_file)
+            journal = self._create_journal(full_output, journal_file)
 
         accepted_parameters = None
         accepted_weights = None
@@ -412,9 +1015,14 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
             else:
                 raise ValueError("The length of epsilon_init can only be equal to 1 or steps.")
 
+        start_step, state = self._restore_checkpoint()
+        if state is not None:
+            accepted_parameters, accepted_weights = state["accepted_parameters"], state["accepted_weights"]
+            accepted_cov_mats, epsilon_arr = state["accepted_cov_mats"], state["epsilon_arr"]
+
         # main PMCABC algorithm
         self.logger.info("Starting PMC iterations")
-        for aStep in range(steps):
+        for aStep in range(start_step, steps):
             self.logger.debug("iteration {} of PMC algorithm".format(aStep))
             if(aStep==0 and journal_file is not None):
                 accepted_parameters = journal.get_accepted_parameters(-1)
@@ -442,80 +1050,110 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
             # 0: update remotely required variables
             #print("INFO: Broadcasting parameters.")
             self.logger.info("Broadcasting parameters")
-            self.epsilon = epsilon_arr[aStep]
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters, accepted_weights, accepted_cov_mats)
+            with self._phase("broadcast"):
+                self.epsilon = epsilon_arr[aStep]
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters, accepted_weights, accepted_cov_mats)
 
             # 1: calculate resample parameters
             #print("INFO: Resampling parameters")
             self.logger.info("Resamping parameters")
 
-            params_and_dists_and_counter_pds = self.backend.map(self._resample_parameter, rng_pds)
-            params_and_dists_and_counter = self.backend.collect(params_and_dists_and_counter_pds)
-            new_parameters, distances, counter = [list(t) for t in zip(*params_and_dists_and_counter)]
-            new_parameters = np.array(new_parameters)
-            distances = np.array(distances)
+            with self._phase("resample"):
+                self._update_particle_budget(n_samples)
+                params_and_dists_and_counter_pds = self.backend.map(self._resample_parameter, rng_pds)
+                params_and_dists_and_counter = self.backend.collect(params_and_dists_and_counter_pds)
+                new_parameters, distances, counter, simulations = [list(t) for t in zip(*params_and_dists_and_counter)]
+                new_parameters = np.array(new_parameters)
+                distances = np.array(distances)
 
             for count in counter:
                 self.simulation_counter+=count
 
+            # the next threshold is computed from the distances under the refitted statistics
+            threshold_distances = distances
+            if self.statistics_learning is not None and aStep < steps - 1:
+                with self._phase("statistics"):
+                    self._refit_statistics(new_parameters, simulations)
+                    threshold_distances = np.array([self.distance.distance(observations, y_sim)
+                                                    for y_sim in simulations])
+
             # Compute epsilon for next step
             # print("INFO: Calculating acceptance threshold (epsilon).")
             self.logger.info("Calculating acceptances threshold")
-            if aStep < steps - 1:
-                if epsilon_arr[aStep + 1] == None:
-                    epsilon_arr[aStep + 1] = np.percentile(distances, epsilon_percentile)
-                else:
-                    epsilon_arr[aStep + 1] = np.max(
-                        [np.percentile(distances, epsilon_percentile), epsilon_arr[aStep + 1]])
+            with self._phase("epsilon"):
+                if aStep < steps - 1:
+                    if epsilon_arr[aStep + 1] == None or self.statistics_learning is not None:
+                        epsilon_arr[aStep + 1] = np.percentile(threshold_distances, epsilon_percentile)
+                    else:
+                        epsilon_arr[aStep + 1] = np.max(
+                            [np.percentile(distances, epsilon_percentile), epsilon_arr[aStep + 1]])
 
             # 2: calculate weights for new parameters
             self.logger.info("Calculating weights")
 
-            new_parameters_pds = self.backend.parallelize(new_parameters)
-            self.logger.info("Calculate weights")
-            new_weights_pds = self.backend.map(self._calculate_weight, new_parameters_pds)
-            new_weights = np.array(self.backend.collect(new_weights_pds)).reshape(-1, 1)
-            sum_of_weights = 0.0
-            for w in new_weights:
-                sum_of_weights += w
-            new_weights = new_weights / sum_of_weights
-
-            # The calculation of cov_mats needs the new weights and new parameters
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters = new_parameters, accepted_weights=new_weights)
-
-            # The parameters relevant to each kernel have to be used to calculate n_sample times. It is therefore more efficient to broadcast these parameters once,
-            # instead of collecting them at each kernel in each step
-            kernel_parameters = []
-            for kernel in self.kernel.kernels:
-                kernel_parameters.append(
-                    self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
-            self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+            with self._phase("weights"):
+                new_parameters_pds = self.backend.parallelize(new_parameters)
+                self.logger.info("Calculate weights")
+                new_weights_pds = self.backend.map(self._calculate_weight, new_parameters_pds)
+                new_weights = np.array(self.backend.collect(new_weights_pds)).reshape(-1, 1)
+                sum_of_weights = 0.0
+                for w in new_weights:
+                    sum_of_weights += w
+                new_weights = new_weights / sum_of_weights
+
+            with self._phase("covariance"):
+                # The calculation of cov_mats needs the new weights and new parameters
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters = new_parameters, accepted_weights=new_weights)
+
+                # The parameters relevant to each kernel have to be used to calculate n_sample times. It is therefore more efficient to broadcast these parameters once,
+                # instead of collecting them at each kernel in each step
+                kernel_parameters = []
+                for kernel in self.kernel.kernels:
+                    kernel_parameters.append(
+                        self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
 
-            # 3: calculate covariance
-            self.logger.info("Calculating covariance matrix")
-            new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
-            # Since each entry of new_cov_mats is a numpy array, we can multiply like this
-            new_cov_mats = [covFactor*new_cov_mat for new_cov_mat in new_cov_mats]
+                # 3: calculate covariance
+                self.logger.info("Calculating covariance matrix")
+                new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                # Since each entry of new_cov_mats is a numpy array, we can multiply like this
+                new_cov_mats = [covFactor*new_cov_mat for new_cov_mat in new_cov_mats]
 
             # 4: Update the newly computed values
             accepted_parameters = new_parameters
             accepted_weights = new_weights
             accepted_cov_mats = new_cov_mats
+            self._add_diagnostics_to_journal(journal, aStep, accepted_parameters, accepted_weights)
 
             self.logger.info("Save configuration to output journal")
 
-            if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and aStep == steps - 1):
-                journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                journal.add_distances(copy.deepcopy(distances))
-                journal.add_weights(copy.deepcopy(accepted_weights))
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
-                                                                  accepted_weights=accepted_weights)
-                names_and_parameters = self._get_names_and_parameters()
-                journal.add_user_parameters(names_and_parameters)
-                journal.number_of_simulations.append(self.simulation_counter)
+            budget_exhausted = self._budget_exhausted()
+            with self._phase("journal"):
+                if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and (aStep == steps - 1 or budget_exhausted)):
+                    journal.add_accepted_parameters(accepted_parameters)
+                    journal.add_distances(distances)
+                    journal.add_weights(accepted_weights)
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
+                                                                      accepted_weights=accepted_weights)
+                    names_and_parameters = self._get_names_and_parameters()
+                    journal.add_user_parameters(names_and_parameters)
+                    journal.number_of_simulations.append(self.simulation_counter)
+                    journal.flush()
+            self._add_profile_to_journal(journal, aStep)
+
+            if budget_exhausted:
+                break
+
+            if aStep < steps - 1:
+                self._save_checkpoint(aStep, journal, accepted_parameters=accepted_parameters,
+                                      accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats,
+                                      epsilon_arr=epsilon_arr)
 
         # Add epsilon_arr to the journal
         journal.configuration["epsilon_arr"] = epsilon_arr
+        self._add_budget_to_journal(journal)
+        journal.flush()
+        self._remove_checkpoint()
 
         return journal
 
@@ -523,7 +1161,8 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
         """
         Samples a single model parameter and simulate from it until
         distance between simulated outcome and the observation is
-        smaller than epsilon.
+        smaller than epsilon, or the simulation budget of the particle
+        is used up, in which case the closest draw is returned.
 
         Parameters
         ----------
@@ -532,8 +1171,9 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
 
         Returns
         -------
-        np.array
-            accepted parameter
+        tuple
+            The accepted parameter, its distance, the number of simulations and, if the statistics are refitted (see
+            set_statistics_learning()), the data simulated with the accepted parameter, otherwise None.
         """
 
         #print(npc.communicator())
@@ -547,8 +1187,9 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
 
         theta = self.get_parameters()
         counter=0
+        best_theta, best_distance, best_y_sim = theta, distance, None
 
-        while distance > self.epsilon:
+        while distance > self.epsilon and not self._particle_budget_reached(counter):
             if self.accepted_parameters_manager.accepted_parameters_bds == None:
                 self.sample_from_prior(rng=rng)
                 theta = self.get_parameters()
@@ -568,16 +1209,20 @@ class PMCABC(BaseDiscrepancy, InferenceMethod):
                 counter+=1
 
             distance = self.distance.distance(self.accepted_parameters_manager.observations_bds.value(), y_sim)
+            if counter == 1 or distance < best_distance:
+                best_theta, best_distance = theta, distance
+                if self._return_simulations:
+                    best_y_sim = y_sim
 
             self.logger.debug("distance after {:4d} simulations: {:e}".format(
                      counter, distance))
 
         self.logger.debug(
                 "Needed {:4d} simulations to reach distance {:e} < epsilon = {:e}".
-                format(counter, distance, float(self.epsilon))
+                format(counter, best_distance, float(self.epsilon))
                 )
 
-        return (theta, distance, counter)
+        return (best_theta, best_distance, counter, best_y_sim)
 
     def _calculate_weight(self, theta, npc=None):
         """
@@ -714,11 +1359,12 @@ class PMC(BaseLikelihood, InferenceMethod):
         self.sample_from_prior(rng=self.rng)
 
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
         self.n_samples = n_samples
         self.n_samples_per_param = n_samples_per_param
 
         if(journal_file is None):
-            journal = Journal(full_output)
+            journal = self._create_journal(full_output)
             journal.configuration["type_model"] = [type(model).__name__ for model in self.model]
             journal.configuration["type_lhd_func"] = type(self.likfun).__name__
             journal.configuration["n_samples"] = self.n_samples
@@ -728,7 +1374,7 @@ class PMC(BaseLikelihood, InferenceMethod):
             journal.configuration["iniPoints"] = iniPoints
 
         else:
-            journal = Journal.fromFile(journal_file)
+            journal = self._create_journal(full_output, journal_file)
 
         accepted_parameters = None
         accepted_weights = None
@@ -774,8 +1420,13 @@ class PMC(BaseLikelihood, InferenceMethod):
         self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
 
         # main SMC algorithm
+        start_step, state = self._restore_checkpoint()
+        if state is not None:
+            accepted_parameters, accepted_weights = state["accepted_parameters"], state["accepted_weights"]
+            accepted_cov_mats = state["accepted_cov_mats"]
+
         self.logger.info("Starting pmc iterations")
-        for aStep in range(steps):
+        for aStep in range(start_step, steps):
             if(aStep==0 and journal_file is not None):
                 accepted_parameters = journal.get_accepted_parameters(-1)
                 accepted_weights = journal.get_weights(-1)
@@ -802,75 +1453,80 @@ class PMC(BaseLikelihood, InferenceMethod):
 
             # 0: update remotely required variables
             self.logger.info("Broadcasting parameters")
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
-                                                              accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats)
+            with self._phase("broadcast"):
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
+                                                                  accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats)
 
             # 1: Resample parameters
             self.logger.info("Resample parameters")
-            index = self.rng.choice(len(accepted_parameters), size=n_samples, p=accepted_weights.reshape(-1))
-            # Choose a new particle using the resampled particle (make the boundary proper)
-            # Initialize new_parameters
-            new_parameters = []
-            for ind in range(0, self.n_samples):
-                while True:
-                    perturbation_output = self.perturb(index[ind], rng=self.rng)
-                    if perturbation_output[0] and self.pdf_of_prior(self.model, perturbation_output[1])!= 0:
-                        new_parameters.append(perturbation_output[1])
-                        break
+            with self._phase("perturb"):
+                index = self.rng.choice(len(accepted_parameters), size=n_samples, p=accepted_weights.reshape(-1))
+                # Choose a new particle using the resampled particle (make the boundary proper)
+                # Initialize new_parameters
+                new_parameters = []
+                for ind in range(0, self.n_samples):
+                    while True:
+                        perturbation_output = self.perturb(index[ind], rng=self.rng)
+                        if perturbation_output[0] and self.pdf_of_prior(self.model, perturbation_output[1])!= 0:
+                            new_parameters.append(perturbation_output[1])
+                            break
 
             # 2: calculate approximate lieklihood for new parameters
             self.logger.info("Calculate approximate likelihood")
-            seed_arr = self.rng.randint(0, np.iinfo(np.uint32).max, size=self.n_samples, dtype=np.uint32)
-            rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
-            data_arr = []
-            for i in range(len(rng_arr)):
-                data_arr.append([new_parameters[i], rng_arr[i]])
-            data_pds = self.backend.parallelize(data_arr)
-
-            approx_likelihood_new_parameters_and_counter_pds = self.backend.map(self._approx_lik_calc, data_pds)
-            self.logger.debug("collect approximate likelihood from pds")
-            approx_likelihood_new_parameters_and_counter = self.backend.collect(approx_likelihood_new_parameters_and_counter_pds)
-            approx_likelihood_new_parameters, counter = [list(t) for t in
-                                                         zip(*approx_likelihood_new_parameters_and_counter)]
-
-            approx_likelihood_new_parameters = np.array(approx_likelihood_new_parameters).reshape(-1, 1)
+            with self._phase("likelihood"):
+                seed_arr = self.rng.randint(0, np.iinfo(np.uint32).max, size=self.n_samples, dtype=np.uint32)
+                rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
+                data_arr = []
+                for i in range(len(rng_arr)):
+                    data_arr.append([new_parameters[i], rng_arr[i]])
+                data_pds = self.backend.parallelize(data_arr)
+
+                approx_likelihood_new_parameters_and_counter_pds = self.backend.map(self._approx_lik_calc, data_pds)
+                self.logger.debug("collect approximate likelihood from pds")
+                approx_likelihood_new_parameters_and_counter = self.backend.collect(approx_likelihood_new_parameters_and_counter_pds)
+                approx_likelihood_new_parameters, counter = [list(t) for t in
+                                                             zip(*approx_likelihood_new_parameters_and_counter)]
+
+                approx_likelihood_new_parameters = np.array(approx_likelihood_new_parameters).reshape(-1, 1)
 
             for count in counter:
                 self.simulation_counter += count
 
             # 3: calculate new weights for new parameters
             self.logger.info("Calculating weights")
-            new_parameters_pds = self.backend.parallelize(new_parameters)
-            new_weights_pds = self.backend.map(self._calculate_weight, new_parameters_pds)
-            new_weights = np.array(self.backend.collect(new_weights_pds)).reshape(-1, 1)
+            with self._phase("weights"):
+                new_parameters_pds = self.backend.parallelize(new_parameters)
+                new_weights_pds = self.backend.map(self._calculate_weight, new_parameters_pds)
+                new_weights = np.array(self.backend.collect(new_weights_pds)).reshape(-1, 1)
 
-            sum_of_weights = 0.0
-            for i in range(0, self.n_samples):
-                new_weights[i] = new_weights[i] * approx_likelihood_new_parameters[i]
-                sum_of_weights += new_weights[i]
-            new_weights = new_weights / sum_of_weights
+                sum_of_weights = 0.0
+                for i in range(0, self.n_samples):
+                    new_weights[i] = new_weights[i] * approx_likelihood_new_parameters[i]
+                    sum_of_weights += new_weights[i]
+                new_weights = new_weights / sum_of_weights
 
             self.logger.info("new_weights : ", new_weights, ", sum_of_weights : ", sum_of_weights)
             accepted_parameters = new_parameters
 
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters, accepted_weights=new_weights)
+            with self._phase("covariance"):
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters, accepted_weights=new_weights)
 
-            # 4: calculate covariance
-            # The parameters relevant to each kernel have to be used to calculate n_sample times. It is therefore more efficient to broadcast these parameters once, instead of collecting them at each kernel in each step
-            self.logger.info("Calculating covariance matrix")
-            kernel_parameters = []
-            for kernel in self.kernel.kernels:
-                kernel_parameters.append(self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+                # 4: calculate covariance
+                # The parameters relevant to each kernel have to be used to calculate n_sample times. It is therefore more efficient to broadcast these parameters once, instead of collecting them at each kernel in each step
+                self.logger.info("Calculating covariance matrix")
+                kernel_parameters = []
+                for kernel in self.kernel.kernels:
+                    kernel_parameters.append(self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
 
-            self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
 
-            # 3: calculate covariance
-            self.logger.info("Calculating covariance matrix")
+                # 3: calculate covariance
+                self.logger.info("Calculating covariance matrix")
 
-            new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
-            # Since each entry of new_cov_mats is a numpy array, we can multiply like this
+                new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                # Since each entry of new_cov_mats is a numpy array, we can multiply like this
 
-            new_cov_mats = [covFactor * new_cov_mat for covFactor, new_cov_mat in zip(covFactors, new_cov_mats)]
+                new_cov_mats = [covFactor * new_cov_mat for covFactor, new_cov_mat in zip(covFactors, new_cov_mats)]
 
 
             # 5: Update the newly computed values
@@ -880,14 +1536,29 @@ class PMC(BaseLikelihood, InferenceMethod):
 
             self.logger.info("Saving configuration to output journal")
 
-            if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and aStep == steps - 1):
-                journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                journal.add_weights(copy.deepcopy(accepted_weights))
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
-                                                                  accepted_weights=accepted_weights)
-                names_and_parameters = self._get_names_and_parameters()
-                journal.add_user_parameters(names_and_parameters)
-                journal.number_of_simulations.append(self.simulation_counter)
+            budget_exhausted = self._budget_exhausted()
+            with self._phase("journal"):
+                if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and (aStep == steps - 1 or budget_exhausted)):
+                    journal.add_accepted_parameters(accepted_parameters)
+                    journal.add_weights(accepted_weights)
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
+                                                                      accepted_weights=accepted_weights)
+                    names_and_parameters = self._get_names_and_parameters()
+                    journal.add_user_parameters(names_and_parameters)
+                    journal.number_of_simulations.append(self.simulation_counter)
+                    journal.flush()
+            self._add_profile_to_journal(journal, aStep)
+
+            if budget_exhausted:
+                break
+
+            if aStep < steps - 1:
+                self._save_checkpoint(aStep, journal, accepted_parameters=accepted_parameters,
+                                      accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats)
+
+        self._add_budget_to_journal(journal)
+        journal.flush()
+        self._remove_checkpoint()
 
         return journal
 
@@ -1072,12 +1743,13 @@ class SABC(BaseDiscrepancy, InferenceMethod):
         global broken_preemptively
         self.sample_from_prior(rng=self.rng)
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
         self.epsilon = epsilon
         self.n_samples = n_samples
         self.n_samples_per_param = n_samples_per_param
 
         if(journal_file is None):
-            journal = Journal(full_output)
+            journal = self._create_journal(full_output)
             journal.configuration["type_model"] = [type(model).__name__ for model in self.model]
             journal.configuration["type_dist_func"] = type(self.distance).__name__
             journal.configuration["type_kernel_func"] = type(self.kernel)
@@ -1091,7 +1763,7 @@ class SABC(BaseDiscrepancy, InferenceMethod):
             journal.configuration["n_update"] = n_update
             journal.configuration["full_output"] = full_output
         else:
-            journal = Journal.fromFile(journal_file)
+            journal = self._create_journal(full_output, journal_file)
 
         accepted_parameters = None
         distances = np.zeros(shape=(n_samples,))
@@ -1115,7 +1787,14 @@ class SABC(BaseDiscrepancy, InferenceMethod):
         ## Counter whether broken preemptively
         broken_preemptively = False
 
-        for aStep in range(0, steps):
+        start_step, state = self._restore_checkpoint()
+        if state is not None:
+            accepted_parameters, accepted_weights = state["accepted_parameters"], state["accepted_weights"]
+            accepted_cov_mats, all_distances = state["accepted_cov_mats"], state["all_distances"]
+            distances, smooth_distances = state["distances"], state["smooth_distances"]
+            epsilon, accept, samples_until = state["epsilon"], state["accept"], state["samples_until"]
+
+        for aStep in range(start_step, steps):
             self.logger.debug("step {}".format(aStep))
             if(aStep==0 and journal_file is not None):
                 accepted_parameters=journal.get_accepted_parameters(-1)
@@ -1155,14 +1834,17 @@ class SABC(BaseDiscrepancy, InferenceMethod):
 
             # 0: update remotely required variables
             self.logger.info("Broadcasting parameters")
-            self.epsilon = epsilon
-            self._update_broadcasts(smooth_distances, all_distances)
+            with self._phase("broadcast"):
+                self.epsilon = epsilon
+                self._update_broadcasts(smooth_distances, all_distances)
 
             # 1: Calculate  parameters
             self.logger.info("Initial accepted parameters")
-            params_and_dists_pds = self.backend.map(self._accept_parameter, data_pds)
-            self.logger.debug("Map step of parallelism is finished")
-            params_and_dists = self.backend.collect(params_and_dists_pds)
+            with self._phase("simulate"):
+                self._update_particle_budget(len(data_arr))
+                params_and_dists_pds = self.backend.map(self._accept_parameter, data_pds)
+                self.logger.debug("Map step of parallelism is finished")
+                params_and_dists = self.backend.collect(params_and_dists_pds)
             self.logger.debug("Collect step of parallelism is finished")
             new_parameters, new_distances, new_all_parameters, new_all_distances, index, acceptance, counter = [list(t) for t in
                                                                                                        zip(
@@ -1227,99 +1909,119 @@ class SABC(BaseDiscrepancy, InferenceMethod):
                     break
 
             # 5: Resampling if number of accepted particles greater than resample
-            if accept >= resample and U > 1e-100:
-                self.logger.info("Weighted resampling")
-                weight = np.exp(-smooth_distances * delta / U)
-                weight = weight / sum(weight)
-                index_resampled = self.rng.choice(np.arange(n_samples, dtype=int), n_samples, replace=1, p=weight)
-                accepted_parameters = [accepted_parameters[i] for i in index_resampled]
-                smooth_distances = smooth_distances[index_resampled]
-
-                ## Update U and epsilon:
-                epsilon = epsilon * (1 - delta)
-                U = np.mean(smooth_distances)
-                epsilon = self._schedule(U, v)
-
-                ## Print effective sampling size
-                self.logger.info('Resampling: Effective sampling size: '+str(1 / sum(pow(weight / sum(weight), 2))))
-                accept = 0
-                samples_until = 0
-
-                ## Compute and broadcast accepted parameters, accepted kernel parameters and accepted Covariance matrix
-                # Broadcast Accepted parameters and add to journal
-                self.logger.info("Broadcast Accepted parameters and add to journal")
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights=accepted_weights, accepted_parameters=accepted_parameters)
-                # Compute Accepetd Kernel parameters and broadcast them
-                self.logger.debug("Compute Accepetd Kernel parameters and broadcast them")
-                kernel_parameters = []
-                for kernel in self.kernel.kernels:
-                    kernel_parameters.append(
-                        self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
-                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
-                # Compute Kernel Covariance Matrix and broadcast it
-                self.logger.debug("Compute Kernel Covariance Matrix and broadcast it")
-                new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
-                accepted_cov_mats = []
-                for new_cov_mat in new_cov_mats:
-                    if not(new_cov_mat.size == 1):
-                        accepted_cov_mats.append(beta * new_cov_mat + 0.0001 * np.trace(new_cov_mat) * np.eye(new_cov_mat.shape[0]))
-                    else:
-                        accepted_cov_mats.append((beta * new_cov_mat + 0.0001 * new_cov_mat).reshape(1,1))
-
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
-
-                if (full_output == 1 and aStep<= steps-1):
-                    ## Saving intermediate configuration to output journal.
-                    self.logger.info('Saving after resampling')
-                    journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                    journal.add_weights(copy.deepcopy(accepted_weights))
-                    journal.add_distances(copy.deepcopy(distances))
-                    names_and_parameters = self._get_names_and_parameters()
-                    journal.add_user_parameters(names_and_parameters)
-                    journal.number_of_simulations.append(self.simulation_counter)
-            else:
-                ## Compute and broadcast accepted parameters, accepted kernel parameters and accepted Covariance matrix
-                # Broadcast Accepted parameters
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights= accepted_weights, accepted_parameters=accepted_parameters)
-                # Compute Accepetd Kernel parameters and broadcast them
-                kernel_parameters = []
-                for kernel in self.kernel.kernels:
-                    kernel_parameters.append(
-                        self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
-                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
-                # Compute Kernel Covariance Matrix and broadcast it
-                new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
-                accepted_cov_mats = []
-                for new_cov_mat in new_cov_mats:
-                    if not(new_cov_mat.size == 1):
-                        accepted_cov_mats.append(beta * new_cov_mat + 0.0001 * np.trace(new_cov_mat) * np.eye(new_cov_mat.shape[0]))
-                    else:
-                        accepted_cov_mats.append((beta * new_cov_mat + 0.0001 * new_cov_mat).reshape(1,1))
-
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
+            with self._phase("update"):
+                if accept >= resample and U > 1e-100:
+                    self.logger.info("Weighted resampling")
+                    weight = np.exp(-smooth_distances * delta / U)
+                    weight = weight / sum(weight)
+                    index_resampled = self.rng.choice(np.arange(n_samples, dtype=int), n_samples, replace=1, p=weight)
+                    accepted_parameters = [accepted_parameters[i] for i in index_resampled]
+                    smooth_distances = smooth_distances[index_resampled]
+
+                    ## Update U and epsilon:
+                    epsilon = epsilon * (1 - delta)
+                    U = np.mean(smooth_distances)
+                    epsilon = self._schedule(U, v)
+
+                    ## Print effective sampling size
+                    self.logger.info('Resampling: Effective sampling size: '+str(1 / sum(pow(weight / sum(weight), 2))))
+                    accept = 0
+                    samples_until = 0
+
+                    ## Compute and broadcast accepted parameters, accepted kernel parameters and accepted Covariance matrix
+                    # Broadcast Accepted parameters and add to journal
+                    self.logger.info("Broadcast Accepted parameters and add to journal")
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights=accepted_weights, accepted_parameters=accepted_parameters)
+                    # Compute Accepetd Kernel parameters and broadcast them
+                    self.logger.debug("Compute Accepetd Kernel parameters and broadcast them")
+                    kernel_parameters = []
+                    for kernel in self.kernel.kernels:
+                        kernel_parameters.append(
+                            self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+                    self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+                    # Compute Kernel Covariance Matrix and broadcast it
+                    self.logger.debug("Compute Kernel Covariance Matrix and broadcast it")
+                    new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                    accepted_cov_mats = []
+                    for new_cov_mat in new_cov_mats:
+                        if not(new_cov_mat.size == 1):
+                            accepted_cov_mats.append(beta * new_cov_mat + 0.0001 * np.trace(new_cov_mat) * np.eye(new_cov_mat.shape[0]))
+                        else:
+                            accepted_cov_mats.append((beta * new_cov_mat + 0.0001 * new_cov_mat).reshape(1,1))
+
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
+
+                    if (full_output == 1 and aStep<= steps-1):
+                        ## Saving intermediate configuration to output journal.
+                        self.logger.info('Saving after resampling')
+                        journal.add_accepted_parameters(accepted_parameters)
+                        journal.add_weights(accepted_weights)
+                        journal.add_distances(distances)
+                        names_and_parameters = self._get_names_and_parameters()
+                        journal.add_user_parameters(names_and_parameters)
+                        journal.number_of_simulations.append(self.simulation_counter)
+                        journal.flush()
+                else:
+                    ## Compute and broadcast accepted parameters, accepted kernel parameters and accepted Covariance matrix
+                    # Broadcast Accepted parameters
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights= accepted_weights, accepted_parameters=accepted_parameters)
+                    # Compute Accepetd Kernel parameters and broadcast them
+                    kernel_parameters = []
+                    for kernel in self.kernel.kernels:
+                        kernel_parameters.append(
+                            self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+                    self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+                    # Compute Kernel Covariance Matrix and broadcast it
+                    new_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                    accepted_cov_mats = []
+                    for new_cov_mat in new_cov_mats:
+                        if not(new_cov_mat.size == 1):
+                            accepted_cov_mats.append(beta * new_cov_mat + 0.0001 * np.trace(new_cov_mat) * np.eye(new_cov_mat.shape[0]))
+                        else:
+                            accepted_cov_mats.append((beta * new_cov_mat + 0.0001 * new_cov_mat).reshape(1,1))
+
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
+
+                    if (full_output == 1 and aStep <= steps-1):
+                        ## Saving intermediate configuration to output journal.
+                        journal.add_accepted_parameters(accepted_parameters)
+                        journal.add_weights(accepted_weights)
+                        journal.add_distances(distances)
+                        names_and_parameters = self._get_names_and_parameters()
+                        journal.add_user_parameters(names_and_parameters)
+                        journal.number_of_simulations.append(self.simulation_counter)
+                        journal.flush()
+
+            self._add_diagnostics_to_journal(journal, aStep, accepted_parameters, accepted_weights)
+            self._add_profile_to_journal(journal, aStep)
+
+            if self._budget_exhausted():
+                break
 
-                if (full_output == 1 and aStep <= steps-1):
-                    ## Saving intermediate configuration to output journal.
-                    journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                    journal.add_weights(copy.deepcopy(accepted_weights))
-                    journal.add_distances(copy.deepcopy(distances))
-                    names_and_parameters = self._get_names_and_parameters()
-                    journal.add_user_parameters(names_and_parameters)
-                    journal.number_of_simulations.append(self.simulation_counter)
+            if aStep < steps - 1:
+                self._save_checkpoint(aStep, journal, accepted_parameters=accepted_parameters,
+                                      accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats,
+                                      distances=distances, smooth_distances=smooth_distances,
+                                      all_distances=all_distances, epsilon=epsilon, accept=accept,
+                                      samples_until=samples_until)
 
         # Add epsilon_arr, number of final steps and final output to the journal
         # print("INFO: Saving final configuration to output journal.")
         if (full_output == 0) or (full_output ==1 and broken_preemptively and aStep<= steps-1):
-            journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-            journal.add_weights(copy.deepcopy(accepted_weights))
-            journal.add_distances(copy.deepcopy(distances))
+            journal.add_accepted_parameters(accepted_parameters)
+            journal.add_weights(accepted_weights)
+            journal.add_distances(distances)
             self.accepted_parameters_manager.update_broadcast(self.backend,accepted_parameters=accepted_parameters,accepted_weights=accepted_weights)
             names_and_parameters = self._get_names_and_parameters()
             journal.add_user_parameters(names_and_parameters)
             journal.number_of_simulations.append(self.simulation_counter)
+            journal.flush()
 
         journal.configuration["steps"] = aStep + 1
         journal.configuration["epsilon"] = epsilon
+        self._add_budget_to_journal(journal)
+        journal.flush()
+        self._remove_checkpoint()
 
         return journal
 
@@ -1424,7 +2126,7 @@ class SABC(BaseDiscrepancy, InferenceMethod):
 
         if self.accepted_parameters_manager.accepted_cov_mats_bds == None:
 
-            while acceptance == 0:
+            while acceptance == 0 and not self._particle_budget_reached(counter):
                 self.sample_from_prior(rng=rng)
                 new_theta = self.get_parameters()
                 all_parameters.append(new_theta)
@@ -1435,6 +2137,11 @@ class SABC(BaseDiscrepancy, InferenceMethod):
                 distance = self.distance.distance(self.accepted_parameters_manager.observations_bds.value(), y_sim)
                 all_distances.append(distance)
                 acceptance = rng.binomial(1, np.exp(-distance / self.epsilon), 1)
+            if acceptance == 0:
+                # the particle budget was reached before a draw was accepted: the closest draw is returned instead
+                best = int(np.argmin(all_distances))
+                new_theta, distance = all_parameters[best], all_distances[best]
+            # every particle of the initial population is filled
             acceptance = 1
         else:
             ## Select one arbitrary particle:
@@ -1564,12 +2271,13 @@ class ABCsubsim(BaseDiscrepancy, InferenceMethod):
         self.sample_from_prior(rng=self.rng)
 
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
         self.chain_length = chain_length
         self.n_samples = n_samples
         self.n_samples_per_param = n_samples_per_param
 
         if(journal_file is None):
-            journal = Journal(full_output)
+            journal = self._create_journal(full_output)
             journal.configuration["type_model"] = [type(model).__name__ for model in self.model]
             journal.configuration["type_dist_func"] = type(self.distance).__name__
             journal.configuration["type_kernel_func"] = type(self.kernel)
@@ -1579,7 +2287,7 @@ class ABCsubsim(BaseDiscrepancy, InferenceMethod):
             journal.configuration["ap_change_cutoff"] = ap_change_cutoff
             journal.configuration["full_output"] = full_output
         else:
-            journal = Journal.fromFile(journal_file)
+            journal = self._create_journal(full_output, journal_file)
 
         accepted_parameters = None
         accepted_weights = np.ones(shape=(n_samples, 1))
@@ -1588,8 +2296,13 @@ class ABCsubsim(BaseDiscrepancy, InferenceMethod):
         anneal_parameter_old = 0
         temp_chain_length = 1
 
+        start_step, state = self._restore_checkpoint()
+        if state is not None:
+            accepted_parameters, accepted_weights = state["accepted_parameters"], state["accepted_weights"]
+            accepted_cov_mats, temp_chain_length = state["accepted_cov_mats"], state["temp_chain_length"]
+            anneal_parameter = self.anneal_parameter = state["anneal_parameter"]
 
-        for aStep in range(0, steps):
+        for aStep in range(start_step, steps):
             self.logger.info("ABCsubsim step {}".format(aStep))
             if aStep==0 and journal_file is not None:
                 accepted_parameters = journal.get_accepted_parameters(-1)
@@ -1609,14 +2322,16 @@ class ABCsubsim(BaseDiscrepancy, InferenceMethod):
             # 0: update remotely required variables
             self.logger.info("Broadcasting parameters")
 
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights = accepted_weights, accepted_parameters=accepted_parameters)
+            with self._phase("broadcast"):
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights = accepted_weights, accepted_parameters=accepted_parameters)
 
             # 1: Calculate  parameters
             # print("INFO: Initial accepted parameter parameters")
             self.logger.info("Initial accepted parameters")
-            params_and_dists_pds = self.backend.map(self._accept_parameter, rng_and_index_pds)
-            self.logger.debug("Map random number to a pseudo-observation")
-            params_and_dists = self.backend.collect(params_and_dists_pds)
+            with self._phase("simulate"):
+                params_and_dists_pds = self.backend.map(self._accept_parameter, rng_and_index_pds)
+                self.logger.debug("Map random number to a pseudo-observation")
+                params_and_dists = self.backend.collect(params_and_dists_pds)
             self.logger.debug("Collect results from the mapping")
             new_parameters, new_distances, counter = [list(t) for t in zip(*params_and_dists)]
 
@@ -1650,54 +2365,59 @@ class ABCsubsim(BaseDiscrepancy, InferenceMethod):
 
             # 4: Update proposal covariance matrix (Parallelized)
             self.logger.debug("Update proposal covariance matrix (Parallelized).")
-            if aStep == 0:
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters)
+            with self._phase("covariance"):
+                if aStep == 0:
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters)
+
+                    kernel_parameters = []
+                    for kernel in self.kernel.kernels:
+                        kernel_parameters.append(
+                            self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+                    self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+                    accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                else:
+                    accepted_cov_mats = pow(2,1)*accepted_cov_mats
 
-                kernel_parameters = []
-                for kernel in self.kernel.kernels:
-                    kernel_parameters.append(
-                        self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
-                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
-                accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
-            else:
-                accepted_cov_mats = pow(2,1)*accepted_cov_mats
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
 
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
+                seed_arr = self.rng.randint(0, np.iinfo(np.uint32).max, size=10, dtype=np.uint32)
+                rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
+                index_arr = np.linspace(0, 10 - 1, 10).astype(int).reshape(10, )
+                rng_and_index_arr = np.column_stack((rng_arr, index_arr))
+                rng_and_index_pds = self.backend.parallelize(rng_and_index_arr)
 
-            seed_arr = self.rng.randint(0, np.iinfo(np.uint32).max, size=10, dtype=np.uint32)
-            rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
-            index_arr = np.linspace(0, 10 - 1, 10).astype(int).reshape(10, )
-            rng_and_index_arr = np.column_stack((rng_arr, index_arr))
-            rng_and_index_pds = self.backend.parallelize(rng_and_index_arr)
+                self.logger.debug("Update co-variance matrix in parallel (map).")
+                cov_mats_index_pds = self.backend.map(self._update_cov_mat, rng_and_index_pds)
+                self.logger.debug("Collect co-variance matrix.")
+                cov_mats_index = self.backend.collect(cov_mats_index_pds)
+                cov_mats, T, accept_index, counter = [list(t) for t in zip(*cov_mats_index)]
 
-            self.logger.debug("Update co-variance matrix in parallel (map).")
-            cov_mats_index_pds = self.backend.map(self._update_cov_mat, rng_and_index_pds)
-            self.logger.debug("Collect co-variance matrix.")
-            cov_mats_index = self.backend.collect(cov_mats_index_pds)
-            cov_mats, T, accept_index, counter = [list(t) for t in zip(*cov_mats_index)]
+                for count in counter:
+                    self.simulation_counter+=count
 
-            for count in counter:
-                self.simulation_counter+=count
+                for ind in range(10):
+                    if accept_index[ind] == 1:
+                        accepted_cov_mats = cov_mats[ind]
+                        break
 
-            for ind in range(10):
-                if accept_index[ind] == 1:
-                    accepted_cov_mats = cov_mats[ind]
-                    break
+                self.logger.debug("Broadcast accepted parameters.")
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
 
-            self.logger.debug("Broadcast accepted parameters.")
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
+            with self._phase("journal"):
+                if full_output == 1:
+                    self.logger.info("Saving intermediate configuration to output journal")
+                    journal.add_accepted_parameters(accepted_parameters)
+                    journal.add_distances(distances)
+                    journal.add_weights(accepted_weights)
+                    journal.add_opt_values(accepted_cov_mats)
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
+                                                                      accepted_weights=accepted_weights)
+                    names_and_parameters = self._get_names_and_parameters()
+                    journal.add_user_parameters(names_and_parameters)
+                    journal.number_of_simulations.append(self.simulation_counter)
+                    journal.flush()
 
-            if full_output == 1:
-                self.logger.info("Saving intermediate configuration to output journal")
-                journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                journal.add_distances(copy.deepcopy(distances))
-                journal.add_weights(copy.deepcopy(accepted_weights))
-                journal.add_opt_values(accepted_cov_mats)
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
-                                                                  accepted_weights=accepted_weights)
-                names_and_parameters = self._get_names_and_parameters()
-                journal.add_user_parameters(names_and_parameters)
-                journal.number_of_simulations.append(self.simulation_counter)
+            self._add_profile_to_journal(journal, aStep)
 
             # Show progress
             anneal_parameter_change_percentage = 100 * abs(anneal_parameter_old - anneal_parameter) / abs(anneal_parameter)
@@ -1707,21 +2427,33 @@ class ABCsubsim(BaseDiscrepancy, InferenceMethod):
             if anneal_parameter_change_percentage < ap_change_cutoff:
                 break
 
+            if self._budget_exhausted():
+                break
+
+            if aStep < steps - 1:
+                self._save_checkpoint(aStep, journal, accepted_parameters=accepted_parameters,
+                                      accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats,
+                                      anneal_parameter=anneal_parameter, temp_chain_length=temp_chain_length)
+
         # Add anneal_parameter, number of final steps and final output to the journal
         # print("INFO: Saving final configuration to output journal.")
         if full_output == 0:
-            journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-            journal.add_distances(copy.deepcopy(distances))
-            journal.add_weights(copy.deepcopy(accepted_weights))
+            journal.add_accepted_parameters(accepted_parameters)
+            journal.add_distances(distances)
+            journal.add_weights(accepted_weights)
             journal.add_opt_values(accepted_cov_mats)
             self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
                                                               accepted_weights=accepted_weights)
             names_and_parameters = self._get_names_and_parameters()
             journal.add_user_parameters(names_and_parameters)
             journal.number_of_simulations.append(self.simulation_counter)
+            journal.flush()
 
         journal.configuration["steps"] = aStep + 1
         journal.configuration["anneal_parameter"] = anneal_parameter
+        self._add_budget_to_journal(journal)
+        journal.flush()
+        self._remove_checkpoint()
 
         return journal
 
@@ -1968,27 +2700,34 @@ class RSMCABC(BaseDiscrepancy, InferenceMethod):
         self.sample_from_prior(rng=self.rng)
 
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
         self.alpha = alpha
         self.n_samples = n_samples
         self.n_samples_per_param = n_samples_per_param
 
         if(journal_file is None):
-            journal = Journal(full_output)
+            journal = self._create_journal(full_output)
             journal.configuration["type_model"] = [type(model).__name__ for model in self.model]
             journal.configuration["type_dist_func"] = type(self.distance).__name__
             journal.configuration["n_samples"] = self.n_samples
             journal.configuration["n_samples_per_param"] = self.n_samples_per_param
             journal.configuration["steps"] = steps
         else:
-            journal = Journal.fromFile(journal_file)
+            journal = self._create_journal(full_output, journal_file)
 
         accepted_parameters = None
         accepted_cov_mat = None
         accepted_dist = None
         accepted_weights = None
 
+        start_step, state = self._restore_checkpoint()
+        if state is not None:
+            accepted_parameters, accepted_weights = state["accepted_parameters"], state["accepted_weights"]
+            accepted_cov_mats, accepted_dist = state["accepted_cov_mats"], state["accepted_dist"]
+            epsilon, R, n_replenish = state["epsilon"], state["R"], state["n_replenish"]
+
         # main RSMCABC algorithm
-        for aStep in range(steps):
+        for aStep in range(start_step, steps):
             self.logger.info("RSMCABC iteration {}".format(aStep))
 
             if aStep == 0 and journal_file is not None:
@@ -2014,28 +2753,29 @@ class RSMCABC(BaseDiscrepancy, InferenceMethod):
             # and finally Drawing new new/perturbed samples using prior or MCMC Kernel
             # print("DEBUG: Iteration " + str(aStep) + " of RSMCABC algorithm.")
             self.logger.info("Compute epsilon and calculating covariance matrix.")
-            if aStep == 0:
-                n_replenish = n_samples
-                # Compute epsilon
-                epsilon = [epsilon_init]
-                R = int(1)
-                if(journal_file is None):
-                    accepted_cov_mats=None
-            else:
-                # Compute epsilon
-                epsilon.append(accepted_dist[-1])
-                # Calculate covariance
-                # print("INFO: Calculating covariance matrix.")
-                kernel_parameters = []
-                for kernel in self.kernel.kernels:
-                    kernel_parameters.append(
-                        self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+            with self._phase("covariance"):
+                if aStep == 0:
+                    n_replenish = n_samples
+                    # Compute epsilon
+                    epsilon = [epsilon_init]
+                    R = int(1)
+                    if(journal_file is None):
+                        accepted_cov_mats=None
+                else:
+                    # Compute epsilon
+                    epsilon.append(accepted_dist[-1])
+                    # Calculate covariance
+                    # print("INFO: Calculating covariance matrix.")
+                    kernel_parameters = []
+                    for kernel in self.kernel.kernels:
+                        kernel_parameters.append(
+                            self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
 
-                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+                    self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
 
-                accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                    accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
 
-                accepted_cov_mats = [covFactor*cov_mat for cov_mat in accepted_cov_mats]
+                    accepted_cov_mats = [covFactor*cov_mat for cov_mat in accepted_cov_mats]
 
             if epsilon[-1] < epsilon_final:
                 self.logger("accepted epsilon {:e} < {:e}"
@@ -2049,18 +2789,21 @@ class RSMCABC(BaseDiscrepancy, InferenceMethod):
             # update remotely required variables
             self.logger.info("Broadcasting parameters.")
             # print("INFO: Broadcasting parameters.")
-            self.epsilon = epsilon
-            self.R = R
-            self.logger.info("Broadcast updated variable.")
-            # Broadcast updated variable
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
-            self._update_broadcasts(accepted_dist)
+            with self._phase("broadcast"):
+                self.epsilon = epsilon
+                self.R = R
+                self.logger.info("Broadcast updated variable.")
+                # Broadcast updated variable
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_cov_mats=accepted_cov_mats)
+                self._update_broadcasts(accepted_dist)
 
             # calculate resample parameters
             self.logger.info("Resampling parameters")
             # print("INFO: Resampling parameters")
-            params_and_dist_index_pds = self.backend.map(self._accept_parameter, rng_pds)
-            params_and_dist_index = self.backend.collect(params_and_dist_index_pds)
+            with self._phase("simulate"):
+                self._update_particle_budget(n_replenish)
+                params_and_dist_index_pds = self.backend.map(self._accept_parameter, rng_pds)
+                params_and_dist_index = self.backend.collect(params_and_dist_index_pds)
             new_parameters, new_dist, new_index, counter = [list(t) for t in zip(*params_and_dist_index)]
             new_dist = np.array(new_dist)
             new_index = np.array(new_index)
@@ -2078,47 +2821,64 @@ class RSMCABC(BaseDiscrepancy, InferenceMethod):
                 accepted_parameters += new_parameters
                 accepted_dist = np.concatenate((accepted_dist, new_dist))
                 accepted_weights = np.ones(shape=(len(accepted_parameters), 1)) * (1 / len(accepted_parameters))
+            self._add_diagnostics_to_journal(journal, aStep, accepted_parameters, accepted_weights)
+
+            budget_exhausted = self._budget_exhausted()
+            with self._phase("journal"):
+                if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and (aStep == steps - 1 or budget_exhausted)):
+                    self.logger.info("Saving configuration to output journal.")
+                    journal.add_accepted_parameters(accepted_parameters)
+                    journal.add_distances(accepted_dist)
+                    journal.add_weights(accepted_weights)
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights=accepted_weights, accepted_parameters=accepted_parameters)
+                    names_and_parameters = self._get_names_and_parameters()
+                    journal.add_user_parameters(names_and_parameters)
+                    journal.number_of_simulations.append(self.simulation_counter)
+                    journal.flush()
+
+            self._add_profile_to_journal(journal, aStep)
 
-            if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and aStep == steps - 1):
-                self.logger.info("Saving configuration to output journal.")
-                journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                journal.add_distances(copy.deepcopy(accepted_dist))
-                journal.add_weights(accepted_weights)
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights=accepted_weights, accepted_parameters=accepted_parameters)
-                names_and_parameters = self._get_names_and_parameters()
-                journal.add_user_parameters(names_and_parameters)
-                journal.number_of_simulations.append(self.simulation_counter)
+            if budget_exhausted:
+                break
 
             # 2: Compute acceptance probabilty and set R
             self.logger.info("Compute acceptance probabilty and set R")
-            prob_acceptance = sum(new_index) / (R * n_replenish)
-            if prob_acceptance == 1 or prob_acceptance == 0:
-                R = 1
-            else:
-                R = int(np.log(const) / np.log(1 - prob_acceptance))
+            with self._phase("resample"):
+                prob_acceptance = sum(new_index) / (R * n_replenish)
+                if prob_acceptance == 1 or prob_acceptance == 0:
+                    R = 1
+                else:
+                    R = int(np.log(const) / np.log(1 - prob_acceptance))
 
-            self.logger.info("Order accepted parameters and distances")
-            n_replenish = round(n_samples * alpha)
-            accepted_params_and_dist = zip(accepted_dist, accepted_parameters)
-            accepted_params_and_dist = sorted(accepted_params_and_dist, key = lambda x: x[0])
-            accepted_dist, accepted_parameters = [list(t) for t in zip(*accepted_params_and_dist)]
+                self.logger.info("Order accepted parameters and distances")
+                n_replenish = round(n_samples * alpha)
+                accepted_params_and_dist = zip(accepted_dist, accepted_parameters)
+                accepted_params_and_dist = sorted(accepted_params_and_dist, key = lambda x: x[0])
+                accepted_dist, accepted_parameters = [list(t) for t in zip(*accepted_params_and_dist)]
 
-            self.logger.info("Throw away N_alpha particles with largest dist")
-            # Throw away N_alpha particles with largest distance
+                self.logger.info("Throw away N_alpha particles with largest dist")
+                # Throw away N_alpha particles with largest distance
 
-            del accepted_parameters[self.n_samples - round(n_samples * alpha):]
-            accepted_dist = np.delete(accepted_dist,
-                                      np.arange(round(n_samples * alpha)) + (n_samples - round(n_samples * alpha)),
-                                      0)
+                del accepted_parameters[self.n_samples - round(n_samples * alpha):]
+                accepted_dist = np.delete(accepted_dist,
+                                          np.arange(round(n_samples * alpha)) + (n_samples - round(n_samples * alpha)),
+                                          0)
 
-            accepted_weights = np.ones(shape=(len(accepted_parameters), 1)) * (1 / len(accepted_parameters))
-            self.logger.info("Update parameters, weights")
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights=accepted_weights,
-                                                              accepted_parameters=accepted_parameters)
+                accepted_weights = np.ones(shape=(len(accepted_parameters), 1)) * (1 / len(accepted_parameters))
+                self.logger.info("Update parameters, weights")
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_weights=accepted_weights,
+                                                                  accepted_parameters=accepted_parameters)
 
+            if aStep < steps - 1:
+                self._save_checkpoint(aStep, journal, accepted_parameters=accepted_parameters,
+                                      accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats,
+                                      accepted_dist=accepted_dist, epsilon=epsilon, R=R, n_replenish=n_replenish)
 
         # Add epsilon_arr to the journal
         journal.configuration["epsilon_arr"] = epsilon
+        self._add_budget_to_journal(journal)
+        journal.flush()
+        self._remove_checkpoint()
 
         return journal
 
@@ -2157,11 +2917,18 @@ class RSMCABC(BaseDiscrepancy, InferenceMethod):
         counter = 0
 
         if self.accepted_parameters_manager.accepted_parameters_bds == None:
-            while distance > self.epsilon[-1]:
+            best_theta, best_distance = None, None
+            while distance > self.epsilon[-1] and not self._particle_budget_reached(counter):
                 self.sample_from_prior(rng=rng)
                 y_sim = self.simulate(self.n_samples_per_param, rng=rng, npc=npc)
                 counter+=1
                 distance = self.distance.distance(self.accepted_parameters_manager.observations_bds.value(), y_sim)
+                if best_distance is None or distance < best_distance:
+                    best_theta, best_distance = self.get_parameters(self.model), distance
+            if best_distance is not None and distance > self.epsilon[-1]:
+                # the particle budget was reached before the threshold: the closest draw is returned instead
+                self.set_parameters(best_theta)
+                distance = best_distance
 
             index_accept = 1
         else:
@@ -2249,7 +3016,6 @@ class APMCABC(BaseDiscrepancy, InferenceMethod):
         # these are usually big tables, so we broadcast them to have them once
         # per executor instead of once per task
         self.accepted_parameters_manager = AcceptedParametersManager(self.model)
-        self.accepted_dist_bds = None
 
         self.simulation_counter = 0
 
@@ -2289,19 +3055,20 @@ class APMCABC(BaseDiscrepancy, InferenceMethod):
         self.sample_from_prior(rng=self.rng)
 
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
         self.alpha = alpha
         self.n_samples = n_samples
         self.n_samples_per_param = n_samples_per_param
 
         if(journal_file is None):
-            journal = Journal(full_output)
+            journal = self._create_journal(full_output)
             journal.configuration["type_model"] = [type(model).__name__ for model in self.model]
             journal.configuration["type_dist_func"] = type(self.distance).__name__
             journal.configuration["n_samples"] = self.n_samples
             journal.configuration["n_samples_per_param"] = self.n_samples_per_param
             journal.configuration["steps"] = steps
         else:
-            journal = Journal.fromFile(journal_file)
+            journal = self._create_journal(full_output, journal_file)
 
         accepted_parameters = None
         accepted_weights = None
@@ -2311,9 +3078,16 @@ class APMCABC(BaseDiscrepancy, InferenceMethod):
         alpha_accepted_weights = None
         alpha_accepted_dist = None
 
+        start_step, state = self._restore_checkpoint()
+        if state is not None:
+            alpha_accepted_parameters = state["alpha_accepted_parameters"]
+            alpha_accepted_weights = state["alpha_accepted_weights"]
+            alpha_accepted_dist, accepted_cov_mats = state["alpha_accepted_dist"], state["accepted_cov_mats"]
+            epsilon = state["epsilon"]
+
         # main APMCABC algorithm
         # print("INFO: Starting APMCABC iterations.")
-        for aStep in range(steps):
+        for aStep in range(start_step, steps):
             self.logger.info("APMCABC iteration {}".format(aStep))
             if(aStep==0 and journal_file is not None):
                 accepted_parameters=journal.get_accepted_parameters(-1)
@@ -2349,13 +3123,15 @@ class APMCABC(BaseDiscrepancy, InferenceMethod):
 
             # update remotely required variables
             self.logger.info("Broadcasting parameters")
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=alpha_accepted_parameters, accepted_weights=alpha_accepted_weights, accepted_cov_mats=accepted_cov_mats)
-            self._update_broadcasts(alpha_accepted_dist)
+            with self._phase("broadcast"):
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=alpha_accepted_parameters, accepted_weights=alpha_accepted_weights, accepted_cov_mats=accepted_cov_mats)
 
             # calculate resample parameters
             self.logger.info("Resampling parameters")
-            params_and_dist_weights_pds = self.backend.map(self._accept_parameter, rng_pds)
-            params_and_dist_weights = self.backend.collect(params_and_dist_weights_pds)
+            with self._phase("simulate"):
+                self._update_particle_budget(n_additional_samples)
+                params_and_dist_weights_pds = self.backend.map(self._accept_parameter, rng_pds)
+                params_and_dist_weights = self.backend.collect(params_and_dist_weights_pds)
             new_parameters, new_dist, new_weights, counter = [list(t) for t in zip(*params_and_dist_weights)]
             new_parameters = np.array(new_parameters)
             new_dist = np.array(new_dist)
@@ -2390,47 +3166,56 @@ class APMCABC(BaseDiscrepancy, InferenceMethod):
 
             # 3: calculate covariance
             self.logger.info("Calculating covariance matrix")
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=alpha_accepted_parameters, accepted_weights=alpha_accepted_weights)
+            with self._phase("covariance"):
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=alpha_accepted_parameters, accepted_weights=alpha_accepted_weights)
 
-            kernel_parameters = []
-            for kernel in self.kernel.kernels:
-                kernel_parameters.append(
-                    self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+                kernel_parameters = []
+                for kernel in self.kernel.kernels:
+                    kernel_parameters.append(
+                        self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
 
-            self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
 
-            accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
 
-            accepted_cov_mats = [covFactor*cov_mat for cov_mat in accepted_cov_mats]
+                accepted_cov_mats = [covFactor*cov_mat for cov_mat in accepted_cov_mats]
+            self._add_diagnostics_to_journal(journal, aStep, accepted_parameters, accepted_weights)
 
             # print("INFO: Saving configuration to output journal.")
-            if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and aStep == steps - 1):
-                journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                journal.add_distances(copy.deepcopy(accepted_dist))
-                journal.add_weights(copy.deepcopy(accepted_weights))
-                self.accepted_parameters_manager.update_broadcast(self.backend,
-                                                                  accepted_parameters=accepted_parameters,
-                                                                  accepted_weights=accepted_weights)
-                names_and_parameters = self._get_names_and_parameters()
-                journal.add_user_parameters(names_and_parameters)
-                journal.number_of_simulations.append(self.simulation_counter)
+            budget_exhausted = self._budget_exhausted()
+            with self._phase("journal"):
+                if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and (aStep == steps - 1 or budget_exhausted)):
+                    journal.add_accepted_parameters(accepted_parameters)
+                    journal.add_distances(accepted_dist)
+                    journal.add_weights(accepted_weights)
+                    self.accepted_parameters_manager.update_broadcast(self.backend,
+                                                                      accepted_parameters=accepted_parameters,
+                                                                      accepted_weights=accepted_weights)
+                    names_and_parameters = self._get_names_and_parameters()
+                    journal.add_user_parameters(names_and_parameters)
+                    journal.number_of_simulations.append(self.simulation_counter)
+                    journal.flush()
+
+            self._add_profile_to_journal(journal, aStep)
 
             # 4: Check probability of acceptance lower than acceptance_cutoff
-            if prob_acceptance < acceptance_cutoff:
+            if prob_acceptance < acceptance_cutoff or budget_exhausted:
                 break
 
+            if aStep < steps - 1:
+                self._save_checkpoint(aStep, journal, alpha_accepted_parameters=alpha_accepted_parameters,
+                                      alpha_accepted_weights=alpha_accepted_weights,
+                                      alpha_accepted_dist=alpha_accepted_dist, accepted_cov_mats=accepted_cov_mats,
+                                      epsilon=epsilon)
+
         # Add epsilon_arr to the journal
         journal.configuration["epsilon_arr"] = epsilon
+        self._add_budget_to_journal(journal)
+        journal.flush()
+        self._remove_checkpoint()
 
         return journal
 
-    def _update_broadcasts(self, accepted_dist):
-        def destroy(bc):
-            if bc != None:
-                bc.unpersist
-                # bc.destroy
-            self.accepted_dist_bds = self.backend.broadcast(accepted_dist)
-
     # define helper functions for map step
     def _accept_parameter(self, rng, npc=None):
         """
@@ -2478,11 +3263,11 @@ class APMCABC(BaseDiscrepancy, InferenceMethod):
             distance = self.distance.distance(self.accepted_parameters_manager.observations_bds.value(), y_sim)
 
             prior_prob = self.pdf_of_prior(self.model, perturbation_output[1])
-            denominator = 0.0
-            for i in range(len(self.accepted_parameters_manager.accepted_weights_bds.value())):
-                pdf_value = self.kernel.pdf(mapping_for_kernels, self.accepted_parameters_manager,
-                                            self.accepted_parameters_manager.accepted_parameters_bds.value()[i], perturbation_output[1])
-                denominator += self.accepted_parameters_manager.accepted_weights_bds.value()[i, 0] * pdf_value
+            # The kernel parameters hold the surviving particles, so the kernel densities of the new particle
+            # against all of them are evaluated in a single vectorized call
+            pdf_values = self.kernel.population_pdf(mapping_for_kernels, self.accepted_parameters_manager,
+                                                    perturbation_output[1])
+            denominator = np.dot(self.accepted_parameters_manager.accepted_weights_bds.value().reshape(-1), pdf_values)
             weight = 1.0 * prior_prob / denominator
 
         return (self.get_parameters(self.model), distance, weight, counter)
@@ -2523,6 +3308,8 @@ class SMCABC(BaseDiscrepancy, InferenceMethod):
 
     backend = None
 
+    _refits_statistics = True
+
     def __init__(self, root_models, distances, backend, kernel = None, seed=None):
         self.model = root_models
         # We define the joint Linear combination distance using all the distances for each individual models
@@ -2591,18 +3378,19 @@ class SMCABC(BaseDiscrepancy, InferenceMethod):
         self.sample_from_prior(rng=self.rng)
 
         self.accepted_parameters_manager.broadcast(self.backend, observations)
+        self._start_budget()
         self.n_samples = n_samples
         self.n_samples_per_param = n_samples_per_param
 
         if(journal_file is None):
-            journal = Journal(full_output)
+            journal = self._create_journal(full_output)
             journal.configuration["type_model"] = [type(model).__name__ for model in self.model]
             journal.configuration["type_dist_func"] = type(self.distance).__name__
             journal.configuration["n_samples"] = self.n_samples
             journal.configuration["n_samples_per_param"] = self.n_samples_per_param
             journal.configuration["steps"] = steps
         else:
-            journal = Journal.fromFile(journal_file)
+            journal = self._create_journal(full_output, journal_file)
 
         accepted_parameters = None
         accepted_weights = None
@@ -2616,8 +3404,14 @@ class SMCABC(BaseDiscrepancy, InferenceMethod):
         # Define epsilon_init
         epsilon = [10000]
 
+        start_step, state = self._restore_checkpoint()
+        if state is not None:
+            accepted_parameters, accepted_weights = state["accepted_parameters"], state["accepted_weights"]
+            accepted_cov_mats, accepted_y_sim = state["accepted_cov_mats"], state["accepted_y_sim"]
+            epsilon = state["epsilon"]
+
         # main SMC ABC algorithm
-        for aStep in range(0, steps):
+        for aStep in range(start_step, steps):
             self.logger.info("SMCABC iteration {}".format(aStep))
 
             if(aStep==0 and journal_file is not None):
@@ -2646,61 +3440,65 @@ class SMCABC(BaseDiscrepancy, InferenceMethod):
                 break
 
             # 0: Compute the Epsilon
-            if accepted_y_sim != None:
-                self.logger.info("Compute epsilon, might take a while")
-                # Compute epsilon for next step
-                fun = lambda epsilon_var: self._compute_epsilon(epsilon_var, \
-                                                                epsilon, observations, accepted_y_sim, accepted_weights,
-                                                                n_samples, n_samples_per_param, alpha)
-                epsilon_new = self._bisection(fun, epsilon_final, epsilon[-1], 0.001)
-                if epsilon_new < epsilon_final:
-                    epsilon_new = epsilon_final
-                epsilon.append(epsilon_new)
+            with self._phase("epsilon"):
+                if accepted_y_sim != None:
+                    self.logger.info("Compute epsilon, might take a while")
+                    # Compute epsilon for next step
+                    fun = lambda epsilon_var: self._compute_epsilon(epsilon_var, \
+                                                                    epsilon, observations, accepted_y_sim, accepted_weights,
+                                                                    n_samples, n_samples_per_param, alpha)
+                    epsilon_new = self._bisection(fun, epsilon_final, epsilon[-1], 0.001)
+                    if epsilon_new < epsilon_final:
+                        epsilon_new = epsilon_final
+                    epsilon.append(epsilon_new)
 
             # 1: calculate weights for new parameters
             self.logger.info("Calculating weights")
-            if accepted_y_sim != None:
-                new_weights = np.zeros(shape=(n_samples), )
-                for ind1 in range(n_samples):
-                    numerator = 0.0
-                    denominator = 0.0
-                    for ind2 in range(n_samples_per_param):
-                        numerator += (self.distance.distance(observations, [[accepted_y_sim[ind1][0][ind2]]]) < epsilon[-1])
-                        denominator += (
-                        self.distance.distance(observations, [[accepted_y_sim[ind1][0][ind2]]]) < epsilon[-2])
-                    if denominator != 0.0:
-                        new_weights[ind1] = accepted_weights[ind1] * (numerator / denominator)
-                    else:
-                        new_weights[ind1] = 0
-
-                new_weights = new_weights / sum(new_weights)
-            else:
-                new_weights = np.ones(shape=(n_samples), ) * (1.0 / n_samples)
+            with self._phase("weights"):
+                if accepted_y_sim != None:
+                    new_weights = np.zeros(shape=(n_samples), )
+                    for ind1 in range(n_samples):
+                        numerator = 0.0
+                        denominator = 0.0
+                        for ind2 in range(n_samples_per_param):
+                            numerator += (self.distance.distance(observations, [[accepted_y_sim[ind1][0][ind2]]]) < epsilon[-1])
+                            denominator += (
+                            self.distance.distance(observations, [[accepted_y_sim[ind1][0][ind2]]]) < epsilon[-2])
+                        if denominator != 0.0:
+                            new_weights[ind1] = accepted_weights[ind1] * (numerator / denominator)
+                        else:
+                            new_weights[ind1] = 0
+
+                    new_weights = new_weights / sum(new_weights)
+                else:
+                    new_weights = np.ones(shape=(n_samples), ) * (1.0 / n_samples)
 
             # 2: Resample
-            if accepted_y_sim != None and pow(sum(pow(new_weights, 2)), -1) < resample:
-                self.logger.info("Resampling")
-                # Weighted resampling:
-                index_resampled = self.rng.choice(np.arange(n_samples), n_samples, replace=1, p=new_weights)
-                accepted_parameters = accepted_parameters[index_resampled]
-                new_weights = np.ones(shape=(n_samples), ) * (1.0 / n_samples)
+            with self._phase("resample"):
+                if accepted_y_sim != None and pow(sum(pow(new_weights, 2)), -1) < resample:
+                    self.logger.info("Resampling")
+                    # Weighted resampling:
+                    index_resampled = self.rng.choice(np.arange(n_samples), n_samples, replace=1, p=new_weights)
+                    accepted_parameters = accepted_parameters[index_resampled]
+                    new_weights = np.ones(shape=(n_samples), ) * (1.0 / n_samples)
 
             # Update the weights
             accepted_weights = new_weights.reshape(len(new_weights), 1)
 
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
-                                                              accepted_weights=accepted_weights)
-            if(accepted_y_sim is not None):
-                kernel_parameters = []
-                for kernel in self.kernel.kernels:
-                    kernel_parameters.append(
-                        self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
+            with self._phase("covariance"):
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
+                                                                  accepted_weights=accepted_weights)
+                if(accepted_y_sim is not None):
+                    kernel_parameters = []
+                    for kernel in self.kernel.kernels:
+                        kernel_parameters.append(
+                            self.accepted_parameters_manager.get_accepted_parameters_bds_values(kernel.models))
 
-                self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
+                    self.accepted_parameters_manager.update_kernel_values(self.backend, kernel_parameters=kernel_parameters)
 
-                accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
+                    accepted_cov_mats = self.kernel.calculate_cov(self.accepted_parameters_manager)
 
-                accepted_cov_mats = [covFactor * cov_mat for cov_mat in accepted_cov_mats]
+                    accepted_cov_mats = [covFactor * cov_mat for cov_mat in accepted_cov_mats]
 
             # 3: Drawing new perturbed samples using MCMC Kernel
             self.logger.debug("drawing new pertubated samples using mcmc kernel")
@@ -2711,19 +3509,22 @@ class SMCABC(BaseDiscrepancy, InferenceMethod):
             rng_and_index_pds = self.backend.parallelize(rng_and_index_arr)
 
             # print("INFO: Broadcasting parameters.")
-            self.epsilon = epsilon
+            with self._phase("broadcast"):
+                self.epsilon = epsilon
 
-            self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
-                                                              accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats)
-            self._update_broadcasts(accepted_y_sim)
+                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters,
+                                                                  accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats)
+                self._update_broadcasts(accepted_y_sim)
 
             # calculate resample parameters
             self.logger.info("Drawing perturbed sampless")
-            if which_mcmc_kernel == 0:
-                params_and_ysim_pds = self.backend.map(self._accept_parameter, rng_and_index_pds)
-            else:
-                params_and_ysim_pds = self.backend.map(self._accept_parameter_r_hit_kernel, rng_and_index_pds)
-            params_and_ysim = self.backend.collect(params_and_ysim_pds)
+            with self._phase("simulate"):
+                self._update_particle_budget(n_samples)
+                if which_mcmc_kernel == 0:
+                    params_and_ysim_pds = self.backend.map(self._accept_parameter, rng_and_index_pds)
+                else:
+                    params_and_ysim_pds = self.backend.map(self._accept_parameter_r_hit_kernel, rng_and_index_pds)
+                params_and_ysim = self.backend.collect(params_and_ysim_pds)
             new_parameters, new_y_sim, distances, counter = [list(t) for t in zip(*params_and_ysim)]
             distances = np.array(distances)
 
@@ -2733,21 +3534,46 @@ class SMCABC(BaseDiscrepancy, InferenceMethod):
             # Update the parameters
             accepted_parameters = new_parameters
             accepted_y_sim = new_y_sim
+            self._add_diagnostics_to_journal(journal, aStep, accepted_parameters, accepted_weights)
+
+            budget_exhausted = self._budget_exhausted()
+            with self._phase("journal"):
+                if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and (aStep == steps - 1 or budget_exhausted)):
+                    self.logger.info("Saving configuration to output journal")
+                    self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters)
+                    journal.add_accepted_parameters(accepted_parameters)
+                    journal.add_distances(distances)
+                    journal.add_weights(accepted_weights)
+                    journal.add_opt_values(accepted_y_sim)
+
+                    names_and_parameters = self._get_names_and_parameters()
+                    journal.add_user_parameters(names_and_parameters)
+                    journal.number_of_simulations.append(self.simulation_counter)
+                    journal.flush()
 
-            if (full_output == 1 and aStep <= steps - 1) or (full_output == 0 and aStep == steps - 1):
-                self.logger.info("Saving configuration to output journal")
-                self.accepted_parameters_manager.update_broadcast(self.backend, accepted_parameters=accepted_parameters)
-                journal.add_accepted_parameters(copy.deepcopy(accepted_parameters))
-                journal.add_distances(copy.deepcopy(distances))
-                journal.add_weights(copy.deepcopy(accepted_weights))
-                journal.add_opt_values(copy.deepcopy(accepted_y_sim))
+            if self.statistics_learning is not None and aStep < steps - 1 and not budget_exhausted:
+                with self._phase("statistics"):
+                    # the last threshold is moved to the scale of the refitted statistics, keeping the fraction of the
+                    # simulated data points below it
+                    fraction = np.mean(self._data_point_distances(observations, accepted_y_sim) < epsilon[-1])
+                    self._refit_statistics(accepted_parameters, accepted_y_sim)
+                    epsilon[-1] = np.quantile(self._data_point_distances(observations, accepted_y_sim), fraction)
 
-                names_and_parameters = self._get_names_and_parameters()
-                journal.add_user_parameters(names_and_parameters)
-                journal.number_of_simulations.append(self.simulation_counter)
+            self._add_profile_to_journal(journal, aStep)
+
+            if budget_exhausted:
+                break
+
+            if aStep < steps - 1:
+                self._save_checkpoint(aStep, journal, accepted_parameters=accepted_parameters,
+                                      accepted_weights=accepted_weights, accepted_cov_mats=accepted_cov_mats,
+                                      accepted_y_sim=accepted_y_sim, epsilon=epsilon)
 
         # Add epsilon_arr to the journal
         journal.configuration["epsilon_arr"] = epsilon
+        self._add_budget_to_journal(journal)
+        journal.flush()
+        self._remove_checkpoint()
 
         return journal
 
@@ -2817,6 +3643,11 @@ class SMCABC(BaseDiscrepancy, InferenceMethod):
 
         return midpoint
 
+    def _data_point_distances(self, observations, accepted_y_sim):
+        """Returns the distances between the observations and every data point simulated for the particles."""
+        return np.array([self.distance.distance(observations, [[y_sim[0][ind]]])
+                         for y_sim in accepted_y_sim for ind in range(self.n_samples_per_param)])
+
     def _update_broadcasts(self, accepted_y_sim):
         def destroy(bc):
             if bc != None:
@@ -2,6 +2,7 @@ from abc import ABCMeta, abstractmethod
 import numpy as np
 from sklearn import ensemble
 from abcpy.graphtools import *
+from abcpy.referencetable import reference_table_fingerprint
 
 
 
@@ -96,7 +97,8 @@ class RandomForest(ModelSelections, GraphTools):
     [1] Pudlo, P., Marin, J.-M., Estoup, A., Cornuet, J.-M., Gautier, M. and Robert, C.
     (2016). Reliable ABC model choice via random forests. Bioinformatics, 32 859–866.
     """
-    def __init__(self, model_array, statistics_calc, backend, N_tree = 100, n_try_fraction = 0.5, seed = None):
+    def __init__(self, model_array, statistics_calc, backend, N_tree = 100, n_try_fraction = 0.5, seed = None,
+                 reference_table = None, n_jobs = None):
         """        
         Parameters
         ----------
@@ -106,6 +108,13 @@ class RandomForest(ModelSelections, GraphTools):
             The fraction of number of summary statistics to be considered as the size of 
             the number of covariates randomly sampled at each node by the randomised CART.
             The default value is 0.5.           
+        reference_table : abcpy.referencetable.ReferenceTable, optional
+            Table storing the simulated models, data sets and statistics, from which the reference table is read and
+            which is extended with new simulations if it has less than n_samples rows. The default value is None,
+            meaning the reference table is only kept in memory.
+        n_jobs : integer, optional
+            Number of jobs used to fit the trees of the random forests in parallel on the cores of the scheduler
+            process, e.g. -1 for all the cores (see scikit-learn). The default value is None, meaning one job.
         """
         
         self.model_array = model_array
@@ -116,11 +125,16 @@ class RandomForest(ModelSelections, GraphTools):
 
         self.n_samples_per_param = None
 
+        self.reference_table = reference_table
         self.reference_table_calculated = 0
         self.N_tree = N_tree
         self.n_try_fraction = n_try_fraction
+        self.n_jobs = n_jobs
 
-        self.observations_bds = None
+        # the classifier and the regressor of its error rate are fitted once on the reference table, and shared by
+        # select_model and posterior_probability
+        self.classifier = None
+        self.regressor = None
 
     def select_model(self, observations, n_samples = 1000, n_samples_per_param = 1):
         """        
@@ -138,36 +152,9 @@ class RandomForest(ModelSelections, GraphTools):
             A model which are of type abcpy.probabilisticmodels
             
         """
-        self.n_samples_per_param = n_samples_per_param
-        self.observations_bds = self.backend.broadcast(observations)
+        self._fit_classifier(n_samples, n_samples_per_param)
 
-        # Creation of reference table
-        if self.reference_table_calculated is 0:        
-            # Simulating the data, distance and statistics
-            seed_arr = self.rng.randint(1, n_samples*n_samples, size=n_samples, dtype=np.int32)
-            seed_pds = self.backend.parallelize(seed_arr)     
-
-            model_data_pds = self.backend.map(self._simulate_model_data, seed_pds)
-            model_data = self.backend.collect(model_data_pds)
-            models, data, statistics = [list(t) for t in zip(*model_data)]
-            self.reference_table_models = models
-            self.reference_table_data = data
-            self.reference_table_statistics = np.concatenate(statistics)
-            self.reference_table_calculated = 1
-
-        # Construct a label for the model_array
-        label = np.zeros(shape=(len(self.reference_table_models)))
-        for ind1 in range(len(self.reference_table_models)):  
-            for ind2 in range(len(self.model_array)):
-                if self.reference_table_models[ind1] == self.model_array[ind2]:
-                    label[ind1] = ind2 
-
-        # Define the classifier 
-        classifier = ensemble.RandomForestClassifier(n_estimators = self.N_tree, \
-        max_features=int(self.n_try_fraction*self.reference_table_statistics.shape[1]), bootstrap=True, random_state=self.seed)
-        classifier.fit(self.reference_table_statistics, label)            
-
-        return(self.model_array[int(classifier.predict(self.statistics_calc.statistics(observations)))])
+        return(self.model_array[int(self.classifier.predict(self.statistics_calc.statistics(observations))[0])])
 
     def posterior_probability(self, observations, n_samples = 1000, n_samples_per_param = 1):
 
@@ -176,50 +163,94 @@ class RandomForest(ModelSelections, GraphTools):
         ----------
         observations: python list
                     The observed data set.
+        n_samples : integer, optional
+            Number of samples to generate for reference table. The default value is 1000.
+        n_samples_per_param : integer, optional
+            Number of data points in each simulated data set. The default value is 1.
         Returns
         -------
         np.ndarray
             A vector containing the approximate posterior probability of the model chosen.
         """
+        self._fit_classifier(n_samples, n_samples_per_param)
+
+        if self.regressor is None:
+            # Compute missclassification error rate, predicting the stored statistics of the reference table in one call
+            label_index = np.searchsorted(self.classifier.classes_, self.reference_table_models)
+            probabilities = self.classifier.predict_proba(self.reference_table_statistics)
+            pred_error = 1 - probabilities[np.arange(len(label_index)), label_index]
+
+            # Estimate a regression function with prediction error as response on summary statitistics of the
+            # reference table
+            self.regressor = ensemble.RandomForestRegressor(n_estimators = self.N_tree, n_jobs=self.n_jobs,
+                                                           random_state=self.seed)
+            self.regressor.fit(self.reference_table_statistics, pred_error)
+
+        return(1-self.regressor.predict(self.statistics_calc.statistics(observations)))
+
+    def _fit_classifier(self, n_samples, n_samples_per_param):
+        """
+        Simulates the reference table, unless it was already simulated with the same sizes, and fits the classifier on
+        it, unless it was already fitted.
+
+        Parameters
+        ----------
+        n_samples : integer
+            Number of samples in the reference table.
+        n_samples_per_param : integer
+            Number of data points in each simulated data set.
+        """
+        if self.reference_table_calculated == 0 or self.n_samples_per_param != n_samples_per_param or \
+                len(self.reference_table_models) != n_samples:
+            self.n_samples_per_param = n_samples_per_param
+            # the fitted forests are not sent to the workers simulating the reference table
+            self.classifier = None
+            self.regressor = None
+            self._compute_reference_table(n_samples)
+
+        if self.classifier is None:
+            # Define the classifier, labelling the rows by the indices of their models in model_array
+            self.classifier = ensemble.RandomForestClassifier(
+                n_estimators=self.N_tree, bootstrap=True, n_jobs=self.n_jobs,
+                max_features=int(self.n_try_fraction*self.reference_table_statistics.shape[1]), random_state=self.seed)
+            self.classifier.fit(self.reference_table_statistics, self.reference_table_models)
+
+    def _compute_reference_table(self, n_samples):
+        """
+        Simulates the reference table, reusing the rows of the persistent reference table if one was provided. Only
+        the indices of the models in model_array and the statistics of the simulations are kept in memory.
+
+        Parameters
+        ----------
+        n_samples : integer
+            Number of samples in the reference table.
+        """
+        n_simulations = n_samples
+        if self.reference_table is not None:
+            self.reference_table.check_fingerprint(
+                reference_table_fingerprint(self.model_array, self.statistics_calc, self.n_samples_per_param))
+            n_simulations = max(n_samples - len(self.reference_table), 0)
 
-        self.n_samples_per_param = 1
-        self.observations_bds = self.backend.broadcast(observations)
-        # Creation of reference table
-        if self.reference_table_calculated is 0:        
+        if n_simulations > 0:
             # Simulating the data, distance and statistics
-            seed_arr = self.rng.randint(1, n_samples*n_samples, size=n_samples, dtype=np.int32)
+            # rows of a reference table are reused across runs, so their seeds are drawn from the full range
+            high = n_samples*n_samples if self.reference_table is None else np.iinfo(np.int32).max
+            seed_arr = self.rng.randint(1, high, size=n_simulations, dtype=np.int32)
             seed_pds = self.backend.parallelize(seed_arr)     
 
             model_data_pds = self.backend.map(self._simulate_model_data, seed_pds)
             model_data = self.backend.collect(model_data_pds)
             models, data, statistics = [list(t) for t in zip(*model_data)]
-            self.reference_table_models = models
-            self.reference_table_data = data
+            self.reference_table_models = np.array(models, dtype=int)
             self.reference_table_statistics = np.concatenate(statistics)
-            self.reference_table_calculated = 1
-        
-        # Construct a label for the model_array
-        label = np.zeros(shape=(len(self.reference_table_models)))
-        for ind1 in range(len(self.reference_table_models)):  
-            for ind2 in range(len(self.model_array)):
-                if self.reference_table_models[ind1] == self.model_array[ind2]:
-                    label[ind1] = ind2 
-
-        # Define the classifier 
-        classifier = ensemble.RandomForestClassifier(n_estimators = self.N_tree, \
-        max_features=int(self.n_try_fraction*self.reference_table_statistics.shape[1]), bootstrap=True, random_state=self.seed)
-        classifier.fit(self.reference_table_statistics, label)  
-
-        pred_error = np.zeros(len(self.reference_table_models),)
-        # Compute missclassification error rate
-        for ind in range(len(self.reference_table_models)):
-            pred_error[ind] = 1 - classifier.predict_proba(self.statistics_calc.statistics(self.reference_table_data[ind]))[0][int(label[ind])] 
 
-        # Estimate a regression function with prediction error as response on summary statitistics of the reference table                
-        regressor = ensemble.RandomForestRegressor(n_estimators = self.N_tree)
-        regressor.fit(self.reference_table_statistics,pred_error)
+            if self.reference_table is not None:
+                self.reference_table.append(models=models, data=data, statistics=statistics)
 
-        return(1-regressor.predict(self.statistics_calc.statistics(observations)))
+        if self.reference_table is not None:
+            self.reference_table_models = np.array(self.reference_table.models[:n_samples], dtype=int)
+            self.reference_table_statistics = np.concatenate(self.reference_table.read('statistics', n_samples))
+        self.reference_table_calculated = 1
 
     def _simulate_model_data(self, seed):
         """
@@ -233,14 +264,16 @@ class RandomForest(ModelSelections, GraphTools):
             value of a seed to be used for reseeding
         Returns
         -------
-        np.array
-            accepted parameter
+        tuple
+            the index of the simulated model in model_array, the simulated data set if it is stored in the persistent
+            reference table (None otherwise) and its statistics
         """
         # reseed random number genearator
         rng = np.random.RandomState(seed)
         len_model_array = len(self.model_array)
-        model = self.model_array[int(sum(np.linspace(0, len_model_array - 1, len_model_array) \
-                                         * rng.multinomial(1, (1 / len_model_array) * np.ones(len_model_array))))]
+        model_index = int(sum(np.linspace(0, len_model_array - 1, len_model_array) \
+                              * rng.multinomial(1, (1 / len_model_array) * np.ones(len_model_array))))
+        model = self.model_array[model_index]
         self.sample_from_prior([model], rng=rng)
         y_sim = model.forward_simulate(model.get_input_values(), self.n_samples_per_param, rng=rng)
         while(y_sim[0] is False):
@@ -248,4 +281,5 @@ class RandomForest(ModelSelections, GraphTools):
         y_sim = y_sim[0].tolist()
         statistics = self.statistics_calc.statistics(y_sim)
 
-        return (model, y_sim, statistics)
\ No newline at end of file
+        # the raw data sets are only sent back to be stored in the persistent reference table
+        return (model_index, y_sim if self.reference_table is not None else None, statistics)
\ No newline at end of file
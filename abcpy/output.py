@@ -1,3 +1,6 @@
+import copy
+import json
+import os
 import pickle
 import warnings
 
@@ -15,15 +18,28 @@ class Journal:
     ----------
     parameters : numpy.array
         a nxpxt matrix
+    parameter_arrays : list
+        for every time step, a nxp matrix containing the parameters of the n samples
+    parameter_columns : Python dictionary
+        for every parameter name, the (start, stop) indices of its columns in the parameter_arrays
     weights : numpy.array
         a nxt matrix
     opt_value : numpy.array
         nxp matrix containing for each parameter the evaluated objective function for every time step
+    diagnostics : list
+        for every time step, a dictionary with the effective sample size and the weighted means, variances and
+        quantiles of the parameters
+    profiles : list
+        for every time step, a dictionary with the time spent in the phases of the inference scheme and counters
     configuration : Python dictionary
         dictionary containing the schemes configuration parameters
 
     """
 
+    # directory the journal is streamed to, see stream_to()
+    _stream_path = None
+    _stream_fsync = True
+
     def __init__(self, type):
         """
         Initializes a new output journal of given type.
@@ -37,9 +53,13 @@ class Journal:
 
         self.accepted_parameters = []
         self.names_and_parameters = []
+        self.parameter_arrays = []
+        self.parameter_columns = {}
         self.weights = []
         self.distances = []
         self.opt_values = []
+        self.diagnostics = []
+        self.profiles = []
         self.configuration = {}
 
         if type not in [0, 1]:
@@ -48,6 +68,26 @@ class Journal:
             self._type = type
 
         self.number_of_simulations = []
+        self._summaries = {}
+
+    def __getstate__(self):
+        # a pickled copy of the journal does not keep writing to the stream of the original one
+        state = self.__dict__.copy()
+        state.pop('_stream_path', None)
+        state.pop('_summaries', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._summaries = {}
+        if "parameter_arrays" not in state:
+            # journals saved by earlier versions only store the parameters as dictionaries
+            self.parameter_arrays = [None] * len(self.names_and_parameters)
+            self.parameter_columns = {}
+        if "diagnostics" not in state:
+            self.diagnostics = []
+        if "profiles" not in state:
+            self.profiles = []
 
     @classmethod
     def fromFile(cls, filename):
@@ -55,12 +95,14 @@ class Journal:
 
         Notes
         -----
-        To store a journal use Journal.save(filename).
+        To store a journal use Journal.save(filename) or, in the columnar format, Journal.save_columnar(path).
 
         Parameters
         ----------
         filename: string
-            The string representing the location of a file
+            The string representing the location of a file, or of the directory of a journal stored in the columnar
+            format. In the latter case the generations are not read until they are accessed, and their arrays are
+            memory-mapped.
             
         Returns
         -------
@@ -74,23 +116,61 @@ class Journal:
 
         """
 
+        if os.path.isdir(filename):
+            return cls._from_columnar(filename)
+
         with open(filename, 'rb') as input:
             journal = pickle.load(input)
         return journal
 
+    @classmethod
+    def _from_columnar(cls, path):
+        with open(os.path.join(path, _MANIFEST)) as f:
+            manifest = json.load(f)
+        with open(os.path.join(path, _METADATA), 'rb') as f:
+            metadata = pickle.load(f)
+
+        journal = cls(manifest["type"])
+        for field in _COLUMNAR_FIELDS:
+            setattr(journal, field, _JournalColumn(path, manifest["fields"].get(field, [])))
+        journal.configuration = metadata["configuration"]
+        journal.number_of_simulations = metadata["number_of_simulations"]
+        journal.parameter_columns = metadata.get("parameter_columns", {})
+        if "parameter_arrays" not in manifest["fields"]:
+            journal.parameter_arrays = [None] * len(journal.names_and_parameters)
+        return journal
+
     def add_user_parameters(self, names_and_params):
         """
         Saves the provided parameters and names of the probabilistic models corresponding to them. If type==0, old parameters get overwritten.
 
+        The parameters are also stored as one nxp matrix, with the columns of each parameter given by
+        parameter_columns, from which the posterior summaries are computed.
+
         Parameters
         ----------
         names_and_params: list
             Each entry is a tupel, where the first entry is the name of the probabilistic model, and the second entry is the parameters associated with this model.
         """
-        if (self._type == 0):
-            self.names_and_parameters = [dict(names_and_params)]
-        else:
-            self.names_and_parameters.append(dict(names_and_params))
+        names_and_params = dict(names_and_params)
+        blocks = []
+        columns = {}
+        start = 0
+        try:
+            for name, values in names_and_params.items():
+                block = np.array(values, dtype=float)
+                blocks.append(block.reshape(len(values), -1))
+                columns[name] = (start, start + blocks[-1].shape[1])
+                start += blocks[-1].shape[1]
+            parameter_array = np.hstack(blocks) if blocks else None
+        except ValueError:
+            # parameters which are not numerical, or whose shape changes between samples, are only kept as dictionaries
+            parameter_array = None
+
+        self._add("names_and_parameters", names_and_params, snapshot=False)
+        self._add("parameter_arrays", parameter_array, snapshot=False)
+        if parameter_array is not None:
+            self.parameter_columns = columns
 
     def add_accepted_parameters(self, accepted_parameters):
         """
@@ -101,11 +181,7 @@ class Journal:
         accepted_parameters: list
         """
 
-        if self._type == 0:
-            self.accepted_parameters = [accepted_parameters]
-
-        if self._type == 1:
-            self.accepted_parameters.append(accepted_parameters)
+        self._add("accepted_parameters", accepted_parameters)
 
     def add_weights(self, weights):
         """
@@ -117,11 +193,7 @@ class Journal:
             vector containing n weigths
         """
 
-        if self._type == 0:
-            self.weights = [weights]
-
-        if self._type == 1:
-            self.weights.append(weights)
+        self._add("weights", weights)
 
     def add_distances(self, distances):
         """
@@ -133,11 +205,7 @@ class Journal:
             vector containing n distances
         """
 
-        if self._type == 0:
-            self.distances = [distances]
-
-        if self._type == 1:
-            self.distances.append(distances)
+        self._add("distances", distances)
 
     def add_opt_values(self, opt_values):
         """
@@ -149,11 +217,68 @@ class Journal:
             vector containing n evaluations of the schemes objective function
         """
 
-        if self._type == 0:
-            self.opt_values = [opt_values]
+        self._add("opt_values", opt_values)
+
+    def add_diagnostics(self, diagnostics):
+        """
+        Saves the diagnostics of the population of a time step, computed by the inference schemes. If type==0, old
+        diagnostics get overwritten.
+
+        Parameters
+        ----------
+        diagnostics: dictionary
+            dictionary containing the effective sample size 'ess', and dictionaries 'mean', 'var' and 'quantiles'
+            with the weighted means, variances and quantiles at levels 'quantile_levels' of every parameter
+        """
+
+        self._add("diagnostics", diagnostics, snapshot=False)
+
+    def get_diagnostics(self, iteration=None):
+        """
+        Returns the diagnostics of a time step, see add_diagnostics.
+
+        For intermediate results, pass the iteration.
 
-        if self._type == 1:
-            self.opt_values.append(opt_values)
+        Parameters
+        ----------
+        iteration: int
+            specify the iteration for which to return diagnostics
+        """
+
+        if iteration is None:
+            return self.diagnostics[-1]
+        else:
+            return self.diagnostics[iteration]
+
+    def add_profile(self, profile):
+        """
+        Saves the profile of a time step, recorded by an abcpy.utils.Profiler. If type==0, old profiles get overwritten.
+
+        Parameters
+        ----------
+        profile: dictionary
+            dictionary containing the time step 'step', its duration 'total_time', the time spent in every phase
+            'time' and the 'counters'
+        """
+
+        self._add("profiles", profile, snapshot=False)
+
+    def get_profile(self, iteration=None):
+        """
+        Returns the profile of a time step, see add_profile.
+
+        For intermediate results, pass the iteration.
+
+        Parameters
+        ----------
+        iteration: int
+            specify the iteration for which to return the profile
+        """
+
+        if iteration is None:
+            return self.profiles[-1]
+        else:
+            return self.profiles[iteration]
 
     def save(self, filename):
         """
@@ -168,6 +293,114 @@ class Journal:
         with open(filename, 'wb') as output:
             pickle.dump(self, output, -1)
 
+    def save_columnar(self, path):
+        """
+        Stores the journal to disk in a columnar format: a directory containing one .npy file per generation and field,
+        and a manifest describing them. Journal.fromFile(path) opens it without reading the generations, which are
+        memory-mapped when they are accessed, such that e.g. get_weights(i) or posterior_mean(i) only read the arrays
+        of generation i.
+
+        Parameters
+        ----------
+        path: string
+            the directory to store the journal to; it is created if it does not exist.
+        """
+        os.makedirs(path, exist_ok=True)
+        fields = {field: self._save_column(path, field, fsync=True) for field in _COLUMNAR_FIELDS}
+        self._write_manifest(path, fields, fsync=True)
+
+    def stream_to(self, path, fsync=True):
+        """
+        Stores the journal to disk in the columnar format (see save_columnar) and from then on writes every generation
+        added to the journal to disk as soon as it is added, such that the run can be recovered with
+        Journal.fromFile(path) if it is interrupted. The generations are not kept in memory any more, and are
+        memory-mapped from disk when accessed.
+
+        Inference schemes stream their journal when requested with InferenceMethod.stream_journal.
+
+        Parameters
+        ----------
+        path: string
+            the directory to stream the journal to; it is created if it does not exist. It can be the directory of
+            the journal itself, if this was opened with Journal.fromFile.
+        fsync: boolean, optional
+            Whether the files are synced to the disk after every generation, such that they survive a crash of the
+            machine and not only of the process. The default value is True.
+        """
+        os.makedirs(path, exist_ok=True)
+        for field in _COLUMNAR_FIELDS:
+            setattr(self, field, _JournalColumn(path, self._save_column(path, field, fsync)))
+        self._stream_path = path
+        self._stream_fsync = fsync
+        self.flush()
+
+    def flush(self):
+        """
+        Writes the configuration and the number of simulations of a journal streamed to disk, and records the
+        generations written so far as a checkpoint from which the journal can be recovered. It does nothing if the
+        journal is not streamed.
+        """
+        if self._stream_path is not None:
+            fields = {field: getattr(self, field).entries for field in _COLUMNAR_FIELDS}
+            self._write_manifest(self._stream_path, fields, self._stream_fsync)
+
+    def _add(self, field, value, snapshot=True):
+        """Adds the value of a field at a new generation, replacing the previous one if type==0."""
+        self._summaries.clear()
+        if self._stream_path is None:
+            # the journal keeps a snapshot, as the inference schemes may update their arrays in place later on
+            if snapshot:
+                value = value.copy() if isinstance(value, np.ndarray) else copy.deepcopy(value)
+            if self._type == 0:
+                setattr(self, field, [value])
+            else:
+                getattr(self, field).append(value)
+        else:
+            column = getattr(self, field)
+            index = 0 if self._type == 0 else len(column)
+            column.entries[index:] = [_save_generation(self._stream_path, "{}_{:05d}".format(field, index), value,
+                                                       self._stream_fsync)]
+            self.flush()
+
+    def _generation_counts(self):
+        """Returns the number of generations stored in each field, as recorded by the checkpoints of the samplers."""
+        counts = {field: len(getattr(self, field)) for field in _COLUMNAR_FIELDS}
+        counts["number_of_simulations"] = len(self.number_of_simulations)
+        return counts
+
+    def _truncate(self, counts):
+        """Discards the generations added after _generation_counts returned the given counts."""
+        self._summaries.clear()
+        for field in _COLUMNAR_FIELDS:
+            column = getattr(self, field)
+            if isinstance(column, _JournalColumn):
+                column.entries = column.entries[:counts[field]]
+                column.appended = column.appended[:max(counts[field] - len(column.entries), 0)]
+            else:
+                del column[counts[field]:]
+        del self.number_of_simulations[counts["number_of_simulations"]:]
+
+    def _save_column(self, path, field, fsync):
+        """Stores all generations of a field in the columnar format, and returns their entries in the manifest."""
+        column = getattr(self, field)
+        entries = []
+        for index in range(len(column)):
+            if isinstance(column, _JournalColumn) and index < len(column.entries) and \
+                    os.path.abspath(column.path) == os.path.abspath(path):
+                # generations already stored in the directory are not written again
+                entries.append(column.entries[index])
+            else:
+                entries.append(_save_generation(path, "{}_{:05d}".format(field, index), column[index], fsync))
+        return entries
+
+    def _write_manifest(self, path, fields, fsync):
+        metadata = {"configuration": self.configuration, "number_of_simulations": self.number_of_simulations,
+                    "parameter_columns": self.parameter_columns}
+        _replace_file(os.path.join(path, _METADATA), lambda f: pickle.dump(metadata, f, -1), fsync)
+        # the manifest is written last, such that it only describes complete files
+        manifest = {"type": self._type, "fields": fields}
+        _replace_file(os.path.join(path, _MANIFEST), lambda f: f.write(json.dumps(manifest).encode()), fsync)
+
     def get_parameters(self, iteration=None):
         """
         Returns the parameters from a sampling scheme.
@@ -271,21 +504,12 @@ class Journal:
             random variables
         """
 
-        if iteration is None:
-            endp = len(self.names_and_parameters) - 1
-            params = self.names_and_parameters[endp]
-            weights = self.weights[endp]
-        else:
-            params = self.names_and_parameters[iteration]
-            weights = self.weights[iteration]
-
-        return_value = []
-        for keyind in params.keys():
-            return_value.append((keyind,
-                                 np.average(np.array(params[keyind]).squeeze(), weights=weights.reshape(len(weights), ),
-                                            axis=0)))
+        def compute(parameters, columns, weights):
+            mean = np.average(parameters, weights=weights, axis=0)
+            return dict((name, mean[start] if stop - start == 1 else mean[start:stop])
+                        for name, (start, stop) in columns.items())
 
-        return dict(return_value)
+        return self._summary("mean", iteration, compute)
 
     def posterior_cov(self, iteration=None):
         """
@@ -299,19 +523,11 @@ class Journal:
             order of the variables in the covariance matrix
         """
 
-        if iteration is None:
-            endp = len(self.names_and_parameters) - 1
-            params = self.names_and_parameters[endp]
-            weights = self.weights[endp]
-        else:
-            params = self.names_and_parameters[iteration]
-            weights = self.weights[iteration]
-
-        joined_params = []
-        for keyind in params.keys():
-            joined_params.append(np.array(params[keyind]).squeeze(axis=1))
+        def compute(parameters, columns, weights):
+            return np.cov(np.transpose(parameters), aweights=weights), columns
 
-        return np.cov(np.transpose(np.hstack(joined_params)), aweights=weights.reshape(len(weights), )), params.keys()
+        cov, columns = self._summary("cov", iteration, compute)
+        return cov, columns.keys()
 
     def posterior_histogram(self, iteration=None, n_bins=10):
         """
@@ -324,20 +540,41 @@ class Journal:
         python list 
             containing two elements (H = np.ndarray, edges = list of p arrays)
         """
-        if iteration is None:
-            endp = len(self.names_and_parameters) - 1
-            params = self.names_and_parameters[endp]
-            weights = self.weights[endp]
-        else:
-            params = self.names_and_parameters[iteration]
-            weights = self.weights[iteration]
 
-        joined_params = []
-        for keyind in params.keys():
-            joined_params.append(np.array(params[keyind]).squeeze(axis=1))
+        def compute(parameters, columns, weights):
+            H, edges = np.histogramdd(parameters, bins=n_bins, weights=weights)
+            return [H, edges]
 
-        H, edges = np.histogramdd(np.hstack(joined_params), bins=n_bins, weights=weights.reshape(len(weights), ))
-        return [H, edges]
+        return self._summary(("histogram", n_bins), iteration, compute)
+
+    def _summary(self, key, iteration, compute):
+        """
+        Computes a summary of the posterior samples of an iteration from their nxp matrix, and memoizes it until the
+        journal is modified. A copy of the memoized value is returned, such that it can be modified by the caller.
+        """
+        n_iterations = len(self.names_and_parameters)
+        index = n_iterations - 1 if iteration is None else iteration
+        if index < 0:
+            index += n_iterations
+        if (key, index) not in self._summaries:
+            parameters, columns = self._parameter_array(index)
+            weights = np.asarray(self.weights[index]).reshape(-1)
+            self._summaries[(key, index)] = compute(parameters, columns, weights)
+        return copy.deepcopy(self._summaries[(key, index)])
+
+    def _parameter_array(self, index):
+        """Returns the nxp matrix of the parameters of an iteration and the columns of every parameter in it."""
+        parameters = self.parameter_arrays[index] if index < len(self.parameter_arrays) else None
+        if parameters is not None:
+            return parameters, self.parameter_columns
+
+        # journals saved by earlier versions, or with non-numerical parameters, only store dictionaries
+        params = self.names_and_parameters[index]
+        blocks = [np.array(params[name]).reshape(len(params[name]), -1) for name in params.keys()]
+        stops = np.cumsum([block.shape[1] for block in blocks])
+        columns = dict((name, (int(stop) - block.shape[1], int(stop)))
+                       for name, block, stop in zip(params.keys(), blocks, stops))
+        return np.hstack(blocks), columns
 
     def plot_posterior_distr(self, parameters_to_show=None, ranges_parameters=None, iteration=None, show_samples=None,
                              single_marginals_only=False, double_marginals_only=False, write_posterior_mean=True,
@@ -689,3 +926,112 @@ class Journal:
             plt.savefig(path_to_save, bbox_inches="tight")
 
         return fig, axes
+
+
+# Fields of the journal holding one entry per generation, stored as separate files in the columnar format
+_COLUMNAR_FIELDS = ("accepted_parameters", "names_and_parameters", "parameter_arrays", "weights", "distances",
+                    "opt_values", "diagnostics", "profiles")
+_MANIFEST = "manifest.json"
+_METADATA = "metadata.pkl"
+
+
+class _JournalColumn(object):
+    """
+    The generations of a field of a journal stored in the columnar format, behaving as a list whose items are read
+    from disk when they are accessed. Generations added after opening the journal are kept in memory.
+    """
+
+    def __init__(self, path, entries):
+        self.path = path
+        self.entries = entries
+        self.appended = []
+
+    def __reduce__(self):
+        # pickling a journal, e.g. with Journal.save, stores the values of the generations
+        return list, (list(self),)
+
+    def __len__(self):
+        return len(self.entries) + len(self.appended)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Generation {} is not in the journal.".format(index))
+        if index >= len(self.entries):
+            return self.appended[index - len(self.entries)]
+        return _load_generation(self.path, self.entries[index])
+
+    def append(self, value):
+        self.appended.append(value)
+
+
+def _replace_file(filename, write, fsync=True):
+    """Writes a file through a temporary one, which atomically replaces it once complete."""
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, 'wb') as f:
+        write(f)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def _save_generation(path, name, value, fsync=True):
+    """
+    Stores the value of a field of the journal at one generation in one or more files with the given name as prefix,
+    and returns the entry describing them in the manifest.
+    """
+    if isinstance(value, dict):
+        return {"kind": "dict", "keys": list(value.keys()),
+                "values": [_save_generation(path, "{}_{}".format(name, index), item, fsync)
+                           for index, item in enumerate(value.values())]}
+
+    if isinstance(value, list) and len(value) > 0 and isinstance(value[0], (list, tuple)):
+        # accepted parameters: one list of parameter values per particle, stored as the rows of a matrix
+        shapes = [list(np.shape(item)) for item in value[0]]
+        try:
+            rows = np.array([np.concatenate([np.ravel(item) for item in particle]) for particle in value], dtype=float)
+        except ValueError:
+            rows = None
+        if rows is not None and rows.ndim == 2 and \
+                all([list(np.shape(item)) for item in particle] == shapes for particle in value):
+            _replace_file(os.path.join(path, name + ".npy"), lambda f: np.save(f, rows, allow_pickle=False), fsync)
+            return {"kind": "rows", "file": name + ".npy", "shapes": shapes}
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        array = np.asarray(value)
+    if array.dtype != object:
+        _replace_file(os.path.join(path, name + ".npy"), lambda f: np.save(f, array, allow_pickle=False), fsync)
+        return {"kind": "array", "file": name + ".npy"}
+
+    # values that are not numerical arrays are pickled
+    _replace_file(os.path.join(path, name + ".pkl"), lambda f: pickle.dump(value, f, -1), fsync)
+    return {"kind": "pickle", "file": name + ".pkl"}
+
+
+def _load_generation(path, entry):
+    """Reads the value of a field of the journal at one generation, memory-mapping its arrays."""
+    if entry["kind"] == "dict":
+        return dict(zip(entry["keys"], [_load_generation(path, item) for item in entry["values"]]))
+
+    if entry["kind"] == "pickle":
+        with open(os.path.join(path, entry["file"]), 'rb') as f:
+            return pickle.load(f)
+
+    array = np.load(os.path.join(path, entry["file"]), mmap_mode='r')
+    if entry["kind"] == "rows":
+        split_points = np.cumsum([int(np.prod(shape)) for shape in entry["shapes"]])[:-1]
+        return [[item.reshape(shape) for item, shape in zip(np.split(row, split_points), entry["shapes"])]
+                for row in array]
+    if array.ndim == 0:
+        # scalars are returned as such
+        return array[()]
+    return array
@@ -5,6 +5,7 @@ from scipy.special import gamma
 from scipy.stats import multivariate_normal
 
 from abcpy.probabilisticmodels import Continuous
+from abcpy.utils import accounted
 
 
 class PerturbationKernel(metaclass = ABCMeta):
@@ -94,6 +95,54 @@ class PerturbationKernel(metaclass = ABCMeta):
             raise NotImplementedError
 
 
+    def population_pdf(self, accepted_parameters_manager, kernel_index, x):
+        """
+        Calculates the pdf of the kernel at point x, once centered at each of the parameters stored in the
+        kernel_parameters_bds. Kernels should overwrite this with a vectorized implementation; the default evaluates
+        the pdf for every row.
+
+        Parameters
+        ----------
+        accepted_parameters_manager: abcpy.acceptedparametersmanager object
+            The accepted parameters manager that manages all bds objects.
+        kernel_index: integer
+            The index of the kernel in the list of kernels of the joint perturbation kernel.
+        x: list or float
+            The point at which the pdf should be evaluated.
+
+        Returns
+        -------
+        numpy.ndarray:
+            The pdf evaluated at point x for each of the rows of the kernel_parameters_bds.
+        """
+
+        means = accepted_parameters_manager.kernel_parameters_bds.value()[kernel_index]
+        return np.array([self.pdf(accepted_parameters_manager, kernel_index, mean, x) for mean in means]).reshape(-1)
+
+
+def _stack_parameters(values):
+    """
+    Stacks parameter values, as stored row by row in the kernel_parameters_bds, into a two dimensional float array.
+
+    Parameters
+    ----------
+    values: list
+        Each entry contains the values of the parameters of one particle, either as numbers or as arrays.
+
+    Returns
+    -------
+    numpy.ndarray:
+        Array of shape (len(values), d), where d is the total dimension of the parameters.
+    """
+
+    try:
+        return np.array(values, dtype=float).reshape(len(values), -1)
+    except ValueError:
+        # parameters of different dimensions cannot be stacked directly
+        return np.array([np.concatenate([np.array(value, dtype=float).reshape(-1) for value in row])
+                         for row in values])
+
+
 class ContinuousKernel(metaclass = ABCMeta):
     """This abstract base class represents all perturbation kernels acting on continuous parameters."""
 
@@ -168,6 +217,7 @@ class JointPerturbationKernel(PerturbationKernel):
                 models.append(model)
 
 
+    @accounted("perturbation")
     def update(self, accepted_parameters_manager, row_index, rng=np.random.RandomState()):
         """
         Perturbs the parameter values contained in accepted_parameters_manager. Commonly used while perturbing.
@@ -209,6 +259,7 @@ class JointPerturbationKernel(PerturbationKernel):
         return perturbed_values_including_models
 
 
+    @accounted("kernel_pdf")
     def pdf(self, mapping, accepted_parameters_manager, mean, x):
         """
         Calculates the overall pdf of the kernel. Commonly used to calculate weights.
@@ -244,6 +295,41 @@ class JointPerturbationKernel(PerturbationKernel):
         return result
 
 
+    @accounted("kernel_pdf")
+    def population_pdf(self, mapping, accepted_parameters_manager, x):
+        """
+        Calculates the overall pdf of the kernel at point x, once centered at each of the parameters stored in the
+        kernel_parameters_bds. Commonly used to calculate the weights of a new particle against the whole previous
+        population in a single vectorized evaluation, instead of calling pdf once per particle.
+
+        Parameters
+        ----------
+        mapping: list
+            Each entry is a tupel of which the first entry is a abcpy.ProbabilisticModel object, the second entry is the
+            index in the accepted_parameters_bds list corresponding to an output of this model.
+        accepted_parameters_manager: abcpy.AcceptedParametersManager object
+            The AcceptedParametersManager to be used.
+        x: The point at which the pdf should be evaluated.
+
+        Returns
+        -------
+        numpy.ndarray
+            The pdf evaluated at point x for each of the rows of the kernel_parameters_bds.
+        """
+
+        result = 1.
+        for kernel_index, kernel in enumerate(self.kernels):
+            # Define a list containing the parameter values relevant to the current kernel
+            theta = []
+            for kernel_model in kernel.models:
+                for model, model_output_index in mapping:
+                    if(kernel_model==model):
+                        theta.append(x[model_output_index])
+            result = result * kernel.population_pdf(accepted_parameters_manager, kernel_index, theta)
+
+        return result
+
+
 class MultivariateNormalKernel(PerturbationKernel, ContinuousKernel):
     """This class defines a kernel perturbing the parameters using a multivariate normal distribution."""
 
@@ -366,6 +452,31 @@ class MultivariateNormalKernel(PerturbationKernel, ContinuousKernel):
             return multivariate_normal(mean, cov, allow_singular=True).pdf(np.concatenate(x))
 
 
+    def population_pdf(self, accepted_parameters_manager, kernel_index, x):
+        """Calculates the pdf of the kernel at point x, once centered at each row of the kernel_parameters_bds.
+
+        Parameters
+        ----------
+        accepted_parameters_manager: abcpy.AcceptedParametersManager object
+            The AcceptedParametersManager to be used.
+        kernel_index: integer
+            The index of the kernel in the list of kernels in the joint kernel.
+        x: The point at which the pdf should be evaluated.
+
+        Returns
+        -------
+        numpy.ndarray
+            The pdf evaluated at point x for each of the rows of the kernel_parameters_bds.
+        """
+
+        means = _stack_parameters(accepted_parameters_manager.kernel_parameters_bds.value()[kernel_index])
+        cov = np.array(accepted_parameters_manager.accepted_cov_mats_bds.value()[kernel_index]).astype(float)
+        x = _stack_parameters([x])
+        # the density only depends on the difference between x and the mean
+        density = multivariate_normal(np.zeros(means.shape[1]), cov, allow_singular=True).pdf(x - means)
+        return np.array(density).reshape(-1)
+
+
 class MultivariateStudentTKernel(PerturbationKernel, ContinuousKernel):
     def __init__(self, models, df):
         """This class defines a kernel perturbing the parameters using a multivariate normal distribution.
@@ -533,6 +644,39 @@ class MultivariateStudentTKernel(PerturbationKernel, ContinuousKernel):
 
             return density
 
+    def population_pdf(self, accepted_parameters_manager, kernel_index, x):
+        """Calculates the pdf of the kernel at point x, once centered at each row of the kernel_parameters_bds.
+
+        Parameters
+        ----------
+        accepted_parameters_manager: abcpy.AcceptedParametersManager object
+            The AcceptedParametersManager to be used.
+        kernel_index: integer
+            The index of the kernel in the list of kernels in the joint kernel.
+        x: The point at which the pdf should be evaluated.
+
+        Returns
+        -------
+        numpy.ndarray
+            The pdf evaluated at point x for each of the rows of the kernel_parameters_bds.
+        """
+
+        means = _stack_parameters(accepted_parameters_manager.kernel_parameters_bds.value()[kernel_index])
+        cov = np.array(accepted_parameters_manager.accepted_cov_mats_bds.value()[kernel_index]).astype(float)
+        cov = cov.reshape(means.shape[1], means.shape[1])
+
+        v = self.df
+        p = means.shape[1]
+
+        numerator = gamma((v + p) / 2)
+        denominator = gamma(v / 2) * pow(v * np.pi, p / 2.) * np.sqrt(abs(np.linalg.det(cov)))
+        normalizing_const = numerator / denominator
+        diff = _stack_parameters([x]) - means
+        tmp = 1 + 1 / v * np.einsum('ij,jk,ik->i', diff, np.linalg.inv(cov), diff)
+        density = normalizing_const * pow(tmp, -((v + p) / 2.))
+
+        return density
+
 class RandomWalkKernel(PerturbationKernel, DiscreteKernel):
     def __init__(self, models):
         """
@@ -613,6 +757,28 @@ class RandomWalkKernel(PerturbationKernel, DiscreteKernel):
         return 1./3
 
 
+    def population_pdf(self, accepted_parameters_manager, kernel_index, x):
+        """
+        Calculates the pmf of the kernel at point x, once centered at each row of the kernel_parameters_bds.
+
+        Parameters
+        ----------
+        accepted_parameters_manager: abcpy.AcceptedParametersManager object
+            The AcceptedParametersManager to be used.
+        kernel_index: integer
+            The index of the kernel in the list of kernels of the joint kernel.
+        x: The point at which the pmf should be evaluated.
+
+        Returns
+        -------
+        numpy.ndarray
+            The pmf evaluated at point x for each of the rows of the kernel_parameters_bds.
+        """
+
+        n = len(accepted_parameters_manager.kernel_parameters_bds.value()[kernel_index])
+        return np.full(n, 1./3)
+
+
 class DefaultKernel(JointPerturbationKernel):
     def __init__(self, models):
         """
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import os
+from numbers import Number
+
+import numpy as np
+
+from abcpy.probabilisticmodels import Hyperparameter
+from abcpy.statistics import Statistics
+
+
+def reference_table_fingerprint(models, statistics_calc=None, n_samples_per_param=None):
+    """
+    Computes a fingerprint of the prior, the models and the statistics used to generate the rows of a reference table.
+    Two setups with the same fingerprint produce rows that are exchangeable, such that a table built by one can be
+    reused by the other.
+
+    The fingerprint includes the structure of the graph of the models (classes and names of all the nodes), the values
+    of the hyperparameters, the number of data points in each simulated data set and the class and public numerical
+    settings of the statistics calculator, including its learned coefficients or network weights.
+
+    Parameters
+    ----------
+    models: list
+        List of abcpy.ProbabilisticModel objects, the root models of the graph.
+    statistics_calc: abcpy.statistics.Statistics, optional
+        Statistics object used to compute the statistics stored in the table. The default value is None, meaning the
+        table does not store statistics.
+    n_samples_per_param: integer, optional
+        Number of data points in each simulated data set.
+
+    Returns
+    -------
+    str
+        The hexadecimal digest of the fingerprint.
+    """
+    digest = hashlib.sha1()
+    digest.update(repr(n_samples_per_param).encode())
+    for model in models:
+        _update_with_model(digest, model)
+    if statistics_calc is not None:
+        _update_with_object(digest, statistics_calc)
+    return digest.hexdigest()
+
+
+def _update_with_model(digest, model):
+    """Adds a node of the graph and, recursively, all its parents to the digest."""
+    digest.update(("(%s:%s" % (type(model).__name__, model.name)).encode())
+    if isinstance(model, Hyperparameter):
+        digest.update(np.asarray(model._fixed_values, dtype=float).tobytes())
+    for parent in model.get_input_models():
+        _update_with_model(digest, parent)
+    digest.update(b")")
+
+
+def _update_with_object(digest, obj):
+    """Adds the class and the public numerical attributes of an object, e.g. a statistics calculator, to the digest;
+    the private attributes, such as buffers filled by the computations, are not part of the settings."""
+    digest.update(("<%s" % type(obj).__name__).encode())
+    for key, value in sorted(vars(obj).items()):
+        if key.startswith("_"):
+            continue
+        digest.update(key.encode())
+        if value is None or isinstance(value, (Number, str)):
+            digest.update(repr(value).encode())
+        elif isinstance(value, np.ndarray):
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif hasattr(value, "state_dict"):
+            # torch networks: hash their weights
+            for name, tensor in value.state_dict().items():
+                digest.update(name.encode())
+                digest.update(tensor.detach().cpu().numpy().tobytes())
+        elif isinstance(value, Statistics):
+            _update_with_object(digest, value)
+        else:
+            digest.update(type(value).__name__.encode())
+    digest.update(b">")
+
+
+class ReferenceTable(object):
+    """
+    A persistent, append-only table of simulations from the prior predictive distribution, stored in a directory. It
+    can be passed to RejectionABC.sample, to the StatisticsLearning classes and to RandomForest, which read the rows
+    already in the table and append the simulations they need in addition, such that simulations are reused across
+    runs instead of being regenerated.
+
+    Every row holds up to four fields, each of fixed shape and stored in its own binary file: the flattened
+    `parameters`, the `statistics` of the simulated data set, the simulated `data` and, for model selection, the index
+    of the `models` that was simulated. The fields are read as read-only memory-mapped arrays, so that tables larger
+    than the available memory can be used. The manifest of the table records the fields, the number of rows and the
+    fingerprint of the setup that generated them (see reference_table_fingerprint); using the table with a different
+    setup raises a ValueError.
+
+    Rows are appended by writing and syncing the field files first and then atomically replacing the manifest, so an
+    interrupted append leaves the table in its previous state. A table must have at most one writer at a time.
+
+    Parameters
+    ----------
+    path: str
+        Directory of the table; it is created if it does not exist.
+    """
+
+    FIELDS = ('parameters', 'statistics', 'data', 'models')
+
+    def __init__(self, path):
+        self.path = path
+        self._arrays = {}
+
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                self._manifest = json.load(f)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._manifest = {"fingerprint": None, "n_rows": 0, "fields": {}}
+            self._write_manifest()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = {}
+        return state
+
+    def __len__(self):
+        return self._manifest["n_rows"]
+
+    @property
+    def fingerprint(self):
+        return self._manifest["fingerprint"]
+
+    @property
+    def fields(self):
+        return list(self._manifest["fields"])
+
+    @property
+    def parameters(self):
+        return self.read('parameters')
+
+    @property
+    def statistics(self):
+        return self.read('statistics')
+
+    @property
+    def data(self):
+        return self.read('data')
+
+    @property
+    def models(self):
+        return self.read('models')
+
+    def check_fingerprint(self, fingerprint):
+        """
+        Checks that the rows of the table were generated by the setup with the given fingerprint. The fingerprint of an
+        empty table is set to the given one.
+
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of the setup using the table, computed by reference_table_fingerprint.
+        """
+        if self._manifest["fingerprint"] is None:
+            self._manifest["fingerprint"] = fingerprint
+            self._write_manifest()
+        elif self._manifest["fingerprint"] != fingerprint:
+            raise ValueError("The reference table in %s was generated with a different prior, model or statistics "
+                             "calculator." % self.path)
+
+    def read(self, field, stop=None):
+        """
+        Returns the rows of a field as a read-only memory-mapped array.
+
+        Parameters
+        ----------
+        field: str
+            One of 'parameters', 'statistics', 'data' and 'models'.
+        stop: integer, optional
+            Number of rows to return. The default value is None, meaning all rows.
+
+        Returns
+        -------
+        numpy.ndarray or None
+            Array with the rows as first dimension, or None if the table does not store the field.
+        """
+        if field not in self._manifest["fields"]:
+            return None
+
+        n_rows = len(self)
+        if field not in self._arrays or len(self._arrays[field]) != n_rows:
+            info = self._manifest["fields"][field]
+            shape = (n_rows,) + tuple(info["shape"])
+            if n_rows == 0:
+                self._arrays[field] = np.empty(shape, dtype=info["dtype"])
+            else:
+                self._arrays[field] = np.memmap(self._field_path(field), dtype=info["dtype"], mode='r', shape=shape)
+        return self._arrays[field][:stop]
+
+    def append(self, parameters=None, statistics=None, data=None, models=None):
+        """
+        Appends rows to the table. All calls must provide the same fields, with the same shape for every row.
+
+        Parameters
+        ----------
+        parameters: array-like, optional
+            Array with shape (n_rows, n_parameters).
+        statistics: array-like, optional
+            Array with the rows as first dimension, containing the statistics of the simulated data sets.
+        data: array-like, optional
+            Array with the rows as first dimension, containing the simulated data sets.
+        models: array-like, optional
+            Integer array with shape (n_rows,), containing the indices of the simulated models.
+        """
+        new_fields = {}
+        for field, values in zip(self.FIELDS, (parameters, statistics, data, models)):
+            if values is None:
+                continue
+            try:
+                values = np.asarray(values, dtype=np.int64 if field == 'models' else float)
+            except ValueError:
+                raise ValueError("The %s stored in a reference table need to have the same shape for every row." % field)
+            if values.ndim == 0:
+                raise ValueError("The %s need to have the rows as first dimension." % field)
+            new_fields[field] = values
+
+        n_new = {len(values) for values in new_fields.values()}
+        if len(n_new) != 1:
+            raise ValueError("The same number of rows has to be provided for all fields.")
+        n_new = n_new.pop()
+        if n_new == 0:
+            return
+
+        if len(self) == 0 and not self._manifest["fields"]:
+            self._manifest["fields"] = {field: {"dtype": values.dtype.str, "shape": list(values.shape[1:])}
+                                        for field, values in new_fields.items()}
+        if set(new_fields) != set(self._manifest["fields"]):
+            raise ValueError("The reference table stores the fields %s." % ", ".join(self.fields))
+        for field, values in new_fields.items():
+            if list(values.shape[1:]) != self._manifest["fields"][field]["shape"]:
+                raise ValueError("The rows of %s need to have shape %s." %
+                                 (field, tuple(self._manifest["fields"][field]["shape"])))
+
+        for field, values in new_fields.items():
+            # drop any partially written rows left by an interrupted append before writing the new ones
+            with open(self._field_path(field), 'ab') as f:
+                f.truncate(len(self) * values[0].nbytes)
+                f.write(np.ascontiguousarray(values).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._manifest["n_rows"] += n_new
+        self._write_manifest()
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def _field_path(self, field):
+        return os.path.join(self.path, field + ".bin")
+
+    def _write_manifest(self):
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path)
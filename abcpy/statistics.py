@@ -1,6 +1,14 @@
+import hashlib
+import inspect
+import io
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+import cloudpickle
 import numpy as np
 
+from abcpy.utils import cached, is_worker_process, process_torch_device
+
 try:
     import torch
 except ImportError:
@@ -10,6 +18,45 @@ else:
     from abcpy.NN_utilities.utilities import load_net
     from abcpy.NN_utilities.networks import createDefaultNN
 
+    # inference mode is only available in recent versions of Pytorch
+    _inference_mode = getattr(torch, "inference_mode", torch.no_grad)
+    # recent versions of Pytorch only load the weights of the networks by default
+    _torch_load_kwargs = {"weights_only": False} if "weights_only" in inspect.signature(torch.load).parameters else {}
+
+_NO_INDICES = np.empty(0, dtype=int)
+
+# process-local storage of the networks of the NeuralEmbedding objects unpickled by the workers of a parallel backend,
+# keyed by the digest of the serialized network, such that every worker loads a network only once; the most recently
+# used networks are last
+_loaded_nets = OrderedDict()
+_MAX_LOADED_NETS = 4
+
+
+def _load_net(serialized_net):
+    """Returns the network serialized by NeuralEmbedding.__getstate__, loaded on the device set with
+    abcpy.utils.configure_process(). In the workers of a parallel backend, it is only loaded if it is not yet loaded in
+    the current process; elsewhere, e.g. for copy.deepcopy on the scheduler, a new network is always loaded."""
+    if not is_worker_process():
+        return torch.load(io.BytesIO(serialized_net), map_location=process_torch_device(), **_torch_load_kwargs)
+
+    key = hashlib.sha1(serialized_net).hexdigest()
+    if key in _loaded_nets:
+        _loaded_nets.move_to_end(key)
+        return _loaded_nets[key]
+
+    net = torch.load(io.BytesIO(serialized_net), map_location=process_torch_device(), **_torch_load_kwargs)
+    _loaded_nets[key] = net
+    while len(_loaded_nets) > _MAX_LOADED_NETS:
+        _loaded_nets.popitem(last=False)
+    return net
+
+
+@cached
+def _cross_product_indices(p):
+    """Returns the pairs of columns (ind1, ind2), with ind1 < ind2, multiplied in the cross-product terms of p
+    statistics, in the order of the polynomial expansion."""
+    return np.triu_indices(p, k=1)
+
 
 class Statistics(metaclass=ABCMeta):
     """This abstract base class defines how to calculate statistics from dataset.
@@ -53,7 +100,7 @@ class Statistics(metaclass=ABCMeta):
 
         Parameters
         ----------
-        data: python list
+        data: python list or numpy.ndarray
             Contains n data sets with length p.
         Returns
         -------
@@ -85,32 +132,86 @@ class Statistics(metaclass=ABCMeta):
         # Check summary_statistics is a np.ndarry
         if not isinstance(summary_statistics, np.ndarray):
             raise TypeError('Summary statistics is not of allowed types')
-        # Include the polynomial expansion
-        result = summary_statistics
+        cross = self.cross == True and summary_statistics.ndim > 1 and summary_statistics.shape[1] > 1
+        if self.degree < 2 and not cross:
+            return summary_statistics
+        if summary_statistics.ndim == 1:
+            summary_statistics = summary_statistics.reshape(-1, 1)
+        n, p = summary_statistics.shape
+        ind1, ind2 = _cross_product_indices(p) if cross else (_NO_INDICES, _NO_INDICES)
+        n_powers = max(self.degree, 1) * p
+
+        # Fill the powers and then the cross-product terms into one preallocated matrix
+        result = np.empty((n, n_powers + len(ind1)), dtype=summary_statistics.dtype)
+        result[:, :p] = summary_statistics
         for ind in range(2, self.degree + 1):
-            result = np.column_stack((result, np.power(summary_statistics, ind)))
-
-        # Include the cross-product term
-        if self.cross == True and summary_statistics.shape[1] > 1:
-            # Convert to a matrix
-            for ind1 in range(0, summary_statistics.shape[1]):
-                for ind2 in range(ind1 + 1, summary_statistics.shape[1]):
-                    result = np.column_stack((result, summary_statistics[:, ind1] * summary_statistics[:, ind2]))
+            np.power(summary_statistics, ind, out=result[:, (ind - 1) * p:ind * p])
+        if cross:
+            np.multiply(summary_statistics[:, ind1], summary_statistics[:, ind2], out=result[:, n_powers:])
         return result
 
-    def _check_and_transform_input(self, data):
+    def statistics_batch(self, data):
+        """Computes the statistics of several data sets at once, for instance of the data simulated for many
+        parameters. By default, this calls `statistics` on every data set; sub-classes whose statistics are computed
+        for every data point independently overwrite it to transform all the data points in a single call.
+
+        Parameters
+        ----------
+        data: numpy.ndarray or python list
+            mxnxp array, or list of m data sets containing n data points of length p.
+        Returns
+        -------
+        numpy.ndarray
+            mxnxq array containing for each of the m data sets the nxq matrix returned by `statistics`.
         """
+
+        return np.stack([self.statistics(list(dataset)) for dataset in data])
+
+    def _check_and_transform_input(self, data):
+        """Converts a data set to a numpy.ndarray with one row per data point. A numpy.ndarray is used without
+        copying it, while a list is converted once.
         """
         if isinstance(data, list):
-            if np.array(data).shape == (len(data),):
-                if len(data) == 1:
-                    data = np.array(data).reshape(1, 1)
-                data = np.array(data).reshape(len(data), 1)
-            else:
-                data = np.concatenate(data).reshape(len(data), -1)
-        else:
-            raise TypeError('Input data should be of type list, but found type {}'.format(type(data)))
+            try:
+                array = np.asarray(data)
+            except ValueError:  # the data points have different shapes
+                array = None
+            if array is None or array.dtype == object:
+                array = np.concatenate(data).reshape(len(data), -1)
+            data = array
+        elif not isinstance(data, np.ndarray):
+            raise TypeError('Input data should be of type list or numpy.ndarray, but found type {}'.format(type(data)))
+
+        if data.ndim < 2:
+            data = data.reshape(-1, 1)
+        elif data.ndim > 2:
+            data = data.reshape(data.shape[0], -1)
+        return data
+
+    def _check_and_transform_batch(self, data):
+        """Returns the statistics of the previous statistics for a batch of data sets, or, if this is the first
+        statistics of the pipeline, converts the batch to an mxnxp numpy.ndarray.
+        """
+        if self.previous_statistics is not None:
+            return self.previous_statistics.statistics_batch(data)
 
+        if isinstance(data, list):
+            try:
+                array = np.asarray(data)
+            except ValueError:  # the data sets have different shapes
+                array = None
+            if array is None or array.dtype == object:
+                array = np.stack([self._check_and_transform_input(list(dataset)) for dataset in data])
+            data = array
+        elif not isinstance(data, np.ndarray):
+            raise TypeError('Input data should be of type list or numpy.ndarray, but found type {}'.format(type(data)))
+
+        if data.ndim < 2:
+            raise ValueError('A batch of data sets should have at least 2 dimensions, but found {}'.format(data.ndim))
+        elif data.ndim == 2:
+            data = data[:, :, np.newaxis]
+        elif data.ndim > 3:
+            data = data.reshape(data.shape[0], data.shape[1], -1)
         return data
 
 
@@ -146,7 +247,7 @@ class Identity(Statistics):
         """
         Parameters
         ----------
-        data: python list
+        data: python list or numpy.ndarray
             Contains n data sets with length p.
         Returns
         -------
@@ -170,6 +271,22 @@ class Identity(Statistics):
 
         return result
 
+    def statistics_batch(self, data):
+        """
+        Parameters
+        ----------
+        data: numpy.ndarray or python list
+            mxnxp array, or list of m data sets containing n data points of length p.
+        Returns
+        -------
+        numpy.ndarray
+            mxnx(p+degree*p+cross*nchoosek(p,2)) array containing the statistics of every data set.
+        """
+
+        data = self._check_and_transform_batch(data)
+        m, n = data.shape[:2]
+        return self._polynomial_expansion(data.reshape(m * n, -1)).reshape(m, n, -1)
+
 
 class LinearTransformation(Statistics):
     """Applies a linear transformation to the data to get (usually) a lower dimensional statistics. Then you can apply
@@ -203,7 +320,7 @@ class LinearTransformation(Statistics):
         """
         Parameters
         ----------
-        data: python list
+        data: python list or numpy.ndarray
             Contains n data sets with length p.
         Returns
         -------
@@ -233,6 +350,25 @@ class LinearTransformation(Statistics):
 
         return result
 
+    def statistics_batch(self, data):
+        """
+        Parameters
+        ----------
+        data: numpy.ndarray or python list
+            mxnxp array, or list of m data sets containing n data points of length p.
+        Returns
+        -------
+        numpy.ndarray
+            mxnx(d+degree*d+cross*nchoosek(d,2)) array containing the statistics of every data set.
+        """
+
+        data = self._check_and_transform_batch(data)
+        if not data.shape[2] == self.coefficients.shape[0]:
+            raise ValueError('Mismatch in dimension of summary statistics and coefficients')
+        m, n = data.shape[:2]
+        result = np.dot(data.reshape(m * n, -1), self.coefficients)
+        return self._polynomial_expansion(result).reshape(m, n, -1)
+
 
 class NeuralEmbedding(Statistics):
     """Computes the statistics by applying a neural network transformation. 
@@ -240,9 +376,14 @@ class NeuralEmbedding(Statistics):
     It is essentially a wrapper for the application of a neural network transformation to the data. Note that the
     neural network has had to be trained in some way (for instance check the statistics learning routines) and that 
     Pytorch is required for this part to work.   
+
+    When the object is unpickled on the workers of a parallel backend, e.g. with every inference task, the network is
+    loaded only if the same network was not already loaded by the worker, and it is then shared with the other
+    NeuralEmbedding objects of the worker; it is loaded on the device set by abcpy.utils.configure_process(). Copies
+    made in other processes have their own network.
     """
 
-    def __init__(self, net, previous_statistics=None):  # are these default values OK?
+    def __init__(self, net, previous_statistics=None, chunk_size=4096):  # are these default values OK?
         """
         Parameters
         ----------
@@ -254,6 +395,9 @@ class NeuralEmbedding(Statistics):
             composition of two Statistics, you can pass the first here; then, whenever the final statistic is needed, it
             is sufficient to call the `statistics` method of the second one, and that will automatically apply both
             transformations.
+        chunk_size : integer, optional
+            maximum number of data points transformed by the neural network at once; larger data sets are transformed
+            in chunks of this size, which bounds the memory used by the network. The default value is 4096.
         """
         if not has_torch:
             raise ImportError(
@@ -262,6 +406,26 @@ class NeuralEmbedding(Statistics):
 
         self.net = net
         self.previous_statistics = previous_statistics
+        self.chunk_size = chunk_size
+        self._input_buffer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_input_buffer'] = None
+        # the network is serialized on its own, such that it can be looked up by the processes which loaded it before
+        serialized_net = io.BytesIO()
+        torch.save(self.net, serialized_net, pickle_module=cloudpickle)
+        state['net'] = serialized_net.getvalue()
+        return state
+
+    def __setstate__(self, state):
+        # objects pickled by previous versions store the network itself
+        if isinstance(state['net'], (bytes, bytearray)):
+            state['net'] = _load_net(bytes(state['net']))
+        # nor do they have the attributes of the evaluation by chunks
+        state.setdefault('chunk_size', 4096)
+        state.setdefault('_input_buffer', None)
+        self.__dict__.update(state)
 
     @classmethod
     def fromFile(cls, path_to_net_state_dict, network_class=None, input_size=None, output_size=None, hidden_sizes=None,
@@ -339,7 +503,7 @@ class NeuralEmbedding(Statistics):
         """
         Parameters
         ----------
-        data: python list
+        data: python list or numpy.ndarray
             Contains n data sets with length p.
         Returns
         -------
@@ -357,13 +521,45 @@ class NeuralEmbedding(Statistics):
         else:
             data = self._check_and_transform_input(data)
 
-        data = torch.from_numpy(data.astype("float32"))
-
-        # move data to gpu if the net is on gpu
-        if next(self.net.parameters()).is_cuda:
-            data = data.cuda()
-
         # simply apply the network transformation.
-        result = self.net(data).cpu().detach().numpy()
+        return self._embed(data)
+
+    def statistics_batch(self, data):
+        """
+        Parameters
+        ----------
+        data: numpy.ndarray or python list
+            mxnxp array, or list of m data sets containing n data points of length p.
+        Returns
+        -------
+        numpy.ndarray
+            the statistics computed by applying the neural network to all the data points of the m data sets at once.
+        """
 
-        return np.array(result)
+        data = self._check_and_transform_batch(data)
+        m, n = data.shape[:2]
+        return self._embed(data.reshape(m * n, -1)).reshape(m, n, -1)
+
+    def _embed(self, data):
+        """Applies the neural network to the rows of the numpy.ndarray data, by chunks of at most self.chunk_size rows,
+        without recording the operations for automatic differentiation. The chunks are copied to an input buffer on
+        the device of the network, which is reused across calls."""
+        # the buffer is created on the device of the network, so that it is moved to gpu if the net is on gpu
+        device = next(self.net.parameters()).device
+        size = min(len(data), self.chunk_size)
+        if self._input_buffer is None or self._input_buffer.device != device or \
+                self._input_buffer.shape[0] < size or self._input_buffer.shape[1:] != data.shape[1:]:
+            self._input_buffer = torch.empty((size,) + data.shape[1:], dtype=torch.float32, device=device)
+
+        result = None
+        with _inference_mode():
+            # an empty data set is transformed as a single empty chunk
+            for start in range(0, max(len(data), 1), self.chunk_size):
+                chunk = data[start:start + self.chunk_size]
+                inputs = self._input_buffer[:len(chunk)]
+                inputs.copy_(torch.from_numpy(np.ascontiguousarray(chunk)))
+                outputs = self.net(inputs).cpu().numpy()
+                if result is None:
+                    result = np.empty((len(data),) + outputs.shape[1:], dtype=outputs.dtype)
+                result[start:start + len(chunk)] = outputs
+        return result
@@ -1,10 +1,11 @@
 import logging
 from abc import ABCMeta, abstractmethod
-
-from sklearn import linear_model
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
 
 from abcpy.acceptedparametersmanager import *
 from abcpy.graphtools import GraphTools
+from abcpy.referencetable import reference_table_fingerprint
 # import dataset and networks definition:
 from abcpy.statistics import LinearTransformation
 
@@ -15,6 +16,7 @@ except ImportError:
     has_torch = False
 else:
     has_torch = True
+    from abcpy.NN_utilities.losses import ContrastiveLoss
     from abcpy.NN_utilities.networks import createDefaultNN
     from abcpy.statistics import NeuralEmbedding
 
@@ -22,6 +24,110 @@ from abcpy.NN_utilities.algorithms import FP_nn_training, triplet_training, cont
 from abcpy.NN_utilities.utilities import compute_similarity_matrix
 
 
+def _parameters_array(parameters):
+    """Returns the parameters of n particles, each a list with the values of the free parameters, as a 2-dimensional
+    array with a row per particle."""
+    return np.array([np.concatenate([np.ravel(value) for value in parameter]) for parameter in parameters],
+                    dtype=float)
+
+
+class _NormalEquations(object):
+    """Accumulates the normal equations of the least squares regression of the parameters on the statistics, as the
+    means and the centred cross-products of the samples, which are numerically stable. They are computed on chunks of
+    samples, e.g. by different workers, and merged with the pairwise updates of Chan et al. [1], such that the
+    samples do not need to be gathered in memory.
+
+    [1] Chan T. F., Golub G. H., LeVeque R. J. 1979. Updating formulae and a pairwise algorithm for computing sample
+    variances. Technical Report STAN-CS-79-773, Stanford University.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean_statistics = 0.
+        self.mean_parameters = 0.
+        self.cross_statistics = 0.
+        self.cross_statistics_parameters = 0.
+
+    def update(self, statistics, parameters):
+        """Adds samples to the normal equations, and returns self.
+
+        Parameters
+        ----------
+        statistics: numpy.ndarray
+            The statistics of the m data points simulated with each of the n parameters, with n * m rows, in the order
+            of the parameters.
+        parameters: numpy.ndarray
+            The n parameters, with a row per parameter; they are not repeated for the m data points.
+        """
+        parameters = np.asarray(parameters, dtype=float).reshape(len(parameters), -1)
+        if len(parameters) == 0:
+            return self
+        statistics = np.asarray(statistics, dtype=float)
+        statistics = statistics.reshape(len(parameters), -1, statistics.shape[-1])
+
+        chunk = _NormalEquations()
+        chunk.n = statistics.shape[0] * statistics.shape[1]
+        chunk.mean_statistics = statistics.mean(axis=(0, 1))
+        chunk.mean_parameters = parameters.mean(axis=0)
+        centred_statistics = statistics - chunk.mean_statistics
+        chunk.cross_statistics = np.einsum("ijk,ijl->kl", centred_statistics, centred_statistics)
+        # the cross-products of the data points simulated with the same parameter are summed before the product
+        chunk.cross_statistics_parameters = centred_statistics.sum(axis=1).T.dot(parameters - chunk.mean_parameters)
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """Adds the samples of other normal equations, and returns self."""
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        n = self.n + other.n
+        delta_statistics = other.mean_statistics - self.mean_statistics
+        delta_parameters = other.mean_parameters - self.mean_parameters
+        factor = self.n * other.n / n
+        self.cross_statistics = self.cross_statistics + other.cross_statistics + \
+            factor * np.outer(delta_statistics, delta_statistics)
+        self.cross_statistics_parameters = self.cross_statistics_parameters + other.cross_statistics_parameters + \
+            factor * np.outer(delta_statistics, delta_parameters)
+        self.mean_statistics = self.mean_statistics + delta_statistics * other.n / n
+        self.mean_parameters = self.mean_parameters + delta_parameters * other.n / n
+        self.n = n
+        return self
+
+    def solve(self):
+        """Returns the coefficients of the regression with intercept, with a row per parameter and a column per
+        statistic; the minimum norm solution is returned if the statistics are collinear."""
+        return np.linalg.lstsq(self.cross_statistics, self.cross_statistics_parameters, rcond=None)[0].T
+
+
+class _ParameterStatisticsSimulator(GraphTools):
+    """Samples parameters from the prior and computes the statistics of data simulated with them. It is mapped to the
+    workers during data generation instead of the statistics learning object, so that the tasks only carry the model
+    and the statistics calculator, and not the training data nor the network being trained."""
+
+    def __init__(self, model, statistics_calc, n_samples_per_param):
+        self.model = model
+        self.statistics_calc = statistics_calc
+        self.n_samples_per_param = n_samples_per_param
+
+    def sample_parameter_statistics(self, rng=np.random.RandomState()):
+        """Function that generates (parameter, statistics)."""
+        self.sample_from_prior(rng=rng)
+        parameter = self.get_parameters()
+        y_sim = self.simulate(self.n_samples_per_param, rng=rng)
+        if y_sim is not None:
+            statistics = self.statistics_calc.statistics(y_sim)
+        return parameter, statistics
+
+    def normal_equations(self, seed_arr):
+        """Simulates the (parameter, statistics) pairs of a chunk of seeds and returns their normal equations."""
+        sample_parameters, sample_statistics = zip(*[self.sample_parameter_statistics(np.random.RandomState(seed))
+                                                     for seed in seed_arr])
+        sample_statistics = np.concatenate(sample_statistics).reshape(len(seed_arr) * self.n_samples_per_param, -1)
+        return _NormalEquations().update(sample_statistics, np.array(sample_parameters))
+
+
 # TODO: there seems to be issue when n_samples_per_param >1. Check that. Should you modify the _sample_parameters-statistics function?
 
 class StatisticsLearning(metaclass=ABCMeta):
@@ -29,7 +135,7 @@ class StatisticsLearning(metaclass=ABCMeta):
     """
 
     def __init__(self, model, statistics_calc, backend, n_samples=1000, n_samples_per_param=1, parameters=None,
-                 simulations=None, seed=None):
+                 simulations=None, seed=None, reference_table=None):
 
         """The constructor of a sub-class must accept a non-optional model, statistics calculator and
         backend which are stored to self.model, self.statistics_calc and self.backend. Further it
@@ -66,6 +172,10 @@ class StatisticsLearning(metaclass=ABCMeta):
             other simulations are performed. Default value is None.
         seed: integer, optional
             Optional initial seed for the random number generator. The default value is generated randomly.
+        reference_table: abcpy.referencetable.ReferenceTable, optional
+            Table of simulations from the prior, storing the parameters and the statistics of the simulated data sets.
+            The first n_samples rows of the table are used, and the table is extended with new simulations if it has
+            less rows. This is ignored if `simulations` and `parameters` are provided. Default value is None.
         """
         if (parameters is None) != (simulations is None):
             raise RuntimeError("parameters and simulations need to be provided together.")
@@ -78,38 +188,7 @@ class StatisticsLearning(metaclass=ABCMeta):
         self.logger = logging.getLogger(__name__)
 
         if parameters is None:  # then also simulations is None
-            self.logger.info('Generation of data...')
-
-            self.logger.debug("Definitions for parallelization.")
-            # An object managing the bds objects
-            self.accepted_parameters_manager = AcceptedParametersManager(self.model)
-            self.accepted_parameters_manager.broadcast(self.backend, [])
-
-            self.logger.debug("Map phase.")
-            # main algorithm
-            seed_arr = self.rng.randint(1, n_samples * n_samples, size=n_samples, dtype=np.int32)
-            rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
-            rng_pds = self.backend.parallelize(rng_arr)
-
-            self.logger.debug("Collect phase.")
-            sample_parameters_statistics_pds = self.backend.map(self._sample_parameter_statistics, rng_pds)
-
-            sample_parameters_and_statistics = self.backend.collect(sample_parameters_statistics_pds)
-            sample_parameters, sample_statistics = [list(t) for t in zip(*sample_parameters_and_statistics)]
-            sample_parameters = np.array(sample_parameters)
-            self.sample_statistics = np.concatenate(sample_statistics)
-
-            self.logger.debug("Reshape data")
-            # reshape the sample parameters; so that we can also work with multidimensional parameters
-            self.sample_parameters = sample_parameters.reshape((n_samples, -1))
-
-            # now reshape the statistics in the case in which several n_samples_per_param > 1, and repeat the array with
-            # the parameters so that the regression algorithms can work on the pair of arrays. Maybe there are smarter
-            # ways of doing this.
-
-            self.sample_statistics = self.sample_statistics.reshape(n_samples * self.n_samples_per_param, -1)
-            self.sample_parameters = np.repeat(self.sample_parameters, self.n_samples_per_param, axis=0)
-            self.logger.info('Data generation finished.')
+            self._generate_data(n_samples, reference_table)
 
         else:
             # do all the checks on dimensions:
@@ -129,6 +208,36 @@ class StatisticsLearning(metaclass=ABCMeta):
 
             self.logger.info("The statistics will be learned using the provided data and parameters")
 
+    def _generate_data(self, n_samples, reference_table):
+        """Simulates the n_samples (parameter, statistics) pairs, or reads them from the reference table, and stores
+        them in self.sample_parameters and self.sample_statistics."""
+        self.logger.info('Generation of data...')
+
+        # only the simulations missing from the reference table are generated
+        n_simulations = n_samples
+        if reference_table is not None:
+            reference_table.check_fingerprint(
+                reference_table_fingerprint(self.model, self.statistics_calc, self.n_samples_per_param))
+            n_simulations = max(n_samples - len(reference_table), 0)
+            self.logger.info('Reusing {} simulations of the reference table'.format(n_samples - n_simulations))
+
+        if n_simulations > 0:
+            # rows of a reference table are reused across runs, so their seeds are drawn from the full range
+            high = n_samples * n_samples if reference_table is None else np.iinfo(np.int32).max
+            seed_arr = self.rng.randint(1, high, size=n_simulations, dtype=np.int32)
+            sample_parameters, self.sample_statistics = self._simulate(seed_arr)
+
+            if reference_table is not None:
+                reference_table.append(parameters=sample_parameters.reshape((n_simulations, -1)),
+                                       statistics=self.sample_statistics.reshape((n_simulations, -1)))
+
+        if reference_table is not None:
+            sample_parameters = np.array(reference_table.read('parameters', n_samples))
+            self.sample_statistics = np.array(reference_table.read('statistics', n_samples))
+
+        self.sample_parameters, self.sample_statistics = self._reshape_data(sample_parameters, self.sample_statistics)
+        self.logger.info('Data generation finished.')
+
     def __getstate__(self):
         state = self.__dict__.copy()
         del state['backend']
@@ -146,16 +255,76 @@ class StatisticsLearning(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
-    def _sample_parameter_statistics(self, rng=np.random.RandomState()):
-        """Function that generates (parameter, statistics). It is mapped to the different workers during data
-        generation.
+    def refit(self, parameters, simulations, **kwargs):
         """
-        self.sample_from_prior(rng=rng)
-        parameter = self.get_parameters()
-        y_sim = self.simulate(self.n_samples_per_param, rng=rng)
-        if y_sim is not None:
-            statistics = self.statistics_calc.statistics(y_sim)
-        return parameter, statistics
+        Refits the learned transformation on the parameters and simulations used so far together with new ones, e.g.
+        the particles of a generation of an inference scheme and the data simulated with them, which are closer to the
+        posterior than the simulations from the prior (see InferenceMethod.set_statistics_learning()).
+
+        Parameters
+        ----------
+        parameters: list
+            The n new parameters, each a list with the values of the free parameters of the model.
+        simulations: list
+            The n data sets simulated with the new parameters, each a list of data points.
+        kwargs:
+            additional keyword arguments of the fit, see the subclasses.
+        """
+        sample_statistics = [self.statistics_calc.statistics(simulation) for simulation in simulations]
+        sample_parameters = _parameters_array(parameters)
+        # every simulated data point is a sample of the regression
+        sample_parameters = np.repeat(sample_parameters, [len(statistics) for statistics in sample_statistics], axis=0)
+
+        self.sample_parameters = np.concatenate((self.sample_parameters, sample_parameters))
+        self.sample_statistics = np.concatenate([self.sample_statistics] + sample_statistics)
+        self.logger.info('Refitting the transformation on {} samples...'.format(len(self.sample_parameters)))
+        self._fit(**kwargs)
+
+    def _fit(self, **kwargs):
+        """Fits the transformation on self.sample_parameters and self.sample_statistics; to be overwritten by the
+        sub-classes which can be refitted."""
+        raise NotImplementedError("{} does not support refitting.".format(type(self).__name__))
+
+    def _simulate(self, seed_arr):
+        """Samples in parallel a parameter from the prior and the statistics of data simulated with it for every seed of
+        seed_arr, and returns the array of parameters and the concatenated statistics.
+        """
+        self.logger.debug("Definitions for parallelization.")
+        # An object managing the bds objects
+        self.accepted_parameters_manager = AcceptedParametersManager(self.model)
+        self.accepted_parameters_manager.broadcast(self.backend, [])
+
+        self.logger.debug("Map phase.")
+        # main algorithm
+        rng_arr = np.array([np.random.RandomState(seed) for seed in seed_arr])
+        rng_pds = self.backend.parallelize(rng_arr)
+
+        self.logger.debug("Collect phase.")
+        sample_parameters_statistics_pds = self.backend.map(self._simulator().sample_parameter_statistics, rng_pds)
+
+        sample_parameters_and_statistics = self.backend.collect(sample_parameters_statistics_pds)
+        sample_parameters, sample_statistics = [list(t) for t in zip(*sample_parameters_and_statistics)]
+        return np.array(sample_parameters), np.concatenate(sample_statistics)
+
+    def _reshape_data(self, sample_parameters, sample_statistics):
+        """Reshapes the parameters and the statistics of n simulations to 2-dimensional arrays with a row per simulated
+        data point."""
+        self.logger.debug("Reshape data")
+        n_samples = len(sample_parameters)
+        # reshape the sample parameters; so that we can also work with multidimensional parameters
+        sample_parameters = sample_parameters.reshape((n_samples, -1))
+
+        # now reshape the statistics in the case in which several n_samples_per_param > 1, and repeat the array with
+        # the parameters so that the regression algorithms can work on the pair of arrays. Maybe there are smarter
+        # ways of doing this.
+
+        sample_statistics = sample_statistics.reshape(n_samples * self.n_samples_per_param, -1)
+        sample_parameters = np.repeat(sample_parameters, self.n_samples_per_param, axis=0)
+        return sample_parameters, sample_statistics
+
+    def _simulator(self):
+        """Returns the simulator of (parameter, statistics) pairs mapped to the workers during data generation."""
+        return _ParameterStatisticsSimulator(self.model, self.statistics_calc, self.n_samples_per_param)
 
 
 class Semiautomatic(StatisticsLearning, GraphTools):
@@ -167,7 +336,7 @@ class Semiautomatic(StatisticsLearning, GraphTools):
     """
 
     def __init__(self, model, statistics_calc, backend, n_samples=1000, n_samples_per_param=1, parameters=None,
-                 simulations=None, seed=None):
+                 simulations=None, seed=None, reference_table=None, chunk_size=None):
         """
         Parameters
         ----------
@@ -194,21 +363,68 @@ class Semiautomatic(StatisticsLearning, GraphTools):
             other simulations are performed. Default value is None.
         seed: integer, optional
             Optional initial seed for the random number generator. The default value is generated randomly.
+        reference_table: abcpy.referencetable.ReferenceTable, optional
+            Table of simulations from the prior, storing the parameters and the statistics of the simulated data sets.
+            The first n_samples rows of the table are used, and the table is extended with new simulations if it has
+            less rows. This is ignored if `simulations` and `parameters` are provided. Default value is None.
+        chunk_size: integer, optional
+            If provided, the simulations are generated by the workers in chunks of this size, and for every chunk only
+            the normal equations of the linear regression are sent back and summed, such that the simulations are
+            neither collected nor stored; `sample_parameters` and `sample_statistics` are then not defined. This is
+            ignored if `simulations` and `parameters` or `reference_table` are provided. Default value is None.
         """
+        self.chunk_size = chunk_size
+        self._normal_equations = None
+
         # the sampling is performed by the init of the parent class
         super(Semiautomatic, self).__init__(model, statistics_calc, backend,
                                             n_samples, n_samples_per_param, parameters=parameters,
-                                            simulations=simulations, seed=seed)
+                                            simulations=simulations, seed=seed, reference_table=reference_table)
 
         self.logger.info('Learning of the transformation...')
+        if self._normal_equations is None:
+            self._normal_equations = _NormalEquations().update(self.sample_statistics, self.sample_parameters)
+        self._fit()
+        self.logger.info("Finished learning the transformation.")
 
-        self.coefficients_learnt = np.zeros(shape=(self.sample_parameters.shape[1], self.sample_statistics.shape[1]))
-        regr = linear_model.LinearRegression(fit_intercept=True)
-        for ind in range(self.sample_parameters.shape[1]):
-            regr.fit(self.sample_statistics, self.sample_parameters[:, ind])
-            self.coefficients_learnt[ind, :] = regr.coef_
+    def _generate_data(self, n_samples, reference_table):
+        if self.chunk_size is None or reference_table is not None:
+            return super(Semiautomatic, self)._generate_data(n_samples, reference_table)
 
-        self.logger.info("Finished learning the transformation.")
+        self.logger.info('Generation of data...')
+        seed_arr = self.rng.randint(1, n_samples * n_samples, size=n_samples, dtype=np.int32)
+        chunks = [seed_arr[start:start + self.chunk_size] for start in range(0, n_samples, self.chunk_size)]
+
+        # An object managing the bds objects
+        self.accepted_parameters_manager = AcceptedParametersManager(self.model)
+        self.accepted_parameters_manager.broadcast(self.backend, [])
+        normal_equations_pds = self.backend.map(self._simulator().normal_equations, self.backend.parallelize(chunks))
+        self._normal_equations = reduce(_NormalEquations.merge, self.backend.collect(normal_equations_pds),
+                                        _NormalEquations())
+        self.logger.info('Data generation finished.')
+
+    def refit(self, parameters, simulations):
+        """
+        Refits the linear regression on the samples used so far together with new ones, e.g. the particles of a
+        generation of an inference scheme and the data simulated with them (see
+        InferenceMethod.set_statistics_learning()). The new samples are added to the normal equations of the
+        regression; they are not stored.
+
+        Parameters
+        ----------
+        parameters: list
+            The n new parameters, each a list with the values of the free parameters of the model.
+        simulations: list
+            The n data sets simulated with the new parameters, each a list of data points.
+        """
+        sample_statistics = np.concatenate([self.statistics_calc.statistics(simulation) for simulation in simulations])
+        self._normal_equations.update(sample_statistics, _parameters_array(parameters))
+        self.logger.info('Refitting the transformation on {} samples...'.format(self._normal_equations.n))
+        self._fit()
+
+    def _fit(self):
+        """Solves the normal equations of the linear regression of the parameters on the statistics."""
+        self.coefficients_learnt = self._normal_equations.solve()
 
     def get_statistics(self):
         """
@@ -231,7 +447,8 @@ class StatisticsLearningNN(StatisticsLearning, GraphTools):
 
     def __init__(self, model, statistics_calc, backend, training_routine, distance_learning, embedding_net=None,
                  n_samples=1000, n_samples_per_param=1, parameters=None, simulations=None, seed=None, cuda=None,
-                 quantile=0.1, **training_routine_kwargs):
+                 quantile=0.1, reference_table=None, quantile_n_pairs=None, simulation_batch_size=None,
+                 n_epochs_per_batch=1, plateau_patience=None, plateau_tolerance=0.01, **training_routine_kwargs):
         """
         Parameters
         ----------
@@ -271,10 +488,31 @@ class StatisticsLearningNN(StatisticsLearning, GraphTools):
             other simulations are performed. Default value is None.
         seed: integer, optional
             Optional initial seed for the random number generator. The default value is generated randomly.
+        reference_table: abcpy.referencetable.ReferenceTable, optional
+            Table of simulations from the prior, storing the parameters and the statistics of the simulated data sets.
+            The first n_samples rows of the table are used, and the table is extended with new simulations if it has
+            less rows. This is ignored if `simulations` and `parameters` are provided. Default value is None.
         cuda: boolean, optional
              If cuda=None, it will select GPU if it is available. Or you can specify True to use GPU or False to use CPU
         quantile: float, optional
             quantile used to define the similarity set if distance_learning is True. Default to 0.1.
+        quantile_n_pairs: integer, optional
+            if provided, the quantile defining the similarity set is estimated from the distances between this number
+            of random pairs of parameters, instead of all the pairs. Default value is None.
+        simulation_batch_size: integer, optional
+            if provided, the simulations are generated in batches of this size and the network is trained on the
+            batches already simulated while the next one is simulated by the backend; the training on all the
+            simulations then proceeds as usual. This cannot be used together with `reference_table`. Default value is
+            None, meaning that all the simulations are generated before training.
+        n_epochs_per_batch: integer, optional
+            number of epochs the network is trained for while every batch is simulated, if `simulation_batch_size` is
+            provided. Default to 1.
+        plateau_patience: integer, optional
+            if provided together with `simulation_batch_size`, the loss of the network on every new batch is used as a
+            validation loss, and no more simulations are generated after the validation loss has not decreased for
+            this number of batches. Default value is None, meaning that all the `n_samples` simulations are generated.
+        plateau_tolerance: float, optional
+            minimal relative decrease of the validation loss considered as an improvement. Default to 0.01.
         training_routine_kwargs:
             additional kwargs to be passed to the underlying training routine.
         """
@@ -304,20 +542,18 @@ class StatisticsLearningNN(StatisticsLearning, GraphTools):
         else:
             self.logger.debug("We are using CPU to train the network.")
 
+        # in the pipelined mode, only the first batch of simulations is generated before the network is defined
+        pipelined = parameters is None and simulation_batch_size is not None and simulation_batch_size < n_samples
+        if pipelined and reference_table is not None:
+            raise RuntimeError("simulation_batch_size cannot be used together with reference_table.")
+
         # this handles generation of the data (or its formatting in case the data is provided to the Semiautomatic
         # class)
-        super(StatisticsLearningNN, self).__init__(model, statistics_calc, backend, n_samples, n_samples_per_param,
-                                                   parameters, simulations, seed)
+        super(StatisticsLearningNN, self).__init__(model, statistics_calc, backend,
+                                                   simulation_batch_size if pipelined else n_samples,
+                                                   n_samples_per_param, parameters, simulations, seed, reference_table)
 
         self.logger.info('Learning of the transformation...')
-        # Define Data
-        target, simulations_reshaped = self.sample_parameters, self.sample_statistics
-
-        if distance_learning:
-            self.logger.debug("Computing similarity matrix...")
-            # define the similarity set
-            similarity_set = compute_similarity_matrix(target, quantile)
-            self.logger.debug("Done")
 
         # now setup the default neural network or not
 
@@ -328,16 +564,47 @@ class StatisticsLearningNN(StatisticsLearning, GraphTools):
         elif isinstance(embedding_net, list) or embedding_net is None:
             # therefore we need to generate the neural network given the list. The following function returns a class
             # of NN with given input size, output size and hidden sizes; then, need () to instantiate the network
-            self.embedding_net = createDefaultNN(input_size=simulations_reshaped.shape[1], output_size=target.shape[1],
+            self.embedding_net = createDefaultNN(input_size=self.sample_statistics.shape[1],
+                                                 output_size=self.sample_parameters.shape[1],
                                                  hidden_sizes=embedding_net)()
             self.logger.debug('We generate a default neural network')
 
         if cuda:
             self.embedding_net.cuda()
 
+        # the network is trained again with the same arguments when it is refitted
+        self._training_arguments = dict(training_routine=training_routine, distance_learning=distance_learning,
+                                        cuda=cuda, quantile=quantile, quantile_n_pairs=quantile_n_pairs)
+        self._training_routine_kwargs = training_routine_kwargs
+
+        if pipelined:
+            self._simulate_and_train(n_samples, simulation_batch_size, n_epochs_per_batch, plateau_patience,
+                                     plateau_tolerance, training_routine, distance_learning, cuda, quantile,
+                                     quantile_n_pairs, training_routine_kwargs)
+
         self.logger.debug('We now run the training routine')
+        self._fit()
+
+        self.logger.info("Finished learning the transformation.")
+
+    def _fit(self, **training_routine_kwargs):
+        """Trains the embedding network, starting from its current weights, with the arguments given to the
+        constructor; the training_routine_kwargs override the ones given to the constructor, e.g. n_epochs."""
+        self._train(training_routine_kwargs=dict(self._training_routine_kwargs, **training_routine_kwargs),
+                    **self._training_arguments)
+
+    def _train(self, training_routine, distance_learning, cuda, quantile, quantile_n_pairs, training_routine_kwargs):
+        """Trains the embedding network with the training routine on all the parameters and statistics simulated so
+        far."""
+        target, simulations_reshaped = self.sample_parameters, self.sample_statistics
 
         if distance_learning:
+            self.logger.debug("Computing similarity matrix...")
+            # define the similarity set
+            similarity_set = compute_similarity_matrix(target, quantile, n_pairs=quantile_n_pairs, sparse=True,
+                                                       rng=self.rng)
+            self.logger.debug("Done")
+
             self.embedding_net = training_routine(simulations_reshaped, similarity_set,
                                                   embedding_net=self.embedding_net, cuda=cuda,
                                                   **training_routine_kwargs)
@@ -345,7 +612,59 @@ class StatisticsLearningNN(StatisticsLearning, GraphTools):
             self.embedding_net = training_routine(simulations_reshaped, target, embedding_net=self.embedding_net,
                                                   cuda=cuda, **training_routine_kwargs)
 
-        self.logger.info("Finished learning the transformation.")
+    def _simulate_and_train(self, n_samples, simulation_batch_size, n_epochs_per_batch, plateau_patience,
+                            plateau_tolerance, training_routine, distance_learning, cuda, quantile, quantile_n_pairs,
+                            training_routine_kwargs):
+        """Simulates the remaining batches of the n_samples simulations with the backend in a background thread, while
+        the network is trained for n_epochs_per_batch epochs on the batches already simulated. Every new batch is
+        first used to compute a validation loss of the network; if plateau_patience is given, the simulations stop
+        once the validation loss has not decreased by a relative plateau_tolerance for plateau_patience batches.
+        """
+        batch_training_routine_kwargs = dict(training_routine_kwargs, n_epochs=n_epochs_per_batch, start_epoch=0)
+        margin = training_routine_kwargs.get("margin", 1.)
+        best_loss, n_batches_without_improvement = np.inf, 0
+        n_simulated = len(self.sample_parameters) // self.n_samples_per_param
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while n_simulated < n_samples:
+                n_simulations = min(simulation_batch_size, n_samples - n_simulated)
+                seed_arr = self.rng.randint(1, n_samples * n_samples, size=n_simulations, dtype=np.int32)
+                simulations = executor.submit(self._simulate, seed_arr)
+
+                # train on the batches already simulated while the next one is simulated
+                self._train(training_routine, distance_learning, cuda, quantile, quantile_n_pairs,
+                            batch_training_routine_kwargs)
+
+                sample_parameters, sample_statistics = self._reshape_data(*simulations.result())
+                n_simulated += n_simulations
+                loss = self._validation_loss(sample_statistics, sample_parameters, distance_learning, quantile, margin)
+                self.logger.info("Validation loss after {} simulations: {:.4f}".format(n_simulated, loss))
+
+                self.sample_parameters = np.concatenate((self.sample_parameters, sample_parameters))
+                self.sample_statistics = np.concatenate((self.sample_statistics, sample_statistics))
+
+                if loss < best_loss * (1 - plateau_tolerance):
+                    best_loss, n_batches_without_improvement = loss, 0
+                else:
+                    n_batches_without_improvement += 1
+                if plateau_patience is not None and n_batches_without_improvement >= plateau_patience:
+                    self.logger.info("The validation loss reached a plateau, the simulations are stopped.")
+                    break
+
+    def _validation_loss(self, simulations, target, distance_learning, quantile, margin):
+        """Returns the loss of the embedding network on new simulations: the mean squared error between the embeddings
+        and the parameters, or, for distance learning, the contrastive loss of all the pairs of simulations."""
+        with torch.no_grad():
+            embeddings = self.embedding_net(torch.from_numpy(simulations.astype("float32")).to(self.device))
+        if not distance_learning:
+            target = torch.from_numpy(target.astype("float32")).to(self.device)
+            return torch.mean((embeddings - target) ** 2).item()
+
+        similarity_set = compute_similarity_matrix(target, quantile)
+        first, second = np.triu_indices(len(target), k=1)
+        loss = ContrastiveLoss(margin)(embeddings[first], embeddings[second],
+                                       torch.from_numpy(similarity_set[first, second].astype(int)).to(self.device))
+        return loss.item()
 
     def get_statistics(self):
         """
@@ -374,7 +693,9 @@ class SemiautomaticNN(StatisticsLearningNN):
     def __init__(self, model, statistics_calc, backend, embedding_net=None, n_samples=1000, n_samples_per_param=1,
                  parameters=None, simulations=None, seed=None, cuda=None, batch_size=16, n_epochs=200,
                  load_all_data_GPU=False, lr=1e-3, optimizer=None, scheduler=None, start_epoch=0, verbose=False,
-                 optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={}):
+                 optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={},
+                 reference_table=None, n_threads=None,
+                 simulation_batch_size=None, n_epochs_per_batch=1, plateau_patience=None, plateau_tolerance=0.01):
         """
         Parameters
         ----------
@@ -440,6 +761,26 @@ class SemiautomaticNN(StatisticsLearningNN):
         loader_kwargs: Python dictionary, optional
             dictionary containing optional keyword arguments for the loader (that handles loading the samples from the
             dataset during the training phase).
+        reference_table: abcpy.referencetable.ReferenceTable, optional
+            Table of simulations from the prior which is read and extended to generate the training data. Default
+            value is None.
+        n_threads: integer, optional
+            number of threads used by Pytorch on CPU to train the neural network. By default, the current setting of
+            Pytorch is kept.
+        simulation_batch_size: integer, optional
+            if provided, the simulations are generated in batches of this size and the network is trained on the
+            batches already simulated while the next one is simulated by the backend; the training on all the
+            simulations then proceeds as usual. This cannot be used together with `reference_table`. Default value is
+            None, meaning that all the simulations are generated before training.
+        n_epochs_per_batch: integer, optional
+            number of epochs the network is trained for while every batch is simulated, if `simulation_batch_size` is
+            provided. Default to 1.
+        plateau_patience: integer, optional
+            if provided together with `simulation_batch_size`, the loss of the network on every new batch is used as a
+            validation loss, and no more simulations are generated after the validation loss has not decreased for
+            this number of batches. Default value is None, meaning that all the `n_samples` simulations are generated.
+        plateau_tolerance: float, optional
+            minimal relative decrease of the validation loss considered as an improvement. Default to 0.01.
         """
         super(SemiautomaticNN, self).__init__(model, statistics_calc, backend, FP_nn_training, distance_learning=False,
                                               embedding_net=embedding_net, n_samples=n_samples,
@@ -448,7 +789,11 @@ class SemiautomaticNN(StatisticsLearningNN):
                                               n_epochs=n_epochs, load_all_data_GPU=load_all_data_GPU, lr=lr,
                                               optimizer=optimizer, scheduler=scheduler, start_epoch=start_epoch,
                                               verbose=verbose, optimizer_kwargs=optimizer_kwargs,
-                                              scheduler_kwargs=scheduler_kwargs, loader_kwargs=loader_kwargs)
+                                              scheduler_kwargs=scheduler_kwargs, loader_kwargs=loader_kwargs,
+                                              reference_table=reference_table, n_threads=n_threads,
+                                              simulation_batch_size=simulation_batch_size,
+                                              n_epochs_per_batch=n_epochs_per_batch,
+                                              plateau_patience=plateau_patience, plateau_tolerance=plateau_tolerance)
 
 
 class TripletDistanceLearning(StatisticsLearningNN):
@@ -467,7 +812,9 @@ class TripletDistanceLearning(StatisticsLearningNN):
     def __init__(self, model, statistics_calc, backend, embedding_net=None, n_samples=1000, n_samples_per_param=1,
                  parameters=None, simulations=None, seed=None, cuda=None, quantile=0.1, batch_size=16, n_epochs=200,
                  load_all_data_GPU=False, margin=1., lr=None, optimizer=None, scheduler=None, start_epoch=0,
-                 verbose=False, optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={}):
+                 verbose=False, optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={},
+                 reference_table=None, quantile_n_pairs=None, n_threads=None,
+                 simulation_batch_size=None, n_epochs_per_batch=1, plateau_patience=None, plateau_tolerance=0.01):
         """
         Parameters
         ----------
@@ -538,6 +885,29 @@ class TripletDistanceLearning(StatisticsLearningNN):
         loader_kwargs: Python dictionary, optional
             dictionary containing optional keyword arguments for the loader (that handles loading the samples from the
             dataset during the training phase).
+        reference_table: abcpy.referencetable.ReferenceTable, optional
+            Table of simulations from the prior which is read and extended to generate the training data. Default
+            value is None.
+        quantile_n_pairs: integer, optional
+            if provided, the quantile defining the similarity set is estimated from the distances between this number
+            of random pairs of parameters, instead of all the pairs. Default value is None.
+        n_threads: integer, optional
+            number of threads used by Pytorch on CPU to train the neural network. By default, the current setting of
+            Pytorch is kept.
+        simulation_batch_size: integer, optional
+            if provided, the simulations are generated in batches of this size and the network is trained on the
+            batches already simulated while the next one is simulated by the backend; the training on all the
+            simulations then proceeds as usual. This cannot be used together with `reference_table`. Default value is
+            None, meaning that all the simulations are generated before training.
+        n_epochs_per_batch: integer, optional
+            number of epochs the network is trained for while every batch is simulated, if `simulation_batch_size` is
+            provided. Default to 1.
+        plateau_patience: integer, optional
+            if provided together with `simulation_batch_size`, the loss of the network on every new batch is used as a
+            validation loss, and no more simulations are generated after the validation loss has not decreased for
+            this number of batches. Default value is None, meaning that all the `n_samples` simulations are generated.
+        plateau_tolerance: float, optional
+            minimal relative decrease of the validation loss considered as an improvement. Default to 0.01.
         """
 
         super(TripletDistanceLearning, self).__init__(model, statistics_calc, backend, triplet_training,
@@ -549,7 +919,13 @@ class TripletDistanceLearning(StatisticsLearningNN):
                                                       margin=margin, lr=lr, optimizer=optimizer, scheduler=scheduler,
                                                       start_epoch=start_epoch, verbose=verbose,
                                                       optimizer_kwargs=optimizer_kwargs,
-                                                      scheduler_kwargs=scheduler_kwargs, loader_kwargs=loader_kwargs)
+                                                      scheduler_kwargs=scheduler_kwargs, loader_kwargs=loader_kwargs,
+                                                      reference_table=reference_table,
+                                                      quantile_n_pairs=quantile_n_pairs, n_threads=n_threads,
+                                                      simulation_batch_size=simulation_batch_size,
+                                                      n_epochs_per_batch=n_epochs_per_batch,
+                                                      plateau_patience=plateau_patience,
+                                                      plateau_tolerance=plateau_tolerance)
 
 
 class ContrastiveDistanceLearning(StatisticsLearningNN):
@@ -569,7 +945,9 @@ class ContrastiveDistanceLearning(StatisticsLearningNN):
     def __init__(self, model, statistics_calc, backend, embedding_net=None, n_samples=1000, n_samples_per_param=1,
                  parameters=None, simulations=None, seed=None, cuda=None, quantile=0.1, batch_size=16, n_epochs=200,
                  positive_weight=None, load_all_data_GPU=False, margin=1., lr=None, optimizer=None, scheduler=None,
-                 start_epoch=0, verbose=False, optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={}):
+                 start_epoch=0, verbose=False, optimizer_kwargs={}, scheduler_kwargs={}, loader_kwargs={},
+                 reference_table=None, quantile_n_pairs=None, n_threads=None,
+                 simulation_batch_size=None, n_epochs_per_batch=1, plateau_patience=None, plateau_tolerance=0.01):
         """
         Parameters
         ----------
@@ -644,6 +1022,29 @@ class ContrastiveDistanceLearning(StatisticsLearningNN):
         loader_kwargs: Python dictionary, optional
             dictionary containing optional keyword arguments for the loader (that handles loading the samples from the
             dataset during the training phase).
+        reference_table: abcpy.referencetable.ReferenceTable, optional
+            Table of simulations from the prior which is read and extended to generate the training data. Default
+            value is None.
+        quantile_n_pairs: integer, optional
+            if provided, the quantile defining the similarity set is estimated from the distances between this number
+            of random pairs of parameters, instead of all the pairs. Default value is None.
+        n_threads: integer, optional
+            number of threads used by Pytorch on CPU to train the neural network. By default, the current setting of
+            Pytorch is kept.
+        simulation_batch_size: integer, optional
+            if provided, the simulations are generated in batches of this size and the network is trained on the
+            batches already simulated while the next one is simulated by the backend; the training on all the
+            simulations then proceeds as usual. This cannot be used together with `reference_table`. Default value is
+            None, meaning that all the simulations are generated before training.
+        n_epochs_per_batch: integer, optional
+            number of epochs the network is trained for while every batch is simulated, if `simulation_batch_size` is
+            provided. Default to 1.
+        plateau_patience: integer, optional
+            if provided together with `simulation_batch_size`, the loss of the network on every new batch is used as a
+            validation loss, and no more simulations are generated after the validation loss has not decreased for
+            this number of batches. Default value is None, meaning that all the `n_samples` simulations are generated.
+        plateau_tolerance: float, optional
+            minimal relative decrease of the validation loss considered as an improvement. Default to 0.01.
         """
 
         super(ContrastiveDistanceLearning, self).__init__(model, statistics_calc, backend, contrastive_training,
@@ -657,4 +1058,9 @@ class ContrastiveDistanceLearning(StatisticsLearningNN):
                                                           start_epoch=start_epoch, verbose=verbose,
                                                           optimizer_kwargs=optimizer_kwargs,
                                                           scheduler_kwargs=scheduler_kwargs,
-                                                          loader_kwargs=loader_kwargs)
+                                                          loader_kwargs=loader_kwargs, reference_table=reference_table,
+                                                          quantile_n_pairs=quantile_n_pairs, n_threads=n_threads,
+                                                          simulation_batch_size=simulation_batch_size,
+                                                          n_epochs_per_batch=n_epochs_per_batch,
+                                                          plateau_patience=plateau_patience,
+                                                          plateau_tolerance=plateau_tolerance)
@@ -1,5 +1,13 @@
+import hashlib
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
 
+import numpy as np
+
 
 def cached(func):
     cache = {}
@@ -11,3 +19,522 @@ def cached(func):
         return cache[x]
 
     return wrapped
+
+
+# configuration of the computing resources of the current process, see configure_process()
+_process_configuration = {"n_threads": None, "torch_device": None, "worker": False}
+
+
+def configure_process(n_threads=None, torch_device=None, worker=False):
+    """
+    Configures the computing resources used by the current process. The parallel backends call it on every process
+    when they start (see the n_threads and torch_device arguments of BackendMPI and BackendSpark), such that the
+    processes sharing a node do not oversubscribe its cores, each of them starting as many threads as cores.
+
+    Parameters
+    ----------
+    n_threads: integer, optional
+        Number of threads used by Pytorch for intra-op parallelism and, if threadpoolctl is installed, by the BLAS
+        and OpenMP libraries used by numpy. The default value is None, leaving the numbers of threads unchanged.
+    torch_device: string, optional
+        Device the neural networks unpickled in this process are loaded on, e.g. "cpu" for processes without GPU; see
+        abcpy.statistics.NeuralEmbedding. The default value is None, meaning the device the networks were on when they
+        were pickled.
+    worker: boolean, optional
+        Whether the process is a worker of a parallel backend, which only runs tasks sent by the scheduler. The
+        neural networks unpickled by a worker are shared by the objects holding them (see
+        abcpy.statistics.NeuralEmbedding), while copies made in other processes, e.g. by copy.deepcopy, remain
+        independent. The default value is False.
+    """
+    if n_threads is not None and n_threads != _process_configuration["n_threads"]:
+        try:
+            import torch
+        except ImportError:
+            pass
+        else:
+            torch.set_num_threads(n_threads)
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            pass
+        else:
+            threadpool_limits(limits=n_threads)
+        _process_configuration["n_threads"] = n_threads
+    if torch_device is not None:
+        _process_configuration["torch_device"] = torch_device
+    if worker:
+        _process_configuration["worker"] = True
+
+
+def process_torch_device():
+    """Returns the device the neural networks unpickled in the current process are loaded on, see
+    configure_process()."""
+    return _process_configuration["torch_device"]
+
+
+def is_worker_process():
+    """Returns whether the current process is a worker of a parallel backend, see configure_process()."""
+    return _process_configuration["worker"]
+
+
+# process-local registry of the simulation caches, such that all tasks executed by the same worker share one cache; a
+# cache is dropped with the last object using it, except the last one unpickled, which is kept for the next tasks
+_simulation_caches = weakref.WeakValueDictionary()
+_last_simulation_cache = None
+
+
+def _get_simulation_cache(cache_id, max_entries, max_bytes, deterministic):
+    """Returns the cache with the given id living in the current process, creating an empty one if needed."""
+    global _last_simulation_cache
+    cache = _simulation_caches.get(cache_id)
+    if cache is None:
+        cache = SimulationCache(max_entries, max_bytes, deterministic, cache_id=cache_id)
+    _last_simulation_cache = cache
+    return cache
+
+
+class SimulationCache(object):
+    """
+    A least recently used cache of simulations, keyed by the input values of the models and the state of the
+    random number generator. The class and the name of the simulated models are part of the key, so a cache can be
+    shared by inference methods with different models. It is used by GraphTools.simulate once assigned to the
+    simulation_cache attribute of an inference method, e.g.
+    `sampler.simulation_cache = SimulationCache(max_entries=10000)`.
+
+    For stochastic models a simulation is only reused if the random number generator is in the same state as when the
+    simulation was stored; the generator is then advanced to the state it had after the original simulation, such that
+    results are identical to the ones obtained without the cache. For deterministic models, the state of the random
+    number generator is ignored and any simulation with the same input values is reused.
+
+    When pickled, e.g. to be sent to a worker of a parallel backend, only the configuration of the cache is
+    transferred; every process keeps its own storage, which is shared by all the tasks it executes. The storage is
+    released once the cache is no longer used in the process, except for the cache last received by a worker, which is
+    kept until another one is received. Cached results are returned without copying and must not be modified.
+
+    Parameters
+    ----------
+    max_entries: integer, optional
+        Maximum number of simulations kept in the cache. The default value is 10000.
+    max_bytes: integer, optional
+        Maximum memory used by the cached simulations, in bytes. The default value is None, meaning no limit.
+    deterministic: boolean, optional
+        Whether the simulations only depend on the input values of the models. The default value is False.
+    cache_id: str, optional
+        Identifier of the cache, shared by all the copies of the cache in the different processes. The default value
+        is None, in which case a new identifier is generated.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=None, deterministic=False, cache_id=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.deterministic = deterministic
+        self.cache_id = uuid.uuid4().hex if cache_id is None else cache_id
+
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+        _simulation_caches[self.cache_id] = self
+
+    def __reduce__(self):
+        return (_get_simulation_cache, (self.cache_id, self.max_entries, self.max_bytes, self.deterministic))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, models, n_samples_per_param, rng):
+        """
+        Computes the key of the simulation of the given models with their current input values.
+
+        Parameters
+        ----------
+        models: list
+            List of abcpy.ProbabilisticModel objects that are simulated.
+        n_samples_per_param: integer
+            Number of data points in each simulated data set.
+        rng: random number generator
+            The random number generator used for the simulation.
+
+        Returns
+        -------
+        tuple or None
+            The key, or None if the input values cannot be represented as numbers, in which case the simulation is
+            not cached.
+        """
+        try:
+            values = [np.asarray(value, dtype=float).ravel() for model in models for value in model.get_input_values()]
+        except (TypeError, ValueError):
+            return None
+        parameters = np.concatenate(values).tobytes() if values else b''
+        model_names = tuple((type(model).__name__, model.name) for model in models)
+
+        if self.deterministic:
+            return (model_names, n_samples_per_param, parameters, None)
+
+        state = rng.get_state()
+        digest = hashlib.sha1(state[1].tobytes())
+        digest.update(repr(state[2:]).encode())
+        return (model_names, n_samples_per_param, parameters, digest.digest())
+
+    def get(self, key, rng):
+        """
+        Returns the cached simulation for the given key and, for stochastic models, advances the random number
+        generator as the original simulation did.
+
+        Parameters
+        ----------
+        key: tuple
+            Key computed by the key method.
+        rng: random number generator
+            The random number generator used for the simulation.
+
+        Returns
+        -------
+        list or None
+            The cached simulation, or None if it is not in the cache.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        result, rng_state, nbytes = entry
+        if rng_state is not None:
+            rng.set_state(rng_state)
+        return result
+
+    def put(self, key, result, rng):
+        """
+        Stores a simulation, evicting the least recently used ones if the cache is full.
+
+        Parameters
+        ----------
+        key: tuple
+            Key computed by the key method before the simulation.
+        result: list
+            The simulation to be stored.
+        rng: random number generator
+            The random number generator used for the simulation, in its state after the simulation.
+        """
+        rng_state = None if self.deterministic else rng.get_state()
+        nbytes = _nbytes(result) + (0 if rng_state is None else rng_state[1].nbytes)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[2]
+        self._entries[key] = (result, rng_state, nbytes)
+        self.nbytes += nbytes
+
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.nbytes > self.max_bytes):
+            self.nbytes -= self._entries.popitem(last=False)[1][2]
+
+    def clear(self):
+        """Removes all simulations from the cache of the current process."""
+        self._entries.clear()
+        self.nbytes = 0
+
+
+def _nbytes(obj):
+    """Estimates the memory used by a (nested list of) simulation results, in bytes."""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(item) for item in obj)
+    return 8
+
+
+class Profiler(object):
+    """
+    Collects the wall-clock time spent in the phases of the generations of an inference scheme, together with
+    counters such as the number of simulations, of tasks sent to the workers and of bytes broadcasted. It is used by
+    the inference schemes once assigned with InferenceMethod.set_profiler, which also times the calls to the backend.
+
+    At the end of every generation, the times and counters are stored in the journal of the inference scheme (see
+    Journal.get_profile), passed to the callback if one is given, and reset.
+
+    Parameters
+    ----------
+    callback: callable, optional
+        Function called with the profile of every generation, a dictionary with the generation `step`, the `time`
+        spent in every phase in seconds and the `counters`. The default value is None.
+    workers: boolean, optional
+        Whether the tasks run by the workers account for the time they spend simulating, computing statistics,
+        distances, prior densities and perturbations, and in the bookkeeping of the graph. The accounting is returned
+        with the results of the tasks and added to the profile as the phases `worker.<name>`, together with the total
+        time of the tasks, `worker.task`, and the time not spent in any of these parts, `worker.framework`; the
+        counters `worker.<name>` hold the number of calls. See also worker_fractions. The default value is True.
+    """
+
+    def __init__(self, callback=None, workers=True):
+        self.callback = callback
+        self.workers = workers
+        self.times = OrderedDict()
+        self.counters = OrderedDict()
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the times and counters collected so far and starts timing a new generation.
+        """
+        self.times.clear()
+        self.counters.clear()
+        self._generation_start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager adding the time spent in its body to the phase with the given name.
+
+        Parameters
+        ----------
+        name: str
+            Name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+    def add_time(self, name, seconds):
+        """
+        Adds time to a phase, e.g. time measured on the workers.
+
+        Parameters
+        ----------
+        name: str
+            Name of the phase.
+        seconds: float
+            Time to add.
+        """
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+    def add_worker_accounting(self, accountings):
+        """
+        Adds the accounting returned by tasks run on the workers (see WorkerAccounting.summary) to the current
+        generation.
+
+        Parameters
+        ----------
+        accountings: list
+            The accounting of every task.
+        """
+        for accounting in accountings:
+            self.add_time("worker.task", accounting["task_time"])
+            self.add_time("worker.framework", accounting["task_time"] - sum(accounting["time"].values()))
+            for name, seconds in accounting["time"].items():
+                self.add_time("worker." + name, seconds)
+                self.count("worker." + name, accounting["calls"][name])
+
+    @staticmethod
+    def worker_fractions(profile):
+        """
+        Computes the fraction of the time of the tasks run on the workers spent in each of their parts, e.g. the
+        fraction spent in the simulator, `simulate`, or outside the parts accounted for, `framework`.
+
+        Parameters
+        ----------
+        profile: dict
+            The profile of a generation, as returned by end_generation.
+
+        Returns
+        -------
+        dict
+            The fraction of every part, or an empty dictionary if the profile has no worker accounting.
+        """
+        task_time = profile["time"].get("worker.task", 0.0)
+        if task_time <= 0:
+            return {}
+        return {name[len("worker."):]: seconds / task_time for name, seconds in profile["time"].items()
+                if name.startswith("worker.") and name != "worker.task"}
+
+    def count(self, name, value=1):
+        """
+        Increments a counter.
+
+        Parameters
+        ----------
+        name: str
+            Name of the counter.
+        value: number, optional
+            Increment. The default value is 1.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def end_generation(self, step):
+        """
+        Returns the profile of the generation that just ended, passes it to the callback and resets the times and
+        counters.
+
+        Parameters
+        ----------
+        step: integer
+            The generation that ended.
+
+        Returns
+        -------
+        dict
+            The profile of the generation.
+        """
+        now = time.perf_counter()
+        profile = {"step": step, "total_time": now - self._generation_start, "time": dict(self.times),
+                   "counters": dict(self.counters)}
+        self.times.clear()
+        self.counters.clear()
+        self._generation_start = now
+        if self.callback is not None:
+            self.callback(profile)
+        return profile
+
+
+class _NoPhase(object):
+    """Context manager doing nothing, used for the phases of inference schemes that are not profiled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class WorkerAccounting(object):
+    """
+    Accumulates the time spent by a task running on a worker in its parts, e.g. simulating the model or computing
+    distances, as timed with worker_phase. Phases can be nested, in which case the time of a phase excludes the time
+    of the phases nested in it, such that the times of all phases add up to at most the time of the task. A phase
+    entered again while it is running, e.g. by a recursive function, is timed once.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.calls = {}
+        self._stack = []
+
+    def phase(self, name):
+        """
+        Returns a context manager adding the time spent in its body to the phase with the given name.
+
+        Parameters
+        ----------
+        name: str
+            Name of the phase.
+        """
+        if self._stack and self._stack[-1][0] == name:
+            return _NO_PHASE
+        return _WorkerPhase(self, name)
+
+    def summary(self, task_time):
+        """
+        Returns the accounting of a task, as sent back to the scheduler.
+
+        Parameters
+        ----------
+        task_time: float
+            The total time of the task in seconds.
+
+        Returns
+        -------
+        dict
+            Dictionary with the `task_time` and the `time` and number of `calls` of every phase.
+        """
+        return {"task_time": task_time, "time": self.times, "calls": self.calls}
+
+
+class _WorkerPhase(object):
+    """Context manager timing one phase of a WorkerAccounting."""
+
+    __slots__ = ("accounting", "name", "start")
+
+    def __init__(self, accounting, name):
+        self.accounting = accounting
+        self.name = name
+
+    def __enter__(self):
+        # the second entry accumulates the time of the phases nested in this one
+        self.accounting._stack.append([self.name, 0.0])
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        accounting = self.accounting
+        nested = accounting._stack.pop()[1]
+        accounting.times[self.name] = accounting.times.get(self.name, 0.0) + elapsed - nested
+        accounting.calls[self.name] = accounting.calls.get(self.name, 0) + 1
+        if accounting._stack:
+            accounting._stack[-1][1] += elapsed
+        return False
+
+
+# accounting of the task currently running on this worker, see run_accounted
+_worker_accounting = None
+
+
+def worker_phase(name):
+    """
+    Returns a context manager adding the time spent in its body to a phase of the task currently running on this
+    worker, if the task is accounted (see run_accounted), and doing nothing otherwise.
+
+    Parameters
+    ----------
+    name: str
+        Name of the phase, e.g. 'simulate', 'statistics' or 'distance'.
+    """
+    if _worker_accounting is None:
+        return _NO_PHASE
+    return _worker_accounting.phase(name)
+
+
+def accounted(name):
+    """
+    Decorator making the calls of a function a phase of the tasks running on the workers, see worker_phase.
+
+    Parameters
+    ----------
+    name: str
+        Name of the phase.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if _worker_accounting is None:
+                return func(*args, **kwargs)
+            with _worker_accounting.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def run_accounted(func, *args):
+    """
+    Calls a function while accounting for the time spent in the phases timed with worker_phase.
+
+    Parameters
+    ----------
+    func: callable
+        The function to call.
+    args:
+        The arguments of the function.
+
+    Returns
+    -------
+    tuple
+        The result of the function and the accounting of the call, see WorkerAccounting.summary.
+    """
+    global _worker_accounting
+    previous, _worker_accounting = _worker_accounting, WorkerAccounting()
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+        return result, _worker_accounting.summary(time.perf_counter() - start)
+    finally:
+        _worker_accounting = previous
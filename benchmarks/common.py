@@ -0,0 +1,99 @@
+"""
+Helpers shared by the benchmarks: creating the backends, describing the environment, and storing and comparing
+results.
+"""
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+
+import numpy as np
+
+
+def create_backend(name, parallelism=None):
+    """
+    Returns the backend with the given name: 'dummy', 'spark', running Spark in local mode with `parallelism` workers
+    (by default one per core), or 'mpi', to be run with mpirun; with MPI only the scheduler returns.
+    """
+    if name == "dummy":
+        from abcpy.backends import BackendDummy
+        return BackendDummy()
+    if name == "spark":
+        import pyspark
+        from abcpy.backends import BackendSpark
+        sc = pyspark.SparkContext("local[%s]" % (parallelism or "*"), "abcpy-benchmarks")
+        # the workers need the benchmark models to unpickle the tasks
+        sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.py"))
+        return BackendSpark(sc, parallelism=parallelism or sc.defaultParallelism)
+    if name == "mpi":
+        from abcpy.backends import BackendMPI
+        return BackendMPI()
+    raise ValueError("Unknown backend %s." % name)
+
+
+def peak_rss_mb():
+    """Returns the peak resident memory of the current process since it started, in megabytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def environment(backend):
+    """Returns a description of the software and machine the benchmarks run on."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        with open(os.path.join(root, "VERSION")) as f:
+            version = f.readline().strip()
+    except OSError:
+        version = None
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                           cwd=root).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {"date": datetime.datetime.now().isoformat(), "version": version, "revision": revision,
+            "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "node": platform.node(), "cpus": os.cpu_count(), "backend": backend}
+
+
+def save_results(results, path):
+    """Stores the results of a benchmark run as JSON."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=1, default=float)
+
+
+def compare_results(baseline_path, records, keys, metric, higher_is_better):
+    """
+    Matches the records of a run with the ones of a previous run stored in baseline_path, and returns for every case
+    found in both the key, the baseline and current values of the metric and the relative change, where a positive
+    change is an improvement.
+    """
+    with open(baseline_path) as f:
+        baseline = {tuple(record[key] for key in keys): record for record in json.load(f)["records"]}
+    comparison = []
+    for record in records:
+        key = tuple(record[name] for name in keys)
+        if key not in baseline or record.get("error") or baseline[key].get("error"):
+            continue
+        old, new = baseline[key][metric], record[metric]
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        comparison.append((key, old, new, change if higher_is_better else -change))
+    return comparison
+
+
+def print_comparison(comparison, tolerance):
+    """Prints a comparison returned by compare_results and returns the cases worse by more than the tolerance."""
+    regressions = []
+    for key, old, new, change in comparison:
+        flag = ""
+        if change < -tolerance:
+            flag = "REGRESSION"
+            regressions.append(key)
+        print("{:<60} {:12.4g} -> {:12.4g} {:+7.1%} {}".format(" ".join(str(k) for k in key), old, new, change, flag))
+    print("%d cases compared, %d regressions" % (len(comparison), len(regressions)))
+    return regressions
@@ -0,0 +1,179 @@
+"""
+End-to-end benchmark of the inference schemes on the toy models of models.py, for several numbers of particles,
+dimensionalities and simulator costs. For every case it reports the wall-clock time, the throughput in simulations per
+second, the time spent in every phase of the scheme and on the workers (see abcpy.utils.Profiler) and the peak memory
+of the scheduler process, and stores the results in a JSON file which can be compared to the results of a previous
+run. With the dummy backend every case runs in a new process, such that the peak resident memory is the one of the
+case; the other backends run all the cases in the same process, whose peak resident memory is then not reported.
+
+Examples
+--------
+    python benchmarks/inferences.py --schemes PMCABC SMCABC --n-samples 100 1000 --output results.json
+    python benchmarks/inferences.py --compare results.json --output new_results.json
+    python benchmarks/inferences.py --backend spark --parallelism 4
+    mpirun -np 4 python benchmarks/inferences.py --backend mpi
+"""
+import argparse
+import itertools
+import multiprocessing
+import time
+import tracemalloc
+
+import numpy as np
+
+from abcpy.approx_lhd import SynLikelihood
+from abcpy.inferences import RejectionABC, PMCABC, SABC, ABCsubsim, RSMCABC, APMCABC, SMCABC, PMC
+from abcpy.utils import Profiler
+
+from common import compare_results, create_backend, environment, peak_rss_mb, print_comparison, save_results
+from models import MODELS
+
+SCHEMES = {"RejectionABC": RejectionABC, "PMCABC": PMCABC, "SABC": SABC, "ABCsubsim": ABCsubsim,
+           "RSMCABC": RSMCABC, "APMCABC": APMCABC, "SMCABC": SMCABC, "PMC": PMC}
+
+
+def pilot_distances(models, distances, observations, backend, n_pilot=100):
+    """
+    Returns the sorted distances between the observations and data simulated from the prior predictive distribution,
+    used to set the thresholds of the schemes on a scale that does not depend on the model.
+    """
+    sampler = RejectionABC(models, distances, backend, seed=0)
+    journal = sampler.sample(observations, n_pilot, 1, np.finfo(float).max)
+    return np.sort(np.asarray(journal.get_distances(), dtype=float).reshape(-1))
+
+
+def run_scheme(scheme, models, distances, observations, backend, n_samples, steps, pilot, seed, profiler):
+    """Runs one inference scheme with the given profiler and returns the sampler."""
+    quantile = lambda q: float(np.quantile(pilot, q))
+    if scheme == "PMC":
+        likfuns = [SynLikelihood(distance.statistics_calc) for distance in distances]
+        sampler = PMC(models, likfuns, backend, seed=seed)
+    else:
+        sampler = SCHEMES[scheme](models, distances, backend, seed=seed)
+    sampler.set_profiler(profiler)
+
+    if scheme == "RejectionABC":
+        sampler.sample(observations, n_samples, 1, quantile(0.2))
+    elif scheme == "PMCABC":
+        sampler.sample(observations, steps, np.array([quantile(0.5)]), n_samples, 1, 50)
+    elif scheme == "SABC":
+        sampler.sample(observations, steps, quantile(0.5), n_samples, 1, ar_cutoff=0)
+    elif scheme == "ABCsubsim":
+        sampler.sample(observations, steps, n_samples, 1, ap_change_cutoff=0)
+    elif scheme == "RSMCABC":
+        sampler.sample(observations, steps, n_samples, 1, epsilon_init=quantile(0.9), epsilon_final=0)
+    elif scheme == "APMCABC":
+        sampler.sample(observations, steps, n_samples, 1, alpha=0.5, acceptance_cutoff=0)
+    elif scheme == "SMCABC":
+        sampler.sample(observations, steps, n_samples, 1, epsilon_final=0)
+    elif scheme == "PMC":
+        # the synthetic likelihood treats every simulated data point as a data set, like a single observation
+        sampler.sample([observation[:1] for observation in observations], steps, n_samples, n_samples_per_param=20)
+    return sampler
+
+
+def run_isolated_case(*args):
+    """Runs one benchmark case with the dummy backend in a new process and returns its record, including the peak
+    resident memory of that process."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_run_dummy_case, args)
+
+
+def _run_dummy_case(*args):
+    record = run_case(create_backend("dummy"), *args)
+    record["peak_rss_mb"] = peak_rss_mb()
+    return record
+
+
+def run_case(backend, scheme, model, n_samples, dim, cost, steps, seed=1, trace_memory=False):
+    """Runs one benchmark case and returns its record. The peak resident memory is only known for the cases run in
+    their own process, see run_isolated_case."""
+    models, distances, observations = MODELS[model](dim, cost)
+    pilot = pilot_distances(models, distances, observations, backend)
+
+    profiles = []
+    profiler = Profiler(callback=profiles.append)
+    sampler, error = None, None
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        sampler = run_scheme(scheme, models, distances, observations, backend, n_samples, steps, pilot, seed,
+                             profiler)
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    wall_time = time.perf_counter() - start
+    peak_traced_mb = None
+    if trace_memory:
+        peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2. ** 20
+        tracemalloc.stop()
+
+    # RejectionABC has no generations; its backend calls are in the profile not ended by a generation
+    if not profiles:
+        profiles.append(profiler.end_generation(0))
+    phases, counters = {}, {}
+    for profile in profiles:
+        for name, seconds in profile["time"].items():
+            phases[name] = phases.get(name, 0.0) + seconds
+        for name, value in profile["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+    simulations = sampler.simulation_counter if sampler is not None else 0
+
+    return {"scheme": scheme, "model": model, "n_samples": n_samples, "dim": dim, "cost": cost, "steps": steps,
+            "seed": seed, "error": error, "wall_time": wall_time, "simulations": int(simulations),
+            "throughput": simulations / wall_time, "generations": len(profiles), "phases": phases,
+            "counters": counters, "worker_fractions": Profiler.worker_fractions({"time": phases}),
+            "peak_rss_mb": None, "peak_traced_mb": peak_traced_mb}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("dummy", "spark", "mpi"), default="dummy")
+    parser.add_argument("--parallelism", type=int, default=None,
+                        help="number of local Spark workers, by default all cores")
+    parser.add_argument("--schemes", nargs="+", choices=sorted(SCHEMES), default=sorted(SCHEMES))
+    parser.add_argument("--models", nargs="+", choices=sorted(MODELS), default=["gaussian"])
+    parser.add_argument("--n-samples", nargs="+", type=int, default=[100])
+    parser.add_argument("--dims", nargs="+", type=int, default=[2],
+                        help="dimension of the mean of 'mvnormal' and number of groups of 'hierarchical'")
+    parser.add_argument("--costs", nargs="+", type=float, default=[0.],
+                        help="time of one simulated data point in seconds")
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=1, help="number of runs of every case, with seeds 1, 2, ...")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report the peak memory allocated through Python, which slows down the runs")
+    parser.add_argument("--output", default=None, help="JSON file storing the results")
+    parser.add_argument("--compare", default=None, help="JSON file with the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative loss of throughput reported as a regression")
+    args = parser.parse_args(argv)
+
+    backend = create_backend(args.backend, args.parallelism) if args.backend != "dummy" else None
+    records = []
+    for scheme, model, n_samples, dim, cost, seed in itertools.product(
+            args.schemes, args.models, args.n_samples, args.dims, args.costs, range(1, args.repeat + 1)):
+        # the gaussian model has a fixed dimension
+        if model == "gaussian" and dim != args.dims[0]:
+            continue
+        case = (scheme, model, n_samples, dim, cost, args.steps, seed, args.trace_memory)
+        record = run_isolated_case(*case) if backend is None else run_case(backend, *case)
+        records.append(record)
+        memory = "" if record["peak_rss_mb"] is None else "{:8.1f} MB".format(record["peak_rss_mb"])
+        print("{scheme:>12} {model:>12} n={n_samples:<6} dim={dim:<3} cost={cost:<8g} {wall_time:8.2f}s "
+              "{throughput:10.1f} sim/s {memory:>11} {status}".format(
+                  memory=memory, status=record["error"] or "", **record), flush=True)
+
+    results = {"environment": environment(args.backend), "arguments": vars(args), "records": records}
+    if args.output is not None:
+        save_results(results, args.output)
+    if args.compare is not None:
+        regressions = print_comparison(compare_results(args.compare, records, ("scheme", "model", "n_samples", "dim",
+                                                                               "cost", "steps", "seed"),
+                                                       "throughput", higher_is_better=True), args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
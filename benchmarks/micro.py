@@ -0,0 +1,184 @@
+"""
+Micro-benchmarks of the hot paths of ABCpy: the recursive functions on the graph of the models, the perturbation
+kernel, the Euclidean distance, the polynomial expansion of the statistics, the accepted parameters manager and the
+similarity matrix used to learn statistics. Every benchmark is timed for several controlled sizes, and the best time
+per call is stored in a JSON file which can be compared to the results of a previous run.
+
+Examples
+--------
+    python benchmarks/micro.py --output micro.json
+    python benchmarks/micro.py --filter graph kernel --compare micro.json
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from abcpy.backends import BackendDummy
+from abcpy.continuousmodels import Normal, Uniform
+from abcpy.distances import Euclidean
+from abcpy.inferences import PMCABC
+from abcpy.statistics import Identity
+
+from common import compare_results, environment, print_comparison, save_results
+
+
+def graph(depth, width):
+    """
+    Returns a root model whose graph has `depth` layers of `width` free parameters: the first layer is drawn from
+    uniform priors, every other parameter from a normal distribution centered at a parameter of the previous layer.
+    """
+    layer = [Uniform([[0], [1]], name='p0_%d' % i) for i in range(width)]
+    for d in range(1, depth):
+        layer = [Normal([parent, 1], name='p%d_%d' % (d, i)) for i, parent in enumerate(layer)]
+    mean = layer[0]
+    for parameter in layer[1:]:
+        mean = mean + parameter
+    return Normal([mean, 1], name='y')
+
+
+def sampler_with_population(depth, width, n_particles):
+    """
+    Returns a PMCABC sampler on the graph of the given size, with a population of particles sampled from the prior
+    broadcasted as accepted parameters, together with the kernel parameters and covariance matrices.
+    """
+    backend = BackendDummy()
+    sampler = PMCABC([graph(depth, width)], [Euclidean(Identity())], backend, seed=1)
+    rng = np.random.RandomState(1)
+    parameters = []
+    for _ in range(n_particles):
+        sampler.sample_from_prior(rng=rng)
+        parameters.append(sampler.get_parameters())
+    manager = sampler.accepted_parameters_manager
+    manager.update_broadcast(backend, accepted_parameters=parameters,
+                             accepted_weights=np.ones((n_particles, 1)) / n_particles)
+    manager.update_kernel_values(backend, [manager.get_accepted_parameters_bds_values(kernel.models)
+                                           for kernel in sampler.kernel.kernels])
+    manager.update_broadcast(backend, accepted_cov_mats=sampler.kernel.calculate_cov(manager))
+    return sampler, parameters
+
+
+def bench_graph_sample_from_prior(depth, width):
+    sampler, _ = sampler_with_population(depth, width, 10)
+    rng = np.random.RandomState(1)
+    return lambda: sampler.sample_from_prior(rng=rng)
+
+
+def bench_graph_get_parameters(depth, width):
+    sampler, _ = sampler_with_population(depth, width, 10)
+    return sampler.get_parameters
+
+
+def bench_graph_set_parameters(depth, width):
+    sampler, parameters = sampler_with_population(depth, width, 10)
+    return lambda: sampler.set_parameters(parameters[0])
+
+
+def bench_graph_pdf_of_prior(depth, width):
+    sampler, parameters = sampler_with_population(depth, width, 10)
+    return lambda: sampler.pdf_of_prior(sampler.model, parameters[0])
+
+
+def bench_kernel_update(n_particles, width):
+    sampler, _ = sampler_with_population(1, width, n_particles)
+    rng = np.random.RandomState(1)
+    return lambda: sampler.kernel.update(sampler.accepted_parameters_manager, 0, rng=rng)
+
+
+def bench_kernel_pdf(n_particles, width):
+    sampler, parameters = sampler_with_population(1, width, n_particles)
+    manager = sampler.accepted_parameters_manager
+    mapping, _ = manager.get_mapping(manager.model)
+    return lambda: sampler.kernel.pdf(mapping, manager, parameters[0], parameters[-1])
+
+
+def bench_accepted_parameters_bds_values(n_particles, width):
+    sampler, _ = sampler_with_population(1, width, n_particles)
+    manager = sampler.accepted_parameters_manager
+    models = sampler.kernel.kernels[0].models
+    return lambda: manager.get_accepted_parameters_bds_values(models)
+
+
+def bench_euclidean_distance(n_points, dim):
+    rng = np.random.RandomState(1)
+    observation = list(rng.normal(size=(n_points, dim)))
+    simulation = list(rng.normal(size=(n_points, dim)))
+    distance = Euclidean(Identity(degree=2, cross=False))
+    return lambda: distance.distance(observation, simulation)
+
+
+def bench_polynomial_expansion(n_points, n_statistics, degree, cross):
+    statistics = np.random.RandomState(1).normal(size=(n_points, n_statistics))
+    statistics_calc = Identity(degree=degree, cross=cross)
+    return lambda: statistics_calc._polynomial_expansion(statistics)
+
+
+def bench_compute_similarity_matrix(n_samples, dim):
+    from abcpy.NN_utilities.utilities import compute_similarity_matrix
+    target = np.random.RandomState(1).normal(size=(n_samples, dim))
+    return lambda: compute_similarity_matrix(target, quantile=0.1)
+
+
+# every benchmark with the sizes it is timed for, as keyword arguments of its setup function
+BENCHMARKS = [
+    (bench_graph_sample_from_prior, [dict(depth=depth, width=width) for depth in (1, 4) for width in (2, 16)]),
+    (bench_graph_get_parameters, [dict(depth=depth, width=width) for depth in (1, 4) for width in (2, 16)]),
+    (bench_graph_set_parameters, [dict(depth=depth, width=width) for depth in (1, 4) for width in (2, 16)]),
+    (bench_graph_pdf_of_prior, [dict(depth=depth, width=width) for depth in (1, 4) for width in (2, 16)]),
+    (bench_kernel_update, [dict(n_particles=n, width=width) for n in (100, 1000) for width in (2, 16)]),
+    (bench_kernel_pdf, [dict(n_particles=n, width=width) for n in (100, 1000) for width in (2, 16)]),
+    (bench_accepted_parameters_bds_values, [dict(n_particles=n, width=width) for n in (100, 1000)
+                                            for width in (2, 16)]),
+    (bench_euclidean_distance, [dict(n_points=n, dim=dim) for n in (10, 100) for dim in (1, 10)]),
+    (bench_polynomial_expansion, [dict(n_points=n, n_statistics=p, degree=3, cross=True) for n in (10, 1000)
+                                  for p in (2, 20)]),
+    (bench_compute_similarity_matrix, [dict(n_samples=n, dim=5) for n in (100, 300)]),
+]
+
+
+def time_call(func, repeat, min_time):
+    """Returns the best time of one call of func over `repeat` measurements of at least `min_time` seconds each."""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", nargs="+", default=None,
+                        help="only run the benchmarks whose name contains one of these strings")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="minimum duration of one measurement in seconds")
+    parser.add_argument("--output", default=None, help="JSON file storing the results")
+    parser.add_argument("--compare", default=None, help="JSON file with the results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative increase of the time per call reported as a regression")
+    args = parser.parse_args(argv)
+
+    records = []
+    for setup, sizes in BENCHMARKS:
+        name = setup.__name__[len("bench_"):]
+        if args.filter and not any(pattern in name for pattern in args.filter):
+            continue
+        for size in sizes:
+            seconds = time_call(setup(**size), args.repeat, args.min_time)
+            size = " ".join("%s=%s" % item for item in size.items())
+            records.append({"benchmark": name, "size": size, "time": seconds})
+            print("{:>30} {:<52} {:12.3f} us".format(name, size, seconds * 1e6), flush=True)
+
+    results = {"environment": environment("dummy"), "arguments": vars(args), "records": records}
+    if args.output is not None:
+        save_results(results, args.output)
+    if args.compare is not None:
+        regressions = print_comparison(compare_results(args.compare, records, ("benchmark", "size"), "time",
+                                                       higher_is_better=False), args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,81 @@
+"""
+Scalable toy models used by the benchmarks. Every problem is built by a function taking the dimensionality and the
+cost of one simulation in seconds, and returns the root models, their distances and the observations, which are
+simulated from the model at fixed parameter values.
+"""
+import time
+
+import numpy as np
+
+from abcpy.continuousmodels import MultivariateNormal, Normal, Uniform
+from abcpy.distances import Euclidean
+from abcpy.statistics import Identity
+
+
+class SimulatorCost(object):
+    """
+    Mixin making a model busy-wait for `cost` seconds per simulated data point, to emulate expensive simulators
+    without depending on the speed of the machine.
+    """
+
+    cost = 0.0
+
+    def forward_simulate(self, input_values, k, rng=np.random.RandomState(), mpi_comm=None):
+        deadline = time.perf_counter() + self.cost * k
+        result = super(SimulatorCost, self).forward_simulate(input_values, k, rng=rng)
+        while time.perf_counter() < deadline:
+            pass
+        return result
+
+
+class CostlyNormal(SimulatorCost, Normal):
+    pass
+
+
+class CostlyMultivariateNormal(SimulatorCost, MultivariateNormal):
+    pass
+
+
+def gaussian(dim=1, cost=0.0, n_obs=20):
+    """
+    Univariate Gaussian with unknown mean and standard deviation; `dim` is ignored.
+    """
+    mu = Uniform([[150], [200]], name='mu')
+    sigma = Uniform([[5], [25]], name='sigma')
+    model = CostlyNormal([mu, sigma], name='y')
+    model.cost = cost
+    observation = np.random.RandomState(0).normal(170, 15, n_obs).tolist()
+    return [model], [Euclidean(Identity(degree=2, cross=False))], [observation]
+
+
+def multivariate_normal(dim=2, cost=0.0, n_obs=20):
+    """
+    Multivariate normal with identity covariance and an unknown mean of dimension `dim`.
+    """
+    means = [Uniform([[-5], [5]], name='mu%d' % i) for i in range(dim)]
+    model = CostlyMultivariateNormal([means, np.eye(dim).tolist()], name='y')
+    model.cost = cost
+    observation = list(np.random.RandomState(0).multivariate_normal(np.linspace(-1, 1, dim), np.eye(dim), n_obs))
+    return [model], [Euclidean(Identity(degree=1, cross=False))], [observation]
+
+
+def hierarchical(dim=2, cost=0.0, n_obs=20):
+    """
+    Hierarchical Gaussian with `dim` groups: the group means are drawn from a normal distribution with unknown mean
+    and standard deviation, and every group is observed.
+    """
+    mu = Uniform([[-5], [5]], name='mu')
+    tau = Uniform([[0.1], [3]], name='tau')
+    models, distances, observations = [], [], []
+    rng = np.random.RandomState(0)
+    for group in range(dim):
+        theta = Normal([mu, tau], name='theta%d' % group)
+        model = CostlyNormal([theta, 1], name='y%d' % group)
+        model.cost = cost
+        models.append(model)
+        distances.append(Euclidean(Identity(degree=2, cross=False)))
+        observations.append(rng.normal(rng.normal(1, 1), 1, n_obs).tolist())
+    return models, distances, observations
+
+
+MODELS = {"gaussian": gaussian, "mvnormal": multivariate_normal, "hierarchical": hierarchical}
@@ -0,0 +1,161 @@
+import unittest
+import warnings
+import numpy as np
+from abcpy.NN_utilities.utilities import compute_similarity_matrix, dist2
+
+try:
+    import torch
+except ImportError:
+    has_torch = False
+else:
+    has_torch = True
+    from abcpy.NN_utilities.algorithms import FP_nn_training
+    from abcpy.NN_utilities.datasets import Similarities, SiameseSimilarities, TripletSimilarities, \
+        ParameterSimulationPairs
+    from abcpy.NN_utilities.networks import createDefaultNN
+    from abcpy.NN_utilities.trainer import InMemoryLoader
+
+
+class ComputeSimilarityMatrixTests(unittest.TestCase):
+    def setUp(self):
+        self.target = np.random.RandomState(1).normal(size=(50, 3))
+        self.pairwise_distances = np.array([[dist2(x, y) for y in self.target] for x in self.target])
+
+    def test_similarity_matrix(self):
+        q = np.quantile(self.pairwise_distances[~np.eye(50, dtype=bool)], 0.1)
+        similarity_set, pairwise_distances = compute_similarity_matrix(self.target, 0.1,
+                                                                       return_pairwise_distances=True, block_size=16)
+        self.assertTrue(np.allclose(pairwise_distances, self.pairwise_distances))
+        self.assertTrue((similarity_set == (self.pairwise_distances < q)).all())
+        self.assertTrue(np.diag(similarity_set).all())
+
+        # sparse representation
+        sparse_similarity_set = compute_similarity_matrix(self.target, 0.1, block_size=16, sparse=True)
+        self.assertEqual(sparse_similarity_set.nnz, np.sum(similarity_set))
+        self.assertTrue((sparse_similarity_set.toarray() == similarity_set).all())
+
+        self.assertRaises(RuntimeError, compute_similarity_matrix, self.target, 0)
+
+    def test_approximate_quantile(self):
+        similarity_set = compute_similarity_matrix(self.target, 0.1, n_pairs=2000, block_size=16,
+                                                   rng=np.random.RandomState(1))
+        self.assertAlmostEqual(np.mean(similarity_set), 0.1, delta=0.03)
+        # the same pairs give the same similarity set, in both representations
+        sparse_similarity_set = compute_similarity_matrix(self.target, 0.1, n_pairs=2000, sparse=True,
+                                                          rng=np.random.RandomState(1))
+        self.assertTrue((sparse_similarity_set.toarray() == similarity_set).all())
+
+
+class SimilaritiesTests(unittest.TestCase):
+    def setUp(self):
+        target = np.random.RandomState(1).normal(size=(60, 2))
+        self.similarity_set = compute_similarity_matrix(target, 0.2)
+        self.samples = np.arange(60, dtype=float).reshape(-1, 1)
+        np.random.seed(1)
+
+    def test_neighbours(self):
+        if has_torch:
+            for similarity_set in (self.similarity_set, compute_similarity_matrix(
+                    self.samples, 0.2, sparse=True)):
+                dataset = Similarities(self.samples, similarity_set, "cpu")
+                dense = similarity_set if isinstance(similarity_set, np.ndarray) else similarity_set.toarray()
+                for i in range(60):
+                    neighbours = dataset.indices[dataset.indptr[i]:dataset.indptr[i + 1]]
+                    self.assertEqual(list(neighbours), [j for j in np.flatnonzero(dense[i]) if j != i])
+                index = np.repeat(np.arange(60), 60)
+                other_index = np.tile(np.arange(60), 60)
+                self.assertTrue((dataset.is_similar(index, other_index) ==
+                                 (dense.reshape(-1) & (index != other_index))).all())
+                self.assertEqual(dataset[3][1].shape, (60,))
+                self.assertEqual(dataset[[3, 4]][1].shape, (2, 60))
+
+    def test_siamese_batch(self):
+        if has_torch:
+            dataset = Similarities(self.samples, self.similarity_set, "cpu")
+            for positive_weight in (None, 0.5):
+                pairs = SiameseSimilarities(dataset, positive_weight=positive_weight)
+                (first, second), target = pairs[list(range(60))]
+                self.assertEqual(first.shape, (60, 1))
+                self.assertEqual(second.shape, (60, 1))
+                first, second = first.numpy().astype(int).reshape(-1), second.numpy().astype(int).reshape(-1)
+                self.assertTrue((first != second).all())
+                self.assertTrue((target.numpy() == self.similarity_set[first, second]).all())
+                (first, second), target = pairs[5]
+                self.assertEqual(first.shape, (1,))
+                self.assertEqual(target, self.similarity_set[5, int(second[0])])
+
+    def test_triplet_batch(self):
+        if has_torch:
+            dataset = Similarities(self.samples, self.similarity_set, "cpu")
+            triplets = TripletSimilarities(dataset)
+            has_similar = dataset.n_similar > 0
+            with warnings.catch_warnings(record=True):
+                warnings.simplefilter("always")
+                (anchor, positive, negative), target = triplets[list(range(60))]
+            self.assertEqual(target, [])
+            anchor, positive, negative = [x.numpy().astype(int).reshape(-1) for x in (anchor, positive, negative)]
+            # the samples without similar samples are replaced by other anchors
+            self.assertTrue((anchor[has_similar] == np.arange(60)[has_similar]).all())
+            self.assertTrue(has_similar[anchor].all())
+            self.assertTrue((anchor != positive).all())
+            self.assertTrue(self.similarity_set[anchor, positive].all())
+            self.assertFalse(self.similarity_set[anchor, negative].any())
+
+
+    def test_no_dissimilar(self):
+        if has_torch:
+            # the first sample is similar to all the others
+            similarity_set = np.eye(4, dtype=bool)
+            similarity_set[0, :] = similarity_set[:, 0] = True
+            dataset = Similarities(self.samples[:4], similarity_set, "cpu")
+            self.assertEqual(list(dataset.n_dissimilar), [0, 2, 2, 2])
+            self.assertRaises(RuntimeError, dataset.sample_dissimilar, np.array([1, 0]))
+            # the first sample is replaced by other anchors in the triplets, and is paired randomly in the pairs
+            with warnings.catch_warnings(record=True):
+                warnings.simplefilter("always")
+                (anchor, positive, negative), target = TripletSimilarities(dataset)[[0, 0, 1]]
+            self.assertTrue((anchor.numpy().reshape(-1) != 0).all())
+            (first, second), target = SiameseSimilarities(dataset, positive_weight=0.5)[[0, 0, 0]]
+            self.assertTrue((target.numpy() == 1).all())
+            empty = Similarities(self.samples[:4], np.ones((4, 4), dtype=bool), "cpu")
+            self.assertRaises(RuntimeError, TripletSimilarities(empty).__getitem__, [0])
+
+
+class TrainerTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.parameters = rng.normal(size=(50, 2))
+        self.simulations = self.parameters + 0.1 * rng.normal(size=(50, 2))
+        if has_torch:
+            torch.manual_seed(1)
+
+    def test_in_memory_loader(self):
+        if has_torch:
+            dataset = ParameterSimulationPairs(self.simulations, self.parameters, "cpu")
+            loader = InMemoryLoader(dataset, 16)
+            batches = list(loader)
+            self.assertEqual(len(loader), 4)
+            self.assertEqual([len(simulations) for simulations, parameters in batches], [16, 16, 16, 2])
+            # every sample is in one batch, together with its parameter
+            simulations = torch.cat([simulations for simulations, parameters in batches]).numpy()
+            parameters = torch.cat([parameters for simulations, parameters in batches]).numpy()
+            order = np.argsort(parameters[:, 0])
+            self.assertTrue(np.allclose(parameters[order], self.parameters[np.argsort(self.parameters[:, 0])]))
+            self.assertTrue(np.allclose(simulations[order], self.simulations[np.argsort(self.parameters[:, 0])]))
+
+    def test_fit(self):
+        if has_torch:
+            n_threads = torch.get_num_threads()
+            net = createDefaultNN(2, 2)()
+            loss = torch.nn.MSELoss()
+            samples = torch.from_numpy(self.simulations.astype("float32"))
+            targets = torch.from_numpy(self.parameters.astype("float32"))
+            initial_loss = loss(net(samples), targets).item()
+            net = FP_nn_training(self.simulations, self.parameters, net, cuda=False, batch_size=8, n_epochs=20,
+                                 n_threads=1)
+            self.assertLess(loss(net(samples), targets).item(), initial_loss)
+            self.assertEqual(torch.get_num_threads(), n_threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,10 @@ from abcpy.distances import LogReg
 from abcpy.statistics import Identity
 from abcpy.backends import BackendDummy as Backend
 from abcpy.perturbationkernel import *
+from abcpy.utils import SimulationCache
+import gc
+import pickle
+import weakref
 
 """Tests whether the methods defined for operations on the graph work as intended."""
 
@@ -263,6 +267,81 @@ class PdfOfPriorTests(unittest.TestCase):
         self.assertTrue(self.pdf3 == 7.1655940847160915)
 
 
+class SimulationCacheTests(unittest.TestCase):
+    """Tests whether simulate reuses cached simulations correctly."""
+    def setUp(self):
+        self.N1 = Normal([0.1, 0.01])
+        self.graph = Normal([self.N1, 0.5])
+
+        statistics_calculator = Identity(degree=2, cross=False)
+        distance_calculator = LogReg(statistics_calculator)
+        backend = Backend()
+
+        self.sampler = RejectionABC([self.graph], [distance_calculator], backend)
+        self.sampler.set_parameters([0.2])
+
+    def test_stochastic(self):
+        self.sampler.simulation_cache = SimulationCache(max_entries=10)
+        rng1 = np.random.RandomState(1)
+        result1 = self.sampler.simulate(5, rng=rng1)
+        rng2 = np.random.RandomState(1)
+        result2 = self.sampler.simulate(5, rng=rng2)
+
+        # the same random number generator state reuses the simulation and advances the generator identically
+        self.assertEqual(self.sampler.simulation_cache.hits, 1)
+        self.assertTrue(np.array_equal(result1[0], result2[0]))
+        self.assertEqual(rng1.rand(), rng2.rand())
+
+        # a different state simulates again
+        self.sampler.simulate(5, rng=np.random.RandomState(2))
+        self.assertEqual(self.sampler.simulation_cache.hits, 1)
+        self.assertEqual(len(self.sampler.simulation_cache), 2)
+
+    def test_deterministic_and_eviction(self):
+        self.sampler.simulation_cache = SimulationCache(max_entries=1, deterministic=True)
+        result1 = self.sampler.simulate(5, rng=np.random.RandomState(1))
+        result2 = self.sampler.simulate(5, rng=np.random.RandomState(2))
+        self.assertIs(result1, result2)
+
+        self.sampler.set_parameters([0.3])
+        self.sampler.simulate(5, rng=np.random.RandomState(1))
+        self.assertEqual(len(self.sampler.simulation_cache), 1)
+        self.sampler.set_parameters([0.2])
+        self.sampler.simulate(5, rng=np.random.RandomState(1))
+        self.assertEqual(self.sampler.simulation_cache.hits, 1)
+
+    def test_memory_cap_and_pickle(self):
+        cache = SimulationCache(max_bytes=100, deterministic=True)
+        self.sampler.simulation_cache = cache
+        self.sampler.simulate(5, rng=np.random.RandomState(1))
+        self.sampler.simulate(100, rng=np.random.RandomState(1))
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.nbytes, 100)
+
+        # copies in the same process share the storage
+        self.assertIs(pickle.loads(pickle.dumps(cache)), cache)
+
+    def test_models_and_release(self):
+        cache = SimulationCache(deterministic=True)
+        self.sampler.simulation_cache = cache
+        other_sampler = RejectionABC([StudentT([self.N1, 0.5])], [LogReg(Identity(degree=2, cross=False))],
+                                     Backend())
+        other_sampler.simulation_cache = cache
+        other_sampler.set_parameters([0.2])
+
+        # the same input values of different models are simulated again
+        self.sampler.simulate(5, rng=np.random.RandomState(1))
+        other_sampler.simulate(5, rng=np.random.RandomState(1))
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(len(cache), 2)
+
+        # the storage of a cache is released with the last object using it
+        cache = weakref.ref(cache)
+        self.sampler.simulation_cache = other_sampler.simulation_cache = None
+        gc.collect()
+        self.assertIsNone(cache())
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -1,3 +1,7 @@
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
 import numpy as np
 
@@ -10,9 +14,28 @@ from abcpy.approx_lhd import SynLikelihood
 
 from abcpy.continuousmodels import Uniform
 
-from abcpy.statistics import Identity
+from abcpy.statistics import Identity, LinearTransformation
+from abcpy.statisticslearning import Semiautomatic
 
 from abcpy.inferences import RejectionABC, PMC, PMCABC, SABC, ABCsubsim, SMCABC, APMCABC, RSMCABC
+from abcpy.output import Journal
+from abcpy.utils import Profiler
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(sampler, step):
+    """Makes the sampler fail as if the process was killed once the checkpoint of the given step is saved."""
+    save_checkpoint = sampler._save_checkpoint
+
+    def save_and_interrupt(aStep, journal, **state):
+        save_checkpoint(aStep, journal, **state)
+        if aStep == step:
+            raise Interrupted()
+    sampler._save_checkpoint = save_and_interrupt
+
 
 class RejectionABCTest(unittest.TestCase):
     def test_sample(self):
@@ -54,6 +77,30 @@ class RejectionABCTest(unittest.TestCase):
 
         self.assertFalse(journal.number_of_simulations==0)
 
+    def test_budget(self):
+        dummy = BackendDummy()
+        mu = Uniform([[-5.0], [5.0]], name='mu')
+        sigma = Uniform([[0.0], [10.0]], name='sigma')
+        self.model = Normal([mu,sigma])
+        dist_calc = Euclidean(Identity(degree=2, cross=0))
+        y_obs = [np.array(9.8)]
+
+        # an unreachable threshold only stops because of the per-particle cap
+        sampler = RejectionABC([self.model], [dist_calc], dummy, seed = 1)
+        sampler.set_budget(max_simulations_per_particle=3)
+        journal = sampler.sample([y_obs], 10, 1, 1e-10)
+        self.assertEqual(journal.number_of_simulations[-1], 30)
+        self.assertEqual(len(journal.get_parameters()['mu']), 10)
+        self.assertEqual(journal.configuration["max_simulations_per_particle"], 3)
+        self.assertIsNone(journal.configuration["stop_reason"])
+
+        # the global budget is split between the particles
+        sampler = RejectionABC([self.model], [dist_calc], dummy, seed = 1)
+        sampler.set_budget(max_simulations=20)
+        journal = sampler.sample([y_obs], 10, 1, 1e-10)
+        self.assertEqual(journal.number_of_simulations[-1], 20)
+        self.assertEqual(journal.configuration["stop_reason"], "max_simulations")
+
 
 
 
@@ -215,6 +262,162 @@ class PMCABCTests(unittest.TestCase):
 
         self.assertFalse(journal.number_of_simulations == 0)
 
+    def test_budget(self):
+        # the simulation budget is used up in the first generation
+        T, n_sample, n_simulate, eps_arr, eps_percentile = 5, 10, 1, np.array([10.]), 10
+        sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        sampler.set_budget(max_simulations=15)
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile)
+
+        self.assertEqual(len(journal.get_parameters()['mu']), 10)
+        self.assertLessEqual(journal.number_of_simulations[-1], 20)
+        self.assertEqual(journal.configuration["stop_reason"], "max_simulations")
+        self.assertEqual(len([eps for eps in journal.configuration["epsilon_arr"] if eps is not None]), 2)
+
+        # the time budget stops the sampler after the first generation
+        sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        sampler.set_budget(max_time=0)
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+        self.assertEqual(len(journal.weights), 1)
+        self.assertEqual(journal.configuration["stop_reason"], "max_time")
+
+    def test_stream_journal(self):
+        T, n_sample, n_simulate, eps_arr, eps_percentile = 2, 10, 1, np.array([10.]), 50
+        sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+
+        path = tempfile.mkdtemp()
+        try:
+            sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+            sampler.stream_journal(path, fsync=False)
+            streamed_journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile,
+                                              full_output=1)
+            stored_journal = Journal.fromFile(path)
+
+            self.assertEqual(stored_journal.number_of_simulations, journal.number_of_simulations)
+            np.testing.assert_equal(stored_journal.configuration["epsilon_arr"], journal.configuration["epsilon_arr"])
+            for generation in range(T):
+                np.testing.assert_equal(streamed_journal.get_weights(generation), journal.get_weights(generation))
+                np.testing.assert_equal(stored_journal.get_accepted_parameters(generation),
+                                        journal.get_accepted_parameters(generation))
+                np.testing.assert_equal(stored_journal.posterior_mean(generation), journal.posterior_mean(generation))
+
+            # the stored journal can be used to continue the run
+            sampler.sample([self.observation], 1, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1,
+                           journal_file=path)
+            self.assertEqual(len(Journal.fromFile(path).weights), T + 1)
+        finally:
+            shutil.rmtree(path)
+
+    def test_diagnostics(self):
+        T, n_sample, n_simulate, eps_arr, eps_percentile = 2, 10, 1, np.array([10.]), 50
+        sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        sampler.set_diagnostics(quantiles=[0.5, 1])
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+
+        self.assertEqual(len(journal.diagnostics), T)
+        for generation in range(T):
+            diagnostics = journal.get_diagnostics(generation)
+            weights = journal.get_weights(generation).reshape(-1)
+            mu = np.array(journal.get_parameters(generation)['mu']).reshape(-1)
+            self.assertAlmostEqual(diagnostics["ess"], np.sum(weights) ** 2 / np.sum(weights ** 2))
+            self.assertAlmostEqual(diagnostics["mean"]["mu"][0], journal.posterior_mean(generation)["mu"])
+            self.assertAlmostEqual(diagnostics["var"]["mu"][0], np.cov(mu, aweights=weights, ddof=0))
+            self.assertEqual(diagnostics["quantiles"]["mu"][1, 0], np.max(mu))
+            cumulative_weights = np.cumsum(weights[np.argsort(mu)]) / np.sum(weights)
+            self.assertEqual(diagnostics["quantiles"]["mu"][0, 0], np.sort(mu)[np.argmax(cumulative_weights >= 0.5)])
+
+        sampler.set_diagnostics(enabled=False)
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+        self.assertEqual(journal.diagnostics, [])
+
+    def test_profiler(self):
+        T, n_sample, n_simulate, eps_arr, eps_percentile = 2, 10, 1, np.array([10.]), 50
+        profiles = []
+        sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        sampler.set_profiler(Profiler(callback=profiles.append))
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+
+        self.assertEqual(len(journal.profiles), T)
+        self.assertEqual(profiles, journal.profiles)
+        for generation in range(T):
+            profile = journal.get_profile(generation)
+            self.assertEqual(profile["step"], generation)
+            for phase in ("broadcast", "resample", "journal", "diagnostics", "backend.map", "backend.collect"):
+                self.assertIn(phase, profile["time"])
+            self.assertGreater(profile["counters"]["tasks"], 0)
+            self.assertGreater(profile["counters"]["bytes_broadcast"], 0)
+
+            # the workers account for the parts of their tasks, which add up to the time of the tasks
+            for part in ("simulate", "statistics", "distance", "graph", "framework"):
+                self.assertIn("worker." + part, profile["time"])
+            self.assertEqual(profile["counters"]["worker.simulate"], profile["counters"]["simulations"])
+            fractions = Profiler.worker_fractions(profile)
+            self.assertAlmostEqual(sum(fractions.values()), 1)
+            self.assertGreater(fractions["simulate"], 0)
+        for part in ("prior_pdf", "perturbation", "kernel_pdf"):
+            self.assertIn("worker." + part, journal.get_profile(1)["time"])
+        self.assertEqual(sum(profile["counters"]["simulations"] for profile in journal.profiles),
+                         sampler.simulation_counter)
+
+        # the profiler is not sent to the workers, and profiling can be switched off
+        self.assertNotIn("profiler", pickle.loads(pickle.dumps(sampler)).__dict__)
+        sampler.set_profiler(None)
+        self.assertIs(sampler.backend, self.backend)
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+        self.assertEqual(journal.profiles, [])
+
+    def test_checkpoint(self):
+        T, n_sample, n_simulate, eps_arr, eps_percentile = 3, 10, 1, np.array([10.]), 50
+        sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+
+        path = tempfile.mkdtemp()
+        try:
+            sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+            sampler.set_checkpoint(path, fsync=False)
+            interrupt_after(sampler, 1)
+            self.assertRaises(Interrupted, sampler.sample, [self.observation], T, eps_arr, n_sample, n_simulate,
+                              eps_percentile, full_output=1)
+
+            # a new sampler continues from the checkpoint and reproduces the uninterrupted run
+            sampler = PMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+            sampler.set_checkpoint(path, fsync=False)
+            resumed_journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile,
+                                             full_output=1)
+
+            self.assertEqual(resumed_journal.number_of_simulations, journal.number_of_simulations)
+            self.assertEqual(sampler.simulation_counter, journal.number_of_simulations[-1])
+            np.testing.assert_equal(resumed_journal.configuration["epsilon_arr"], journal.configuration["epsilon_arr"])
+            for generation in range(T):
+                np.testing.assert_equal(resumed_journal.get_weights(generation), journal.get_weights(generation))
+                np.testing.assert_equal(resumed_journal.get_accepted_parameters(generation),
+                                        journal.get_accepted_parameters(generation))
+            self.assertFalse(os.path.exists(os.path.join(path, "checkpoint.npz")))
+        finally:
+            shutil.rmtree(path)
+
+    def test_statistics_learning(self):
+        T, n_sample, n_simulate, eps_arr, eps_percentile = 3, 10, 1, np.array([10.]), 50
+        statistics_learning = Semiautomatic([self.model], Identity(degree=2, cross=0), self.backend, n_samples=50,
+                                            seed=1)
+        sampler = PMCABC([self.model], [Euclidean(Identity(degree=2, cross=0))], self.backend, seed = 1)
+        sampler.set_statistics_learning(statistics_learning)
+        self.assertIsInstance(sampler.distance.distances[0].statistics_calc, LinearTransformation)
+        journal = sampler.sample([self.observation], T, eps_arr, n_sample, n_simulate, eps_percentile, full_output=1)
+
+        # the statistics are refitted on the particles of every generation but the last
+        self.assertEqual(statistics_learning._normal_equations.n, 50 + (T - 1) * n_sample)
+        statistics_calc = sampler.distance.distances[0].statistics_calc
+        np.testing.assert_equal(statistics_calc.coefficients, statistics_learning.coefficients_learnt.T)
+        self.assertEqual(len(journal.configuration["epsilon_arr"]), T)
+        self.assertEqual(len(journal.get_accepted_parameters()), n_sample)
+
+        # the statistics learning is not sent to the workers
+        self.assertNotIn("statistics_learning", pickle.loads(pickle.dumps(sampler)).__dict__)
+        self.assertRaises(NotImplementedError, RejectionABC([self.model], [self.dist_calc], self.backend,
+                                                            seed=1).set_statistics_learning, statistics_learning)
+
 
 class SABCTests(unittest.TestCase):
     def setUp(self):
@@ -275,6 +478,22 @@ class SABCTests(unittest.TestCase):
 
         self.assertFalse(journal.number_of_simulations == 0)
 
+    def test_budget(self):
+        # an unreachable threshold only stops because of the per-particle cap, returning the closest draw
+        sampler = SABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        sampler.accepted_parameters_manager.broadcast(self.backend, [self.observation])
+        sampler.epsilon = 1e-10
+        sampler.n_samples_per_param = 1
+        sampler.set_budget(max_simulations_per_particle=5)
+        sampler._start_budget()
+        theta, distance, all_parameters, all_distances, index, acceptance, counter = \
+            sampler._accept_parameter([np.random.RandomState(2), 0])
+        self.assertEqual(counter, 5)
+        self.assertEqual(distance, min(all_distances))
+        self.assertEqual(theta, all_parameters[int(np.argmin(all_distances))])
+        self.assertEqual(acceptance, 1)
+
+
 class ABCsubsimTests(unittest.TestCase):
     def setUp(self):
         # find spark and initialize it
@@ -397,6 +616,46 @@ class SMCABCTests(unittest.TestCase):
 
         self.assertFalse(journal.number_of_simulations == 0)
 
+    def test_checkpoint(self):
+        T, n_sample, n_simulate = 3, 10, 1
+        sampler = SMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+        journal = sampler.sample([self.observation], T, n_sample, n_simulate, full_output=1)
+
+        path = tempfile.mkdtemp()
+        try:
+            sampler = SMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+            sampler.set_checkpoint(path, fsync=False)
+            interrupt_after(sampler, 0)
+            self.assertRaises(Interrupted, sampler.sample, [self.observation], T, n_sample, n_simulate, full_output=1)
+
+            sampler = SMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+            sampler.set_checkpoint(path, fsync=False)
+            resumed_journal = sampler.sample([self.observation], T, n_sample, n_simulate, full_output=1)
+
+            self.assertEqual(resumed_journal.number_of_simulations, journal.number_of_simulations)
+            self.assertEqual(resumed_journal.configuration["epsilon_arr"], journal.configuration["epsilon_arr"])
+            for generation in range(T):
+                np.testing.assert_equal(resumed_journal.get_weights(generation), journal.get_weights(generation))
+                np.testing.assert_equal(resumed_journal.get_accepted_parameters(generation),
+                                        journal.get_accepted_parameters(generation))
+        finally:
+            shutil.rmtree(path)
+
+    def test_statistics_learning(self):
+        T, n_sample, n_simulate = 3, 10, 2
+        statistics_learning = Semiautomatic([self.model], Identity(degree=2, cross=0), self.backend, n_samples=50,
+                                            seed=1)
+        sampler = SMCABC([self.model], [Euclidean(Identity(degree=2, cross=0))], self.backend, seed = 1)
+        sampler.set_statistics_learning(statistics_learning)
+        journal = sampler.sample([self.observation], T, n_sample, n_simulate, full_output=1)
+
+        # every simulated data point of the particles of every generation but the last is used
+        self.assertEqual(statistics_learning._normal_equations.n, 50 + (T - 1) * n_sample * n_simulate)
+        statistics_calc = sampler.distance.distances[0].statistics_calc
+        np.testing.assert_equal(statistics_calc.coefficients, statistics_learning.coefficients_learnt.T)
+        self.assertEqual(len(journal.get_accepted_parameters()), n_sample)
+        self.assertAlmostEqual(np.sum(journal.get_weights()), 1)
+
 class APMCABCTests(unittest.TestCase):
     def setUp(self):
         # find spark and initialize it
@@ -476,7 +735,24 @@ class RSMCABCTests(unittest.TestCase):
         #self.observation = self.model.forward_simulate(1, np.random.RandomState(1))[0].tolist()
         self.observation = [np.array(9.8)]
 
-      
+    def test_budget(self):
+        # an unreachable threshold only stops because of the per-particle cap, returning the closest draw
+        results = []
+        for cap in range(1, 6):
+            sampler = RSMCABC([self.model], [self.dist_calc], self.backend, seed = 1)
+            sampler.accepted_parameters_manager.broadcast(self.backend, [self.observation])
+            sampler.epsilon = [1e-10]
+            sampler.n_samples_per_param = 1
+            sampler.set_budget(max_simulations_per_particle=cap)
+            sampler._start_budget()
+            theta, distance, index_accept, counter = sampler._accept_parameter(np.random.RandomState(1))
+            self.assertEqual(counter, cap)
+            results.append((distance, theta))
+        # the caps see the same draws, and a capped particle keeps the closest one
+        distances = [distance for distance, theta in results]
+        self.assertEqual(distances, list(np.minimum.accumulate(distances)))
+        self.assertEqual(results[-1], min(results, key=lambda result: result[0]))
+
     def test_sample(self):
         # use the RSMCABC scheme for T = 1
         steps, n_sample, n_simulate = 1, 10, 1
@@ -41,6 +41,32 @@ class RandomForestTests(unittest.TestCase):
         model_prob = modelselection.posterior_probability(self.y_obs)
 
         self.assertTrue(model_prob > 0.7)
+
+    def test_shared_classifier(self):
+        modelselection = RandomForest(self.model_array, self.statistics_calc, self.backend, seed = 1)
+        model = modelselection.select_model(self.y_obs, n_samples = 100)
+        classifier = modelselection.classifier
+        model_prob = modelselection.posterior_probability(self.y_obs, n_samples = 100)
+
+        # the reference table is simulated and the classifier fitted once, keeping the statistics only
+        self.assertIs(modelselection.classifier, classifier)
+        self.assertEqual(modelselection.reference_table_statistics.shape, (100, 2))
+        self.assertFalse(hasattr(modelselection, 'reference_table_data'))
+        self.assertTrue(model_prob > 0.7)
+        self.assertEqual(modelselection.reference_table_models.shape, (100,))
+        # a reference table of another size is simulated again
+        modelselection.select_model(self.y_obs, n_samples = 50)
+        self.assertIsNot(modelselection.classifier, classifier)
+        self.assertEqual(modelselection.reference_table_statistics.shape, (50, 2))
+
+    def test_n_jobs(self):
+        modelselection = RandomForest(self.model_array, self.statistics_calc, self.backend, seed = 1)
+        parallel = RandomForest(self.model_array, self.statistics_calc, self.backend, seed = 1, n_jobs = 2)
+
+        # the trees fitted in parallel are the same
+        self.assertEqual(parallel.posterior_probability(self.y_obs, n_samples = 100),
+                         modelselection.posterior_probability(self.y_obs, n_samples = 100))
+        self.assertEqual(parallel.classifier.n_jobs, 2)
  
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,3 +1,5 @@
+import shutil
+import tempfile
 import unittest
 import numpy as np
 
@@ -79,6 +81,102 @@ class JournalTests(unittest.TestCase):
         new_journal = Journal.fromFile('journal_tests_testfile.pkl')
         #np.testing.assert_equal(journal.parameters, new_journal.parameters)
         np.testing.assert_equal(journal.weights, new_journal.weights)
+
+    def test_posterior_summaries(self):
+        rng = np.random.RandomState(1)
+        mu, sigma = rng.normal(size=(5, 2)), rng.uniform(size=5)
+        weights = rng.uniform(size=(5, 1))
+        journal = Journal(1)
+        journal.add_user_parameters([("mu", [[mu[i]] for i in range(5)]), ("sigma", [[np.array([sigma[i]])] for i in range(5)])])
+        journal.add_weights(weights)
+
+        np.testing.assert_equal(journal.parameter_arrays[0], np.column_stack((mu, sigma)))
+        self.assertEqual(journal.parameter_columns, {"mu": (0, 2), "sigma": (2, 3)})
+
+        mean = journal.posterior_mean()
+        np.testing.assert_allclose(mean["mu"], np.average(mu, weights=weights[:, 0], axis=0))
+        self.assertAlmostEqual(mean["sigma"], np.average(sigma, weights=weights[:, 0]))
+        cov, names = journal.posterior_cov()
+        np.testing.assert_allclose(cov, np.cov(np.column_stack((mu, sigma)).T, aweights=weights[:, 0]))
+        self.assertEqual(list(names), ["mu", "sigma"])
+        H, edges = journal.posterior_histogram(n_bins=2)
+        self.assertEqual(H.shape, (2, 2, 2))
+        self.assertAlmostEqual(H.sum(), weights.sum())
+
+        # the summaries are memoized, and copies are returned
+        mean["sigma"] = 0
+        self.assertNotEqual(journal.posterior_mean(0)["sigma"], 0)
+        journal.add_user_parameters([("mu", [[mu[i]] for i in range(5)]), ("sigma", [[np.array([1.])]] * 5)])
+        journal.add_weights(weights)
+        self.assertEqual(journal.posterior_mean()["sigma"], 1.)
+
+        # journals without parameter matrices compute the summaries from the dictionaries
+        journal.parameter_arrays = [None, None]
+        journal._summaries.clear()
+        np.testing.assert_allclose(journal.posterior_mean(0)["mu"], np.average(mu, weights=weights[:, 0], axis=0))
+
+    def test_columnar_load_and_save(self):
+        journal = Journal(1)
+        for generation in range(3):
+            accepted_parameters = [[np.array([generation, i]), float(i)] for i in range(4)]
+            journal.add_accepted_parameters(accepted_parameters)
+            journal.add_user_parameters([("mu", [np.array([generation])] * 4), ("sigma", [[1.0], [2.0], [3.0], [4.0]])])
+            journal.add_weights(np.arange(4.).reshape(4, 1) + generation)
+            journal.add_distances(np.ones(4) * generation)
+        journal.configuration["epsilon"] = [1., 2.]
+        journal.number_of_simulations.append(12)
+
+        path = tempfile.mkdtemp()
+        try:
+            journal.save_columnar(path)
+            new_journal = Journal.fromFile(path)
+
+            self.assertEqual(len(new_journal.weights), 3)
+            self.assertEqual(new_journal.configuration, journal.configuration)
+            self.assertEqual(new_journal.number_of_simulations, [12])
+            for generation in range(3):
+                np.testing.assert_equal(new_journal.get_weights(generation), journal.get_weights(generation))
+                np.testing.assert_equal(new_journal.get_distances(generation), journal.get_distances(generation))
+                np.testing.assert_equal(new_journal.get_accepted_parameters(generation),
+                                        journal.get_accepted_parameters(generation))
+                np.testing.assert_equal(new_journal.posterior_mean(generation), journal.posterior_mean(generation))
+            self.assertIsInstance(new_journal.get_weights(), np.memmap)
+
+            # generations added after opening the journal are kept in memory
+            new_journal.add_weights(np.ones((4, 1)))
+            np.testing.assert_equal(new_journal.get_weights(), np.ones((4, 1)))
+            self.assertEqual(len(new_journal.weights[1:]), 3)
+        finally:
+            shutil.rmtree(path)
+
+    def test_stream_to(self):
+        path = tempfile.mkdtemp()
+        try:
+            journal = Journal(1)
+            journal.add_weights(np.zeros((2, 1)))
+            journal.stream_to(path, fsync=False)
+            weights = np.ones((2, 1))
+            journal.add_weights(weights)
+            weights[0] = 2
+            journal.number_of_simulations.append(10)
+            journal.flush()
+
+            # the generations are only stored on disk
+            self.assertEqual(journal.weights.appended, [])
+            stored_journal = Journal.fromFile(path)
+            self.assertEqual(len(stored_journal.weights), 2)
+            np.testing.assert_equal(stored_journal.get_weights(), np.ones((2, 1)))
+            self.assertEqual(stored_journal.number_of_simulations, [10])
+
+            # only the last generation is kept with type 0
+            journal = Journal(0)
+            journal.stream_to(path, fsync=False)
+            journal.add_weights(np.zeros((2, 1)))
+            journal.add_weights(np.ones((2, 1)))
+            self.assertEqual(len(Journal.fromFile(path).weights), 1)
+            np.testing.assert_equal(Journal.fromFile(path).get_weights(), np.ones((2, 1)))
+        finally:
+            shutil.rmtree(path)
         
 
 
@@ -98,6 +98,31 @@ class PdfTests(unittest.TestCase):
         pdf = kernel.pdf(mapping, Manager, Manager.accepted_parameters_bds.value()[1], [2,0.3,0.1])
         self.assertTrue(isinstance(pdf, float))
 
+    def test_population_pdf(self):
+        B1 = Binomial([10, 0.2])
+        N1 = Normal([0.1, 0.01])
+        N2 = Normal([0.3, N1])
+        graph = Normal([B1, N2])
+
+        Manager = AcceptedParametersManager([graph])
+        backend = Backend()
+        x = [2, 0.3, 0.1]
+        covs = [[[1, 0.2], [0.2, 0.5]], []]
+        for kernel in [DefaultKernel([N1, N2, B1]),
+                       JointPerturbationKernel([MultivariateStudentTKernel([N1, N2], df=3), RandomWalkKernel([B1])])]:
+            Manager.update_broadcast(backend, [[2, 0.4, 0.09], [3, 0.2, 0.008], [1, 0.1, 0.05]],
+                                     np.array([0.5, 0.2, 0.3]), accepted_cov_mats=covs)
+            kernel_parameters = []
+            for krnl in kernel.kernels:
+                kernel_parameters.append(Manager.get_accepted_parameters_bds_values(krnl.models))
+            Manager.update_kernel_values(backend, kernel_parameters)
+            mapping, mapping_index = Manager.get_mapping(Manager.model)
+
+            pdfs = kernel.population_pdf(mapping, Manager, x)
+            expected = [kernel.pdf(mapping, Manager, mean, x) for mean in Manager.accepted_parameters_bds.value()]
+            self.assertEqual(pdfs.shape, (3,))
+            self.assertTrue(np.allclose(pdfs, expected))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,145 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from abcpy.backends import BackendDummy
+from abcpy.continuousmodels import Normal, Uniform
+from abcpy.distances import Euclidean
+from abcpy.inferences import RejectionABC
+from abcpy.modelselections import RandomForest
+from abcpy.referencetable import ReferenceTable, reference_table_fingerprint
+from abcpy.statistics import Identity, NeuralEmbedding
+from abcpy.statisticslearning import Semiautomatic
+
+try:
+    import torch
+except ImportError:
+    has_torch = False
+else:
+    has_torch = True
+    from abcpy.NN_utilities.networks import createDefaultNN
+
+
+class ReferenceTableTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_append_and_read(self):
+        table = ReferenceTable(os.path.join(self.path, "table"))
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.parameters)
+
+        table.append(parameters=np.arange(6).reshape(3, 2), statistics=np.ones((3, 1, 4)))
+        table.append(parameters=[[6, 7]], statistics=np.zeros((1, 1, 4)))
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.statistics.shape, (4, 1, 4))
+        self.assertTrue(np.array_equal(table.read('parameters', 2), [[0, 1], [2, 3]]))
+        self.assertIsNone(table.data)
+
+        # the table persists and is readable from another process
+        reopened = pickle.loads(pickle.dumps(ReferenceTable(table.path)))
+        self.assertTrue(np.array_equal(reopened.parameters, np.arange(8).reshape(4, 2)))
+
+        self.assertRaises(ValueError, table.append, parameters=[[1, 2]])
+        self.assertRaises(ValueError, table.append, parameters=[[1, 2, 3]], statistics=np.zeros((1, 1, 4)))
+        self.assertRaises(ValueError, table.append, parameters=[[1, 2]], statistics=np.zeros((2, 1, 4)))
+
+    def test_fingerprint(self):
+        mu = Uniform([[-5.0], [5.0]], name='mu')
+        model = Normal([mu, 1], name='y')
+        other_model = Normal([Uniform([[-5.0], [6.0]], name='mu'), 1], name='y')
+        fingerprint = reference_table_fingerprint([model], Identity(degree=2), 1)
+
+        self.assertEqual(fingerprint, reference_table_fingerprint([model], Identity(degree=2), 1))
+        self.assertNotEqual(fingerprint, reference_table_fingerprint([other_model], Identity(degree=2), 1))
+        self.assertNotEqual(fingerprint, reference_table_fingerprint([model], Identity(degree=1), 1))
+        self.assertNotEqual(fingerprint, reference_table_fingerprint([model], Identity(degree=2), 2))
+
+        table = ReferenceTable(self.path)
+        table.check_fingerprint(fingerprint)
+        self.assertEqual(ReferenceTable(self.path).fingerprint, fingerprint)
+        self.assertRaises(ValueError, table.check_fingerprint, reference_table_fingerprint([other_model]))
+
+    def test_fingerprint_neural_embedding(self):
+        if not has_torch:
+            return
+        model = Normal([Uniform([[0], [1]], name='mu'), 1], name='y')
+        statistics_calc = NeuralEmbedding(createDefaultNN(1, 2)())
+        fingerprint = reference_table_fingerprint([model], statistics_calc, 1)
+        # evaluating the embedding fills its private buffer, which does not change the fingerprint
+        statistics_calc.statistics([np.array([0.5])])
+        self.assertEqual(fingerprint, reference_table_fingerprint([model], statistics_calc, 1))
+
+
+class ReferenceTableReuseTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.backend = BackendDummy()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_rejection_abc(self):
+        mu = Uniform([[-5.0], [5.0]], name='mu')
+        sigma = Uniform([[0.0], [10.0]], name='sigma')
+        model = Normal([mu, sigma])
+        y_obs = [np.array(9.8)]
+        table = ReferenceTable(self.path)
+
+        sampler = RejectionABC([model], [Euclidean(Identity(degree=2, cross=0))], self.backend, seed=1)
+        journal = sampler.sample([y_obs], 10, 1, 10, reference_table=table)
+        self.assertEqual(len(journal.get_accepted_parameters()), 10)
+        self.assertTrue(np.all(journal.get_distances() <= 10))
+        self.assertEqual(len(table), sampler.simulation_counter)
+        self.assertEqual(table.data.shape, (len(table), 1, 1, 1))
+
+        # a second run only reuses the simulations of the table
+        n_rows = len(table)
+        sampler = RejectionABC([model], [Euclidean(Identity(degree=2, cross=0))], self.backend, seed=2)
+        journal_reused = sampler.sample([y_obs], 10, 1, 10, reference_table=table)
+        self.assertEqual(sampler.simulation_counter, 0)
+        self.assertEqual(len(table), n_rows)
+        self.assertTrue(np.allclose(journal_reused.get_distances(), journal.get_distances()))
+
+        sampler = RejectionABC([model], [Euclidean(Identity(degree=2, cross=0))], self.backend, seed=1)
+        self.assertRaises(ValueError, sampler.sample, [y_obs], 10, 2, 10, reference_table=table)
+
+    def test_statistics_learning(self):
+        sigma = Uniform([[10], [20]])
+        mu = Normal([0, 1])
+        Y = Normal([mu, sigma])
+        statistics_calc = Identity(degree=3, cross=False)
+        table = ReferenceTable(self.path)
+
+        learning = Semiautomatic([Y], statistics_calc, self.backend, n_samples=50, seed=1, reference_table=table)
+        self.assertEqual(len(table), 50)
+        extended = Semiautomatic([Y], statistics_calc, self.backend, n_samples=80, seed=2, reference_table=table)
+        self.assertEqual(len(table), 80)
+        self.assertTrue(np.array_equal(extended.sample_statistics[:50], learning.sample_statistics))
+        self.assertEqual(extended.sample_parameters.shape, (80, 2))
+
+    def test_random_forest(self):
+        model_array = [Normal([Uniform([[150], [200]], name='mu1'), Uniform([[5.0], [25.0]], name='sigma1')]),
+                       Normal([Uniform([[150], [200]], name='mu2'), Uniform([[1], [30.0]], name='sigma2')])]
+        statistics_calc = Identity(degree=2, cross=False)
+        table = ReferenceTable(self.path)
+
+        modelselection = RandomForest(model_array, statistics_calc, self.backend, seed=1, reference_table=table)
+        modelselection.select_model([160.82499176], n_samples=50)
+        reused = RandomForest(model_array, statistics_calc, self.backend, seed=2, reference_table=table)
+        reused.select_model([160.82499176], n_samples=50)
+
+        self.assertEqual(len(table), 50)
+        self.assertTrue(np.array_equal(reused.reference_table_statistics, modelselection.reference_table_statistics))
+        self.assertEqual(list(reused.reference_table_models), list(table.models))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
+import copy
+import cloudpickle
+import pickle
 import unittest
 import numpy as np
+from abcpy import utils
 from abcpy.statistics import Identity, LinearTransformation, NeuralEmbedding
 
 try:
@@ -41,6 +45,41 @@ class IdentityTests(unittest.TestCase):
         self.stat_calc = Identity(degree=2, cross=1)
         self.assertTrue((self.stat_calc.statistics(a) == np.array([[2, 4]])).all())
 
+    def test_polynomial_expansion_layout(self):
+        # compare with the powers followed by the cross products of the columns in lexicographic order
+        statistics = np.random.RandomState(1).normal(size=(10, 4))
+        self.stat_calc = Identity(degree=3, cross=True)
+        expected = np.column_stack([statistics, statistics ** 2, statistics ** 3] +
+                                   [statistics[:, i] * statistics[:, j] for i in range(4) for j in range(i + 1, 4)])
+        self.assertEqual(self.stat_calc._polynomial_expansion(statistics).shape, (10, 18))
+        self.assertTrue(np.allclose(self.stat_calc._polynomial_expansion(statistics), expected))
+        # the layout of the cross products is cached per dimension
+        self.assertTrue(np.allclose(self.stat_calc._polynomial_expansion(statistics), expected))
+        self.stat_calc = Identity(degree=1, cross=True)
+        self.assertTrue(np.allclose(self.stat_calc._polynomial_expansion(statistics[:, :2]),
+                                    np.column_stack([statistics[:, :2], statistics[:, 0] * statistics[:, 1]])))
+
+    def test_statistics_batch(self):
+        # arrays are used without conversion
+        data = np.random.RandomState(1).normal(size=(5, 3))
+        self.assertTrue(self.stat_calc.statistics(data) is data)
+        self.assertTrue((self.stat_calc.statistics(data[:, 0]) == data[:, :1]).all())
+
+        self.stat_calc = Identity(degree=2, cross=True)
+        datasets = [[np.array([1, 2]), np.array([0, 3])], [np.array([2, 2]), np.array([1, 1])],
+                    [np.array([0, 1]), np.array([4, 2])]]
+        expected = np.stack([self.stat_calc.statistics(dataset) for dataset in datasets])
+        self.assertEqual(expected.shape, (3, 2, 5))
+        self.assertTrue((self.stat_calc.statistics_batch(datasets) == expected).all())
+        self.assertTrue((self.stat_calc.statistics_batch(np.array(datasets)) == expected).all())
+        # pipeline of statistics
+        self.stat_calc = Identity(degree=2, previous_statistics=Identity(cross=True))
+        expected = np.stack([self.stat_calc.statistics(dataset) for dataset in datasets])
+        self.assertTrue((self.stat_calc.statistics_batch(datasets) == expected).all())
+        # data sets of scalars
+        self.assertEqual(self.stat_calc.statistics_batch([[1, 2, 3], [4, 5, 6]]).shape, (2, 3, 2))
+        self.assertRaises(TypeError, self.stat_calc.statistics_batch, 3.4)
+
 
 class LinearTransformationTests(unittest.TestCase):
     def setUp(self):
@@ -56,6 +95,13 @@ class LinearTransformationTests(unittest.TestCase):
             [np.dot(np.array([1, 2]), self.coeff), np.dot(np.array([1, 2]), self.coeff)])).all())
         self.assertRaises(ValueError, self.stat_calc.statistics, [vec2])
 
+    def test_statistics_batch(self):
+        self.stat_calc = LinearTransformation(self.coeff, degree=2, cross=1)
+        datasets = np.random.RandomState(1).normal(size=(4, 3, 2))
+        expected = np.stack([self.stat_calc.statistics(list(dataset)) for dataset in datasets])
+        self.assertTrue(np.allclose(self.stat_calc.statistics_batch(datasets), expected))
+        self.assertRaises(ValueError, self.stat_calc.statistics_batch, datasets[:, :, :1])
+
     def test_polynomial_expansion(self):
         # Checks whether wrong input type produces error message
         self.assertRaises(TypeError, self.stat_calc._polynomial_expansion, 3.4)
@@ -94,6 +140,67 @@ class NeuralEmbeddingTests(unittest.TestCase):
             self.assertTrue((self.stat_calc.statistics([vec1, vec1])).all())
             self.assertRaises(RuntimeError, self.stat_calc.statistics, [vec2])
 
+    def test_statistics_batch(self):
+        if has_torch:
+            self.stat_calc = NeuralEmbedding(self.net)
+            datasets = np.random.RandomState(1).normal(size=(4, 3, 2))
+            expected = np.stack([self.stat_calc.statistics(list(dataset)) for dataset in datasets])
+            self.assertEqual(self.stat_calc.statistics_batch(datasets).shape, (4, 3, 3))
+            self.assertTrue(np.allclose(self.stat_calc.statistics_batch(datasets), expected, atol=1e-6))
+
+    def test_chunks(self):
+        if has_torch:
+            data = np.random.RandomState(1).normal(size=(25, 2))
+            expected = self.net(torch.from_numpy(data.astype("float32"))).detach().numpy()
+            self.stat_calc = NeuralEmbedding(self.net, chunk_size=10)
+            self.assertTrue(np.allclose(self.stat_calc.statistics(list(data)), expected, atol=1e-6))
+            # the input buffer is reused for smaller data sets
+            self.assertTrue(np.allclose(self.stat_calc.statistics(list(data[:3])), expected[:3], atol=1e-6))
+            self.assertEqual(self.stat_calc._input_buffer.shape, (10, 2))
+            self.assertEqual(self.stat_calc.statistics(data[:0]).shape, (0, 3))
+
+    def test_pickle(self):
+        if has_torch:
+            data = list(np.random.RandomState(1).normal(size=(5, 2)))
+            self.stat_calc = NeuralEmbedding(self.net)
+            pickled = pickle.dumps(self.stat_calc)
+            first, second = pickle.loads(pickled), pickle.loads(pickled)
+            self.assertTrue(np.allclose(first.statistics(data), self.stat_calc.statistics(data), atol=1e-6))
+            # copies made outside of the workers of a backend have their own network
+            self.assertIsNot(first.net, second.net)
+            self.assertIsNot(copy.deepcopy(self.stat_calc).net, copy.deepcopy(self.stat_calc).net)
+            # the network is loaded once by a worker, and shared by the unpickled objects
+            configuration = dict(utils._process_configuration)
+            try:
+                utils.configure_process(worker=True)
+                first, second = pickle.loads(pickled), pickle.loads(pickled)
+            finally:
+                utils._process_configuration.update(configuration)
+            self.assertIs(first.net, second.net)
+            self.assertIsNot(first.net, self.net)
+
+    def test_unpickle_previous_format(self):
+        if has_torch:
+            data = list(np.random.RandomState(1).normal(size=(5, 2)))
+            expected = NeuralEmbedding(self.net).statistics(data)
+            # previous versions pickled the attributes of the object as they were, including the network
+            pickled = cloudpickle.dumps(_PreviousNeuralEmbedding({'net': self.net, 'previous_statistics': None}))
+            stat_calc = pickle.loads(pickled)
+            self.assertIsInstance(stat_calc, NeuralEmbedding)
+            self.assertIsInstance(stat_calc.net, torch.nn.Module)
+            self.assertEqual(stat_calc.chunk_size, 4096)
+            self.assertTrue(np.allclose(stat_calc.statistics(data), expected, atol=1e-6))
+
+
+class _PreviousNeuralEmbedding(object):
+    """Pickles like a NeuralEmbedding of the previous versions, with the given attributes."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def __reduce__(self):
+        return object.__new__, (NeuralEmbedding,), self.state
+
 
 if __name__ == '__main__':
     unittest.main()
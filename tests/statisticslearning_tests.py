@@ -1,5 +1,8 @@
+import copy
+import pickle
 import unittest
 import numpy as np
+from sklearn.linear_model import LinearRegression
 from abcpy.continuousmodels import Uniform
 from abcpy.continuousmodels import Normal
 from abcpy.statistics import Identity
@@ -15,12 +18,24 @@ else:
     has_torch = True
 
 
+class _RecordingBackend(Backend):
+    """Dummy backend recording the mapped functions."""
+
+    def __init__(self):
+        super(_RecordingBackend, self).__init__()
+        self.mapped = []
+
+    def map(self, func, pds):
+        self.mapped.append(func)
+        return super(_RecordingBackend, self).map(func, pds)
+
+
 class SemiautomaticTests(unittest.TestCase):
     def setUp(self):
         # define prior and model
         sigma = Uniform([[10], [20]])
         mu = Normal([0, 1])
-        Y = Normal([mu, sigma])
+        self.Y = Normal([mu, sigma])
 
         # define backend
         self.backend = Backend()
@@ -29,7 +44,7 @@ class SemiautomaticTests(unittest.TestCase):
         self.statistics_cal = Identity(degree=3, cross=False)
 
         # Initialize statistics learning
-        self.statisticslearning = Semiautomatic([Y], self.statistics_cal, self.backend, n_samples=1000,
+        self.statisticslearning = Semiautomatic([self.Y], self.statistics_cal, self.backend, n_samples=1000,
                                                 n_samples_per_param=1, seed=1)
 
     def test_transformation(self):
@@ -46,6 +61,49 @@ class SemiautomaticTests(unittest.TestCase):
         # self.assertLess(extracted_statistics[0,0] - 0.00215507052338, 10e-2)
         # self.assertLess(extracted_statistics[0,1] - (-0.0058023274456), 10e-2)
 
+    def test_normal_equations(self):
+        # the coefficients are the ones of the least squares regression on all the samples
+        regression = LinearRegression().fit(self.statisticslearning.sample_statistics,
+                                            self.statisticslearning.sample_parameters)
+        self.assertTrue(np.allclose(self.statisticslearning.coefficients_learnt, regression.coef_))
+
+        # the simulations are generated by chunks, whose normal equations are merged
+        statisticslearning = Semiautomatic([self.Y], self.statistics_cal, self.backend, n_samples=1000,
+                                           n_samples_per_param=1, seed=1, chunk_size=300)
+        self.assertFalse(hasattr(statisticslearning, "sample_statistics"))
+        self.assertEqual(statisticslearning._normal_equations.n, 1000)
+        self.assertTrue(np.allclose(statisticslearning.coefficients_learnt, regression.coef_))
+
+    def test_mapped_tasks(self):
+        # the simulations are mapped to a simulator carrying the model and the statistics calculator only
+        backend = _RecordingBackend()
+        statisticslearning = Semiautomatic([self.Y], self.statistics_cal, backend, n_samples=100, seed=1)
+        Semiautomatic([self.Y], self.statistics_cal, backend, n_samples=100, seed=1, chunk_size=30)
+        self.assertEqual(len(backend.mapped), 2)
+        for func in backend.mapped:
+            state = vars(pickle.loads(pickle.dumps(func.__self__)))
+            self.assertEqual(sorted(state), ['model', 'n_samples_per_param', 'statistics_calc'])
+
+        # the learned state is kept by the copies of the statistics learning object
+        copied = pickle.loads(pickle.dumps(statisticslearning))
+        self.assertTrue(np.array_equal(copied.sample_statistics, statisticslearning.sample_statistics))
+        copied.refit([[np.array([1.]), np.array([15.])]], [[np.array([1.])]])
+        self.assertEqual(copied._normal_equations.n, 101)
+
+    def test_refit(self):
+        sample_statistics = self.statisticslearning.sample_statistics
+        sample_parameters = self.statisticslearning.sample_parameters
+        parameters = [[np.array([1.]), np.array([15.])], [np.array([2.]), np.array([12.])]]
+        simulations = [[np.array([1.]), np.array([3.])], [np.array([-2.]), np.array([0.5])]]
+        self.statisticslearning.refit(parameters, simulations)
+        # every simulated data point is added with its parameter
+        self.assertEqual(self.statisticslearning._normal_equations.n, 1004)
+        sample_statistics = np.concatenate((sample_statistics,
+                                            [[1, 1, 1], [3, 9, 27], [-2, 4, -8], [0.5, 0.25, 0.125]]))
+        sample_parameters = np.concatenate((sample_parameters, [[1, 15], [1, 15], [2, 12], [2, 12]]))
+        regression = LinearRegression().fit(sample_statistics, sample_parameters)
+        self.assertTrue(np.allclose(self.statisticslearning.coefficients_learnt, regression.coef_))
+
 
 class SemiautomaticNNTests(unittest.TestCase):
     def setUp(self):
@@ -82,6 +140,43 @@ class SemiautomaticNNTests(unittest.TestCase):
 
             self.assertRaises(RuntimeError, self.new_statistics_calculator.statistics, [np.array([1, 2])])
 
+    def test_refit(self):
+        if has_torch:
+            net = self.statisticslearning.embedding_net
+            weights = [parameter.detach().clone() for parameter in net.parameters()]
+            parameters = [[np.array([1.]), np.array([15.])], [np.array([2.]), np.array([12.])]]
+            simulations = [[np.array([1.])], [np.array([-2.])]]
+            self.statisticslearning.refit(parameters, simulations, n_epochs=1)
+            self.assertEqual(self.statisticslearning.sample_parameters.shape, (102, 2))
+            # the network is trained again starting from its current weights
+            self.assertIs(self.statisticslearning.embedding_net, net)
+            self.assertTrue(any(not torch.equal(weight, parameter) for weight, parameter in zip(weights,
+                                                                                                  net.parameters())))
+
+    def test_copy(self):
+        if has_torch:
+            # the copies keep the trained network
+            copied = copy.deepcopy(self.statisticslearning)
+            self.assertIsNot(copied.embedding_net, self.statisticslearning.embedding_net)
+            data = [np.array([1.]), np.array([3.])]
+            self.assertTrue(np.allclose(copied.get_statistics().statistics(data),
+                                        self.statisticslearning.get_statistics().statistics(data)))
+
+    def test_pipelined_simulations(self):
+        if has_torch:
+            statisticslearning = SemiautomaticNN([self.Y], self.statistics_cal, self.backend, n_samples=100,
+                                                 n_samples_per_param=1, seed=1, n_epochs=2, simulation_batch_size=25)
+            self.assertEqual(statisticslearning.sample_parameters.shape, (100, 2))
+            self.assertEqual(statisticslearning.sample_statistics.shape, (100, 3))
+            # the simulations stop when the validation loss does not improve
+            statisticslearning = SemiautomaticNN([self.Y], self.statistics_cal, self.backend, n_samples=100,
+                                                 n_samples_per_param=1, seed=1, n_epochs=2, simulation_batch_size=10,
+                                                 plateau_patience=1, plateau_tolerance=np.inf)
+            self.assertEqual(statisticslearning.sample_parameters.shape, (20, 2))
+            self.assertEqual(np.shape(statisticslearning.get_statistics().statistics([np.array([1.])])), (1, 2))
+            self.assertRaises(RuntimeError, SemiautomaticNN, [self.Y], self.statistics_cal, self.backend,
+                              n_samples=100, simulation_batch_size=10, reference_table=object())
+
 
 class ContrastiveDistanceLearningTests(unittest.TestCase):
     def setUp(self):
@@ -156,6 +251,14 @@ class TripletDistanceLearningTests(unittest.TestCase):
 
             self.assertRaises(RuntimeError, self.new_statistics_calculator.statistics, [np.array([1, 2])])
 
+    def test_pipelined_simulations(self):
+        if has_torch:
+            statisticslearning = TripletDistanceLearning([self.Y], self.statistics_cal, self.backend, n_samples=100,
+                                                         n_samples_per_param=1, seed=1, n_epochs=2,
+                                                         simulation_batch_size=50, plateau_patience=2)
+            self.assertEqual(statisticslearning.sample_parameters.shape, (100, 2))
+            self.assertEqual(np.shape(statisticslearning.get_statistics().statistics([np.array([1.])])), (1, 2))
+
 
 if __name__ == '__main__':
     unittest.main()